@@ -1,16 +1,37 @@
 """
 Admin panel routes and functionality
 """
-from flask import Blueprint, request, jsonify
-from .models import db, User, APIKey, AuditLog, CasinoConfig, generate_api_key
+import os
+from flask import Blueprint, Response, request, jsonify
+from .models import db, User, Transaction, APIKey, AuditLog, CasinoConfig, generate_api_key
 from .auth import admin_required, get_current_user, hash_password
-from .transactions import get_all_transactions, adjust_account_balance
+from .transactions import (
+    get_all_transactions, adjust_account_balance, get_account_stats,
+    bulk_payout, credit_faction, serialize_transactions, SYSTEM_ACCOUNT
+)
+from .search import search_user_accounts
+from .factions import list_factions, get_faction, get_or_create_faction
+from .analytics import get_casino_stats, flush_rollups, get_player_stats, PERIODS
+from .exports import (
+    parse_export_filters, describe_filters, csv_response,
+    iter_user_rows, iter_transaction_rows, iter_audit_rows,
+    USER_EXPORT_HEADER, TRANSACTION_EXPORT_HEADER, AUDIT_EXPORT_HEADER
+)
+from .http_cache import make_etag, conditional_response, table_watermark
+from .txcache import recent_transactions_cache
+from .admission import admission, priority, CRITICAL, LOW
+from .sqlprofile import profiler
+from .profiler import (
+    sample_stacks, collapse, take_heap_snapshot, stop_heap_tracing,
+    PROFILE_MAX_SECONDS, PROFILE_DEFAULT_INTERVAL, HEAP_TOP_STATS
+)
 from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 
 @admin_bp.route('/users/search', methods=['GET'])
+@priority(LOW)
 @admin_required
 def search_users():
     """Search for users by character name or account number"""
@@ -19,12 +40,7 @@ def search_users():
     if not query:
         return jsonify({'error': 'Search query required'}), 400
     
-    users = User.query.filter(
-        db.or_(
-            User.character_name.ilike(f'%{query}%'),
-            User.account_number.ilike(f'%{query}%')
-        )
-    ).limit(20).all()
+    users = search_user_accounts(query, limit=20)
     
     return jsonify({'users': [user.to_dict() for user in users]})
 
@@ -38,10 +54,14 @@ def get_user_details(account_number):
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
+    stats = get_account_stats(user)
+    
     return jsonify({
         'user': user.to_dict(),
-        'total_sent': user.sent_transactions.count(),
-        'total_received': user.received_transactions.count()
+        'total_sent': stats.sent_count,
+        'total_received': stats.received_count,
+        'stats': stats.to_dict(),
+        'casino': [game.to_dict() for game in get_player_stats(user.id)]
     })
 
 
@@ -148,20 +168,24 @@ def list_all_transactions():
     limit = int(request.args.get('limit', 100))
     offset = int(request.args.get('offset', 0))
     
-    transactions = get_all_transactions(limit=limit, offset=offset)
+    def build():
+        transactions = get_all_transactions(limit=limit, offset=offset)
+        return jsonify({
+            'transactions': serialize_transactions(transactions),
+            'limit': limit,
+            'offset': offset
+        })
     
-    return jsonify({
-        'transactions': [t.to_dict() for t in transactions],
-        'limit': limit,
-        'offset': offset
-    })
+    # The ledger is append-only, so its newest id versions every page
+    etag = make_etag('ledger', table_watermark(Transaction.id), limit, offset)
+    return conditional_response(etag, build)
 
 
 @admin_bp.route('/api-keys', methods=['GET'])
 @admin_required
 def list_api_keys():
     """List all API keys"""
-    keys = APIKey.query.all()
+    keys = APIKey.query.options(db.joinedload(APIKey.created_by)).all()
     return jsonify({'api_keys': [key.to_dict() for key in keys]})
 
 
@@ -269,6 +293,30 @@ def update_casino_config(game_name):
     })
 
 
+@admin_bp.route('/casino/stats', methods=['GET'])
+@priority(LOW)
+@admin_required
+def get_casino_stats_dashboard():
+    """Get hourly or daily casino performance from the rollup tables"""
+    period = request.args.get('period', 'hour')
+    if period not in PERIODS:
+        return jsonify({'error': f"Period must be one of: {', '.join(PERIODS)}"}), 400
+    
+    filters, error = parse_export_filters(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    # Make this worker's most recent spins visible immediately
+    flush_rollups(force=True)
+    
+    return jsonify(get_casino_stats(
+        period=period,
+        game_name=request.args.get('game'),
+        since=filters['since'],
+        until=filters['until']
+    ))
+
+
 @admin_bp.route('/audit-logs', methods=['GET'])
 @admin_required
 def get_audit_logs():
@@ -276,36 +324,26 @@ def get_audit_logs():
     limit = int(request.args.get('limit', 50))
     offset = int(request.args.get('offset', 0))
     
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).limit(limit).offset(offset).all()
+    def build():
+        logs = (AuditLog.query
+                .options(db.joinedload(AuditLog.admin), db.joinedload(AuditLog.target))
+                .order_by(AuditLog.timestamp.desc())
+                .limit(limit).offset(offset).all())
+        return jsonify({
+            'logs': [log.to_dict() for log in logs],
+            'limit': limit,
+            'offset': offset
+        })
     
-    return jsonify({
-        'logs': [log.to_dict() for log in logs],
-        'limit': limit,
-        'offset': offset
-    })
+    etag = make_etag('audit', table_watermark(AuditLog.id), limit, offset)
+    return conditional_response(etag, build)
 
 
 @admin_bp.route('/factions/list', methods=['GET'])
 @admin_required
 def get_factions():
     """Get list of all factions with user counts"""
-    from sqlalchemy import func
-    
-    factions = db.session.query(
-        User.faction,
-        func.count(User.id).label('user_count'),
-        func.sum(User.balance).label('total_balance')
-    ).group_by(User.faction).all()
-    
-    faction_list = []
-    for faction, count, total_bal in factions:
-        faction_list.append({
-            'faction': faction if faction else 'None',
-            'user_count': count,
-            'total_balance': round(total_bal, 2) if total_bal else 0
-        })
-    
-    return jsonify({'factions': faction_list})
+    return jsonify({'factions': [faction.to_dict() for faction in list_factions()]})
 
 
 @admin_bp.route('/factions/create', methods=['POST'])
@@ -322,16 +360,10 @@ def create_faction():
     if len(name) > 50:
         return jsonify({'error': 'Faction name must be 50 characters or less'}), 400
     
-    # Check if faction name already exists (case-insensitive)
-    # Get all distinct faction names from users
-    existing_factions = db.session.query(User.faction).filter(
-        User.faction.isnot(None)
-    ).distinct().all()
-    
-    existing_faction_names = [f[0].lower() for f in existing_factions if f[0]]
-    
-    if name.lower() in existing_faction_names:
-        return jsonify({'error': f'Faction "{name}" already exists'}), 400
+    # Check if faction name already exists (case-insensitive, unique index)
+    faction, created = get_or_create_faction(name, description or None)
+    if not created:
+        return jsonify({'error': f'Faction "{faction.name}" already exists'}), 400
     
     # Create audit log for new faction creation
     admin = get_current_user()
@@ -346,112 +378,269 @@ def create_faction():
     return jsonify({
         'message': f'Faction "{name}" created successfully',
         'faction': {
+            'id': faction.id,
             'name': name,
             'description': description
         }
     })
 
 
+def _resolve_faction(name):
+    """
+    Resolve a faction name from the URL ('None' means users without a faction).
+    
+    Returns:
+        (faction, label, error) tuple - faction is None for the 'None' group
+    """
+    if name.lower() == 'none':
+        return None, 'None', None
+    faction = get_faction(name)
+    if not faction:
+        return None, name, 'Faction not found'
+    return faction, faction.name, None
+
+
 @admin_bp.route('/factions/<faction>/add-credits', methods=['POST'])
 @admin_required
 def add_faction_credits(faction):
     """Add credits to all users in a faction"""
     data = request.get_json()
     amount = data.get('amount')
-    reason = data.get('reason', 'Faction bonus')
+    reason = data.get('reason') or 'Faction bonus'
     
-    if not amount or amount <= 0:
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
         return jsonify({'error': 'Valid amount required'}), 400
     
-    # Handle 'None' faction
-    if faction.lower() == 'none':
-        faction = None
-    
-    # Get all users in faction
-    users = User.query.filter_by(faction=faction).all()
+    if amount <= 0:
+        return jsonify({'error': 'Valid amount required'}), 400
     
-    if not users:
-        return jsonify({'error': 'No users found in this faction'}), 404
+    faction, label, error = _resolve_faction(faction)
+    if error:
+        return jsonify({'error': error}), 404
     
-    # Add credits to each user
     admin = get_current_user()
-    affected_count = 0
+    affected_count, total, error = credit_faction(
+        faction,
+        amount,
+        memo=f"Faction bonus ({label}) by {admin.character_name}: {reason}"
+    )
     
-    for user in users:
-        # Skip system accounts
-        if user.account_number.startswith('NC-SYST') or user.account_number.startswith('NC-CASA'):
-            continue
-        
-        user.balance += amount
-        affected_count += 1
+    if affected_count == 0 and not error:
+        return jsonify({'error': 'No users found in this faction'}), 404
     
-    # Create audit log
+    # Create audit log (also records partial payouts if a later chunk failed)
     audit = AuditLog(
         admin_user_id=admin.id,
         action='FACTION_CREDITS',
-        details=f"Added ¤{amount} to {affected_count} users in faction '{faction or 'None'}': {reason}"
+        details=f"Added ¤{amount} to {affected_count} users in faction '{label}': {reason}"
+                + (f" (stopped early: {error})" if error else "")
     )
     db.session.add(audit)
     db.session.commit()
     
+    if error:
+        return jsonify({'error': error, 'affected_users': affected_count}), 400
+    
     return jsonify({
         'message': f'Added ¤{amount} to {affected_count} users',
         'affected_users': affected_count,
-        'faction': faction or 'None'
+        'total_amount': round(total, 2),
+        'faction': label
     })
 
 
-@admin_bp.route('/users/export', methods=['GET'])
+@admin_bp.route('/factions/<faction>/payroll', methods=['POST'])
 @admin_required
-def export_users_csv():
-    """Export all users to CSV"""
-    import csv
-    from io import StringIO
-    from flask import make_response
-    
-    # Get all users (excluding system accounts)
-    users = User.query.filter(
-        ~User.account_number.in_(['NC-SYST-EM00', 'NC-CASA-0000'])
-    ).order_by(User.character_name).all()
-    
-    # Create CSV in memory
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow([
-        'Character Name',
-        'Account Number',
-        'Balance',
-        'Faction',
-        'Is Admin',
-        'Created At'
-    ])
-    
-    # Write user data
-    for user in users:
-        writer.writerow([
-            user.character_name,
-            user.account_number,
-            f'{user.balance:.2f}',
-            user.faction or 'None',
-            'Yes' if user.is_admin else 'No',
-            user.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        ])
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=neobank_users_export.csv'
-    
-    # Log export
+def faction_payroll(faction):
+    """Pay individual amounts to members of a faction"""
+    data = request.get_json()
+    entries = data.get('payouts') or []
+    reason = data.get('reason') or 'Faction payroll'
+    
+    if not entries:
+        return jsonify({'error': 'Payouts required'}), 400
+    
+    amounts = {}
+    for entry in entries:
+        account_number = entry.get('account_number')
+        try:
+            amount = float(entry.get('amount'))
+        except (TypeError, ValueError):
+            return jsonify({'error': f'Invalid amount for {account_number}'}), 400
+        if not account_number or amount <= 0:
+            return jsonify({'error': 'Each payout needs an account_number and a positive amount'}), 400
+        amounts[account_number] = amounts.get(account_number, 0.0) + amount
+    
+    faction, label, error = _resolve_faction(faction)
+    if error:
+        return jsonify({'error': error}), 404
+    
+    members = dict(db.session.query(User.account_number, User.id).filter(
+        User.account_number.in_(list(amounts)),
+        User.faction_id == (faction.id if faction else None)
+    ).all())
+    unknown = [account for account in amounts if account not in members]
+    if unknown:
+        return jsonify({
+            'error': f"{len(unknown)} accounts are not members of faction '{label}'",
+            'accounts': unknown[:20]
+        }), 400
+    
+    system_account = User.query.filter_by(account_number=SYSTEM_ACCOUNT).first()
+    if not system_account:
+        return jsonify({'error': 'System account not found'}), 400
+    
+    admin = get_current_user()
+    paid_count, total, error = bulk_payout(
+        system_account,
+        ((members[account], amount) for account, amount in amounts.items()),
+        memo=f"Payroll ({label}) by {admin.character_name}: {reason}"
+    )
+    
+    audit = AuditLog(
+        admin_user_id=admin.id,
+        action='FACTION_PAYROLL',
+        details=f"Paid ¤{total:.2f} to {paid_count} users in faction '{label}': {reason}"
+                + (f" (stopped early: {error})" if error else "")
+    )
+    db.session.add(audit)
+    db.session.commit()
+    
+    if error:
+        return jsonify({'error': error, 'affected_users': paid_count}), 400
+    
+    return jsonify({
+        'message': f'Paid ¤{total:.2f} to {paid_count} users',
+        'affected_users': paid_count,
+        'total_amount': round(total, 2),
+        'faction': label
+    })
+
+
+def _export(action, label, filename, header, row_iterator):
+    """Audit and stream one CSV export using the request's filters"""
+    filters, error = parse_export_filters(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    compress = request.args.get('compress') == 'gzip'
+    
+    # Log export up front - the row count isn't known until the stream ends
     admin = get_current_user()
     audit = AuditLog(
         admin_user_id=admin.id,
-        action='USER_EXPORT',
-        details=f"Exported {len(users)} users to CSV"
+        action=action,
+        details=f"Exported {label} to CSV ({describe_filters(filters)})"
     )
     db.session.add(audit)
     db.session.commit()
     
-    return response
+    return csv_response(filename, header, row_iterator(filters), compress=compress)
+
+
+@admin_bp.route('/users/export', methods=['GET'])
+@priority(LOW)
+@admin_required
+def export_users_csv():
+    """Export users to CSV (streamed; supports since/until/faction/compress)"""
+    return _export('USER_EXPORT', 'users', 'neobank_users_export',
+                   USER_EXPORT_HEADER, iter_user_rows)
+
+
+@admin_bp.route('/transactions/export', methods=['GET'])
+@priority(LOW)
+@admin_required
+def export_transactions_csv():
+    """Export the transaction ledger to CSV (streamed; supports since/until/faction/compress)"""
+    return _export('TRANSACTION_EXPORT', 'transactions', 'neobank_transactions_export',
+                   TRANSACTION_EXPORT_HEADER, iter_transaction_rows)
+
+
+@admin_bp.route('/audit-logs/export', methods=['GET'])
+@priority(LOW)
+@admin_required
+def export_audit_logs_csv():
+    """Export admin audit logs to CSV (streamed; supports since/until/faction/compress)"""
+    return _export('AUDIT_EXPORT', 'audit logs', 'neobank_audit_export',
+                   AUDIT_EXPORT_HEADER, iter_audit_rows)
+
+
+@admin_bp.route('/system/cache', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """Hit/miss statistics for this worker's recent transactions cache"""
+    return jsonify({'recent_transactions': recent_transactions_cache.stats()})
+
+
+@admin_bp.route('/system/admission', methods=['GET'])
+@priority(CRITICAL)
+@admin_required
+def get_admission_stats():
+    """Admitted, shed and deferred work counters for this worker"""
+    return jsonify(admission.stats())
+
+
+@admin_bp.route('/system/sql-profile', methods=['GET'])
+@admin_required
+def get_sql_profile():
+    """Statements this worker spent the most time on (requires SQL_PROFILE)"""
+    return jsonify({'enabled': profiler.enabled, 'statements': profiler.top()})
+
+
+@admin_bp.route('/system/sql-profile', methods=['DELETE'])
+@admin_required
+def reset_sql_profile():
+    """Start collecting statement totals afresh"""
+    profiler.clear()
+    return jsonify({'message': 'SQL profile reset'})
+
+
+@admin_bp.route('/system/profile', methods=['GET'])
+@priority(CRITICAL)
+@admin_required
+def profile_worker():
+    """Sample this worker's stacks for ?seconds=N and return collapsed stacks (flamegraph input)"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', PROFILE_DEFAULT_INTERVAL * 1000)) / 1000
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return jsonify({'error': f'seconds must be between 0 and {PROFILE_MAX_SECONDS}'}), 400
+    if not 0.001 <= interval <= 1:
+        return jsonify({'error': 'interval_ms must be between 1 and 1000'}), 400
+    
+    include_idle = request.args.get('idle', 'false').lower() == 'true'
+    result, error = sample_stacks(seconds, interval=interval, include_idle=include_idle)
+    if error:
+        return jsonify({'error': error}), 409
+    
+    stacks, rounds = result
+    return Response(collapse(stacks), mimetype='text/plain', headers={
+        'X-Profile-Samples': str(rounds),
+        'X-Worker-Pid': str(os.getpid())
+    })
+
+
+@admin_bp.route('/system/heap/snapshot', methods=['POST'])
+@priority(CRITICAL)
+@admin_required
+def heap_snapshot():
+    """Take a tracemalloc snapshot of this worker and diff it against the previous one"""
+    try:
+        limit = int(request.args.get('limit', HEAP_TOP_STATS))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(take_heap_snapshot(limit=limit))
+
+
+@admin_bp.route('/system/heap', methods=['DELETE'])
+@priority(CRITICAL)
+@admin_required
+def stop_heap_snapshots():
+    """Stop allocation tracing in this worker"""
+    was_tracing = stop_heap_tracing()
+    return jsonify({'message': 'Allocation tracing stopped' if was_tracing else 'Allocation tracing was not running'})
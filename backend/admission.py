@@ -0,0 +1,165 @@
+"""
+Admission control - load shedding by request priority
+
+Every worker tracks its in-flight requests and how long requests wait for
+a database connection. When either climbs, low-priority work (spins,
+analytics, exports, search) is refused with a fast 503 + Retry-After
+instead of queueing, so the remaining capacity stays available for P2P
+transfers and logins. Views declare their priority with @priority(...);
+views without one are NORMAL.
+"""
+import os
+import threading
+import time
+from flask import request, g, jsonify
+from sqlalchemy.pool import QueuePool
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+EXEMPT = 'exempt'  # No database work (static files, event streams)
+
+PRIORITIES = (CRITICAL, NORMAL, LOW)
+
+# Share of the in-flight capacity each priority may use
+ADMIT_SHARE = {CRITICAL: 1.0, NORMAL: 0.8, LOW: 0.5}
+
+# Smoothed connection pool wait (seconds) above which a priority is shed
+ADMIT_POOL_WAIT = {CRITICAL: None, NORMAL: 0.5, LOW: 0.05}
+
+# Seconds clients are told to wait before retrying
+RETRY_AFTER = {CRITICAL: 1, NORMAL: 2, LOW: 5}
+
+# Weight of the newest sample in the smoothed pool wait
+POOL_WAIT_SMOOTHING = 0.2
+
+
+def priority(level):
+    """Declare a view's admission priority (put directly below the route decorator)"""
+    def decorator(f):
+        f.admission_priority = level
+        return f
+    return decorator
+
+
+class AdmissionController:
+    """Per-worker in-flight and pool wait tracking"""
+
+    def __init__(self, max_in_flight=32):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._pool_waiting = 0
+        self._pool_wait = 0.0
+        self._admitted = {level: 0 for level in PRIORITIES}
+        self._shed = {level: 0 for level in PRIORITIES}
+        self._deferred = 0
+
+    def try_admit(self, level):
+        """Count a request in if there is room for its priority; returns True if admitted"""
+        with self._lock:
+            limit_wait = ADMIT_POOL_WAIT[level]
+            overloaded = (
+                self._in_flight >= self.max_in_flight * ADMIT_SHARE[level]
+                or (limit_wait is not None and (self._pool_wait >= limit_wait
+                                                or (level == LOW and self._pool_waiting)))
+            )
+            if overloaded:
+                self._shed[level] += 1
+                return False
+            self._in_flight += 1
+            self._admitted[level] += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def pool_wait_started(self, queued=True):
+        """A checkout began; `queued` if it has to wait for a connection to come back"""
+        if queued:
+            with self._lock:
+                self._pool_waiting += 1
+
+    def pool_wait_finished(self, seconds, queued=True):
+        with self._lock:
+            if queued:
+                self._pool_waiting -= 1
+            self._pool_wait += POOL_WAIT_SMOOTHING * (seconds - self._pool_wait)
+
+    def under_pressure(self):
+        """True when deferrable background work should wait"""
+        with self._lock:
+            return (self._in_flight >= self.max_in_flight * ADMIT_SHARE[LOW]
+                    or self._pool_wait >= ADMIT_POOL_WAIT[LOW]
+                    or self._pool_waiting > 0)
+
+    def record_deferred(self):
+        with self._lock:
+            self._deferred += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'pool_waiting': self._pool_waiting,
+                'pool_wait_ms': round(self._pool_wait * 1000, 2),
+                'admitted': dict(self._admitted),
+                'shed': dict(self._shed),
+                'deferred': self._deferred,
+                'worker_pid': os.getpid()
+            }
+
+
+# One controller per worker process
+admission = AdmissionController()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports connection checkout waits to the admission controller"""
+
+    def exhausted(self):
+        """No idle connection and no room to open another: a checkout has to queue"""
+        return self.checkedin() == 0 and -1 < self._max_overflow <= self.overflow()
+
+    def _do_get(self):
+        # Every checkout feeds the smoothed wait, but only those that find the
+        # pool exhausted count as waiters
+        queued = self.exhausted()
+        admission.pool_wait_started(queued)
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            admission.pool_wait_finished(time.monotonic() - started, queued)
+
+
+def init_admission(app):
+    """Install the admission hooks on the Flask app"""
+    admission.max_in_flight = app.config.get('ADMISSION_MAX_IN_FLIGHT', admission.max_in_flight)
+
+    @app.before_request
+    def admit_request():
+        if not app.config.get('ADMISSION_ENABLED', True):
+            return None
+        view = app.view_functions.get(request.endpoint)
+        level = getattr(view, 'admission_priority', NORMAL) if view else EXEMPT
+        if level == EXEMPT or request.endpoint == 'static':
+            return None
+
+        if not admission.try_admit(level):
+            response = jsonify({
+                'error': 'Server is busy, please retry shortly',
+                'retry_after': RETRY_AFTER[level]
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(RETRY_AFTER[level])
+            return response
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(exc=None):
+        if g.pop('admitted', False):
+            admission.release()
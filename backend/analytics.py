@@ -0,0 +1,381 @@
+"""
+Casino analytics - per-game rollups and per-player lifetime counters
+
+Rollups: spins are accumulated in a per-worker buffer and merged into the rollup
+tables with additive upserts every ROLLUP_FLUSH_INTERVAL seconds, so the
+spin path never queues behind other workers on a shared rollup row and the
+admin dashboard reads a few hundred pre-aggregated rows instead of scanning
+the ledger.
+
+Player counters are per (player, game) rows updated inside the spin's
+settlement transaction; only that player's own spins ever touch them.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from .models import db, User, Transaction, CasinoRollup, CasinoRollupPlayer, PlayerGameStats, dialect_insert
+from .admission import admission
+
+# Seconds between flushes of a worker's buffered spins
+ROLLUP_FLUSH_INTERVAL = 5.0
+
+PERIODS = ('hour', 'day')
+
+# Ledger memo prefixes written by each game's bets and wins
+GAME_MEMO_PREFIXES = {
+    'glitch_grid': 'Glitch Grid',
+    'starlight_smuggler': 'Starlight Smuggler',
+}
+
+# Default dashboard window per period
+DEFAULT_WINDOWS = {
+    'hour': timedelta(hours=48),
+    'day': timedelta(days=30),
+}
+
+
+def bucket_start(timestamp, period):
+    """Truncate a timestamp to the start of its hour or day bucket"""
+    timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+class _Bucket:
+    __slots__ = ('spins', 'free_spins_played', 'wagered', 'paid_out',
+                 'free_spins_awarded', 'players')
+
+    def __init__(self):
+        self.spins = 0
+        self.free_spins_played = 0
+        self.wagered = 0.0
+        self.paid_out = 0.0
+        self.free_spins_awarded = 0
+        self.players = set()
+
+    def merge(self, other):
+        self.spins += other.spins
+        self.free_spins_played += other.free_spins_played
+        self.wagered += other.wagered
+        self.paid_out += other.paid_out
+        self.free_spins_awarded += other.free_spins_awarded
+        self.players |= other.players
+
+
+class RollupAccumulator:
+    """Per-worker buffer of spin aggregates keyed by (game, period, bucket_start)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, game_name, user_id, wagered, paid_out, free_spin=False,
+               free_spins_awarded=0, timestamp=None):
+        timestamp = timestamp or datetime.utcnow()
+        with self._lock:
+            for period in PERIODS:
+                key = (game_name, period, bucket_start(timestamp, period))
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket()
+                bucket.spins += 1
+                bucket.free_spins_played += 1 if free_spin else 0
+                bucket.wagered += wagered
+                bucket.paid_out += paid_out
+                bucket.free_spins_awarded += free_spins_awarded
+                bucket.players.add(user_id)
+
+    def due(self):
+        return bool(self._buckets) and time.monotonic() - self._last_flush >= ROLLUP_FLUSH_INTERVAL
+
+    def drain(self):
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+            self._last_flush = time.monotonic()
+        return buckets
+
+    def restore(self, buckets):
+        """Put drained buckets back after a failed flush"""
+        with self._lock:
+            for key, bucket in buckets.items():
+                existing = self._buckets.get(key)
+                if existing is None:
+                    self._buckets[key] = bucket
+                else:
+                    existing.merge(bucket)
+
+
+# One buffer per worker process
+casino_rollups = RollupAccumulator()
+
+
+def record_spin(game_name, user_id, wagered, paid_out, free_spin=False, free_spins_awarded=0):
+    """Buffer one settled spin for the rollups (no database access)"""
+    casino_rollups.record(game_name, user_id, wagered, paid_out,
+                          free_spin=free_spin, free_spins_awarded=free_spins_awarded)
+
+
+def flush_rollups(force=False):
+    """
+    Merge this worker's buffered spins into the rollup tables.
+
+    Unless forced, only flushes once ROLLUP_FLUSH_INTERVAL has passed, so it
+    is cheap to call after every spin. Counters are merged with additive
+    upserts; unique player counts are recomputed for the touched buckets
+    from casino_rollup_players.
+    """
+    if not force and not casino_rollups.due():
+        return 0
+
+    # Keep buffering while the database is saturated; rollups can wait
+    if not force and admission.under_pressure():
+        admission.record_deferred()
+        return 0
+
+    buckets = casino_rollups.drain()
+    if not buckets:
+        return 0
+
+    rollups = CasinoRollup.__table__
+    players = CasinoRollupPlayer.__table__
+
+    try:
+        for (game_name, period, start), bucket in buckets.items():
+            insert = dialect_insert(rollups).values(
+                game_name=game_name,
+                period=period,
+                bucket_start=start,
+                spins=bucket.spins,
+                free_spins_played=bucket.free_spins_played,
+                wagered=bucket.wagered,
+                paid_out=bucket.paid_out,
+                free_spins_awarded=bucket.free_spins_awarded,
+                unique_players=0
+            )
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=['game_name', 'period', 'bucket_start'],
+                set_={
+                    'spins': rollups.c.spins + insert.excluded.spins,
+                    'free_spins_played': rollups.c.free_spins_played + insert.excluded.free_spins_played,
+                    'wagered': rollups.c.wagered + insert.excluded.wagered,
+                    'paid_out': rollups.c.paid_out + insert.excluded.paid_out,
+                    'free_spins_awarded': rollups.c.free_spins_awarded + insert.excluded.free_spins_awarded,
+                }
+            ))
+
+            db.session.execute(
+                dialect_insert(players).on_conflict_do_nothing(),
+                [
+                    {'game_name': game_name, 'period': period,
+                     'bucket_start': start, 'user_id': user_id}
+                    for user_id in bucket.players
+                ]
+            )
+
+            unique_players = db.session.query(func.count()).select_from(players).filter(
+                players.c.game_name == game_name,
+                players.c.period == period,
+                players.c.bucket_start == start
+            ).scalar_subquery()
+            db.session.execute(
+                rollups.update()
+                .where(rollups.c.game_name == game_name)
+                .where(rollups.c.period == period)
+                .where(rollups.c.bucket_start == start)
+                .values(unique_players=unique_players)
+            )
+
+        db.session.commit()
+        return len(buckets)
+
+    except Exception:
+        db.session.rollback()
+        casino_rollups.restore(buckets)
+        raise
+
+
+def get_casino_stats(period='hour', game_name=None, since=None, until=None):
+    """
+    Read rollup rows for the admin dashboard.
+
+    Returns:
+        dict with per-bucket rows and per-game totals for the window
+    """
+    until = until or datetime.utcnow()
+    since = since or until - DEFAULT_WINDOWS[period]
+
+    query = CasinoRollup.query.filter(
+        CasinoRollup.period == period,
+        CasinoRollup.bucket_start >= bucket_start(since, period),
+        CasinoRollup.bucket_start < until
+    )
+    if game_name:
+        query = query.filter(CasinoRollup.game_name == game_name)
+
+    rows = query.order_by(CasinoRollup.bucket_start, CasinoRollup.game_name).all()
+
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row.game_name, {
+            'spins': 0, 'free_spins_played': 0, 'wagered': 0.0,
+            'paid_out': 0.0, 'free_spins_awarded': 0
+        })
+        total['spins'] += row.spins
+        total['free_spins_played'] += row.free_spins_played
+        total['wagered'] += row.wagered
+        total['paid_out'] += row.paid_out
+        total['free_spins_awarded'] += row.free_spins_awarded
+
+    for total in totals.values():
+        total['rtp'] = round(total['paid_out'] / total['wagered'] * 100, 2) if total['wagered'] else None
+        total['wagered'] = round(total['wagered'], 2)
+        total['paid_out'] = round(total['paid_out'], 2)
+
+    return {
+        'period': period,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'rows': [row.to_dict() for row in rows],
+        'totals': totals
+    }
+
+
+def record_player_spin(user_id, game_name, wagered, won, free_spin=False):
+    """
+    Update a player's lifetime counters for one spin.
+    
+    Executes inside the caller's database transaction - the spin path calls
+    this before committing the settlement, so the counters can never run
+    ahead of or behind the ledger.
+    """
+    stats = PlayerGameStats.__table__
+    now = datetime.utcnow()
+    insert = dialect_insert(stats).values(
+        user_id=user_id,
+        game_name=game_name,
+        spins=1,
+        total_wagered=wagered,
+        total_won=won,
+        biggest_win=won,
+        free_spins_used=1 if free_spin else 0,
+        last_played=now
+    )
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['user_id', 'game_name'],
+        set_={
+            'spins': stats.c.spins + 1,
+            'total_wagered': stats.c.total_wagered + insert.excluded.total_wagered,
+            'total_won': stats.c.total_won + insert.excluded.total_won,
+            'biggest_win': case(
+                (insert.excluded.biggest_win > stats.c.biggest_win, insert.excluded.biggest_win),
+                else_=stats.c.biggest_win
+            ),
+            'free_spins_used': stats.c.free_spins_used + insert.excluded.free_spins_used,
+            'last_played': insert.excluded.last_played,
+        }
+    ))
+
+
+def get_player_stats(user_id):
+    """Lifetime casino counters for one player (primary key range lookup)"""
+    return PlayerGameStats.query.filter_by(user_id=user_id).order_by(PlayerGameStats.game_name).all()
+
+
+def _game_from_memo():
+    """SQL expression mapping a ledger memo to its game name"""
+    return case(
+        *[(Transaction.memo.like(f'{prefix}%'), game) for game, prefix in GAME_MEMO_PREFIXES.items()],
+        else_=None
+    )
+
+
+def backfill_player_stats(chunk_size=1000, progress=None):
+    """
+    Recompute per-player casino counters from the ledger.
+    
+    Works through users in id ranges of `chunk_size`, committing after each
+    chunk, with the chunk's user rows locked while it is rebuilt. Free spins
+    leave no ledger rows, so free_spins_used is kept as recorded and added
+    to the spin count derived from bets.
+    
+    Returns:
+        Number of (player, game) rows written
+    """
+    max_id = db.session.query(func.max(User.id)).scalar() or 0
+    written = 0
+    
+    for low in range(1, max_id + 1, chunk_size):
+        high = low + chunk_size - 1
+        db.session.query(User.id).filter(User.id.between(low, high)).with_for_update().all()
+        
+        game = _game_from_memo().label('game')
+        bets = db.session.query(
+            Transaction.from_account_id, game,
+            func.count(Transaction.id),
+            func.sum(Transaction.amount),
+            func.max(Transaction.timestamp)
+        ).filter(
+            Transaction.from_account_id.between(low, high),
+            Transaction.transaction_type == 'casino_bet'
+        ).group_by(Transaction.from_account_id, game)
+        
+        game = _game_from_memo().label('game')
+        wins = db.session.query(
+            Transaction.to_account_id, game,
+            func.sum(Transaction.amount),
+            func.max(Transaction.amount),
+            func.max(Transaction.timestamp)
+        ).filter(
+            Transaction.to_account_id.between(low, high),
+            Transaction.transaction_type == 'casino_win'
+        ).group_by(Transaction.to_account_id, game)
+        
+        totals = {}
+        for user_id, game_name, count, wagered, last in bets:
+            if game_name:
+                totals[(user_id, game_name)] = {
+                    'spins': count, 'total_wagered': wagered or 0.0,
+                    'total_won': 0.0, 'biggest_win': 0.0, 'last_played': last
+                }
+        for user_id, game_name, won, biggest, last in wins:
+            if not game_name:
+                continue
+            entry = totals.setdefault((user_id, game_name), {
+                'spins': 0, 'total_wagered': 0.0,
+                'total_won': 0.0, 'biggest_win': 0.0, 'last_played': last
+            })
+            entry['total_won'] = won or 0.0
+            entry['biggest_win'] = biggest or 0.0
+            entry['last_played'] = max(t for t in (entry['last_played'], last) if t)
+        
+        existing = {
+            (s.user_id, s.game_name): s for s in PlayerGameStats.query.filter(
+                PlayerGameStats.user_id.between(low, high)
+            )
+        }
+        for key, stats in existing.items():
+            if key not in totals:
+                # Only free spins on record - keep them, reset ledger-derived fields
+                totals[key] = {'spins': 0, 'total_wagered': 0.0, 'total_won': 0.0,
+                               'biggest_win': 0.0, 'last_played': stats.last_played}
+        
+        for (user_id, game_name), values in totals.items():
+            stats = existing.get((user_id, game_name))
+            if not stats:
+                stats = PlayerGameStats(user_id=user_id, game_name=game_name, free_spins_used=0)
+                db.session.add(stats)
+            stats.spins = values['spins'] + (stats.free_spins_used or 0)
+            stats.total_wagered = values['total_wagered']
+            stats.total_won = values['total_won']
+            stats.biggest_win = values['biggest_win']
+            stats.last_played = values['last_played']
+            written += 1
+        
+        db.session.commit()
+        if progress:
+            progress(min(high, max_id), max_id)
+    
+    return written
@@ -2,18 +2,33 @@
 Main Flask application for NeoBank & Chrome Slots
 """
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import atexit
+import tempfile
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from datetime import timedelta
 
-from .models import db, User, Transaction
+from .models import db, User, Transaction, APIKey, CasinoConfig
 from .auth import register_user, login_user, get_current_user, api_key_required
-from .transactions import create_transaction, get_recent_transactions, search_transactions
+from .transactions import (
+    create_transaction, get_recent_transaction_page, search_transactions, serialize_transactions
+)
 from .casino import spin_glitch_grid, spin_starlight_smuggler
+from .analytics import get_player_stats
+from .leaderboards import get_leaderboards, CACHE_MAX_AGE
+from .jackpot import get_jackpot
+from .events import account_notifier, stream_account_events, issue_stream_ticket, read_stream_ticket
+from .http_cache import make_etag, conditional_response, account_version
 from .admin import admin_bp
+from .factions import set_user_faction, list_factions
+from .ratelimit import rate_limit_key, credential_limit_key
+from .admission import init_admission, priority, CRITICAL, LOW, EXEMPT, TimedQueuePool
+from .metrics import init_metrics, metrics
+from .sqlprofile import init_sql_profiler
+from .tracing import init_tracing, TracedJWTManager
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
@@ -24,19 +39,69 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:/
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = app.config['SECRET_KEY']
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=int(os.environ.get('JWT_EXPIRY_HOURS', 24)))
+# Set to false to switch every limit off (tests, load tests against one host)
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+app.config['JACKPOT_ENABLED'] = os.environ.get('JACKPOT_ENABLED', 'false').lower() == 'true'
+app.config['JACKPOT_CONTRIBUTION_PERCENT'] = float(os.environ.get('JACKPOT_CONTRIBUTION_PERCENT', 1.0))
+app.config['JACKPOT_SEED'] = float(os.environ.get('JACKPOT_SEED', 5000.0))
+# Open account streams per worker; each holds one of gunicorn's --threads
+app.config['STREAMS_PER_WORKER'] = int(os.environ.get('STREAMS_PER_WORKER', 8))
+app.config['ADMISSION_ENABLED'] = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+# In-flight requests per worker; gunicorn's --threads less STREAMS_PER_WORKER
+app.config['ADMISSION_MAX_IN_FLIGHT'] = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 24))
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+# Shared by the workers of one pod; must not be shared between pods
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'neobank-metrics'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Debugging aid: per-request statement log, N+1 warnings and X-SQL-Profile headers
+app.config['SQL_PROFILE'] = os.environ.get('SQL_PROFILE', 'false').lower() == 'true'
+app.config['TRACING_ENABLED'] = os.environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+app.config['TRACE_EXPORT'] = os.environ.get('TRACE_EXPORT', 'stdout')
+app.config['TRACE_SAMPLE_RATE'] = float(os.environ.get('TRACE_SAMPLE_RATE', 0.01))
+app.config['TRACE_ROUTE_SAMPLE_RATES'] = os.environ.get('TRACE_ROUTE_SAMPLE_RATES', '')
+app.config['TRACE_SLOW_MS'] = float(os.environ.get('TRACE_SLOW_MS', 500))
+
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # Time connection checkouts for the admission controller, and give up
+    # well before gunicorn's worker timeout when the pool stays exhausted
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': TimedQueuePool,
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    }
 
 # Initialize extensions
 db.init_app(app)
 CORS(app)
-jwt = JWTManager(app)
+jwt = TracedJWTManager(app)
 limiter = Limiter(
     app=app,
-    key_func=get_remote_address,
-    default_limits=[f"{os.environ.get('RATE_LIMIT_PER_MINUTE', 60)} per minute"]
+    key_func=rate_limit_key,
+    default_limits=[f"{os.environ.get('RATE_LIMIT_PER_MINUTE', 60)} per minute"],
+    # Counters shared by all workers through the database; memory:// is per worker
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'sqlsync://')
 )
 
 # Register blueprints
 app.register_blueprint(admin_bp)
+init_admission(app)
+init_metrics(app)
+init_sql_profiler(app)
+init_tracing(app, db.session)
+
+
+@atexit.register
+def flush_buffered_analytics():
+    """Persist this worker's buffered casino rollups and jackpot contributions on shutdown"""
+    from .analytics import flush_rollups
+    from .jackpot import flush_jackpot
+    try:
+        with app.app_context():
+            flush_rollups(force=True)
+            flush_jackpot(force=True)
+            if metrics.enabled:
+                metrics.flush()
+    except Exception as e:
+        print(f"⚠️  Could not flush casino buffers on shutdown: {e}")
 
 
 # ============================================================================
@@ -44,7 +109,9 @@ app.register_blueprint(admin_bp)
 # ============================================================================
 
 @app.route('/api/v1/auth/register', methods=['POST'])
-@limiter.limit("5 per hour")
+@priority(CRITICAL)
+@limiter.limit("5 per hour", key_func=credential_limit_key)
+@limiter.limit("300 per hour", key_func=get_remote_address)  # whole venue shares one address
 def api_register():
     """Register a new user"""
     data = request.get_json()
@@ -71,7 +138,9 @@ def api_register():
 
 
 @app.route('/api/v1/auth/login', methods=['POST'])
-@limiter.limit("10 per minute")
+@priority(CRITICAL)
+@limiter.limit("10 per minute", key_func=credential_limit_key)
+@limiter.limit("600 per minute", key_func=get_remote_address)  # whole venue shares one address
 def api_login():
     """Login and get JWT token"""
     data = request.get_json()
@@ -94,29 +163,134 @@ def api_login():
 # Account & Banking Routes
 # ============================================================================
 
+# Largest transaction page a client can ask for
+MAX_PAGE_LIMIT = 100
+
+
+def page_limit(default=10):
+    """?limit= clamped to 1..MAX_PAGE_LIMIT (ValueError if it isn't a number)"""
+    return max(1, min(int(request.args.get('limit', default)), MAX_PAGE_LIMIT))
+
+
 @app.route('/api/v1/account', methods=['GET'])
 @jwt_required()
 def get_account():
     """Get current user's account information"""
-    user = get_current_user()
-    return jsonify({'account': user.to_dict()})
+    user_id = int(get_jwt_identity())
+    etag = make_etag('account', user_id, account_version(user_id))
+    return conditional_response(etag, lambda: jsonify({'account': get_current_user().to_dict()}))
 
 
 @app.route('/api/v1/account/transactions', methods=['GET'])
 @jwt_required()
 def get_transactions():
     """Get user's transaction history"""
+    user_id = int(get_jwt_identity())
+    try:
+        limit = page_limit()
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    
+    # Every transaction changes the balance, so the account version covers history too
+    version = account_version(user_id)
+    
+    def build():
+        return jsonify({
+            'transactions': get_recent_transaction_page(user_id, version, limit=limit)
+        })
+    
+    etag = make_etag('transactions', user_id, version, limit)
+    return conditional_response(etag, build)
+
+
+@app.route('/api/v1/bootstrap', methods=['GET'])
+@jwt_required()
+def bootstrap():
+    """Everything the frontend needs after login, in one round trip"""
+    try:
+        limit = page_limit()
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
     user = get_current_user()
-    limit = int(request.args.get('limit', 10))
+    games = CasinoConfig.query.all()
+    
+    data = {
+        'account': user.to_dict(),
+        'transactions': get_recent_transaction_page(user.id, user.version, limit=limit),
+        'casino': {
+            'games': [{'game_name': g.game_name, 'is_enabled': g.is_enabled} for g in games]
+        }
+    }
     
-    transactions = get_recent_transactions(user, limit=limit)
+    if user.is_admin:
+        api_keys = APIKey.query.options(db.joinedload(APIKey.created_by)).all()
+        data['admin'] = {
+            'casino_config': [g.to_dict() for g in games],
+            'factions': [f.to_dict() for f in list_factions()],
+            'api_keys': [k.to_dict() for k in api_keys]
+        }
+    
+    return jsonify(data)
+
+
+@app.route('/api/v1/account/casino-stats', methods=['GET'])
+@priority(LOW)
+@jwt_required()
+def get_my_casino_stats():
+    """Get current user's lifetime casino statistics"""
+    user = get_current_user()
     
     return jsonify({
-        'transactions': [t.to_dict() for t in transactions]
+        'games': [game.to_dict() for game in get_player_stats(user.id)]
     })
 
 
+@app.route('/api/v1/account/stream-ticket', methods=['POST'])
+@jwt_required()
+def create_stream_ticket():
+    """Short-lived ticket for opening the account stream"""
+    # EventSource can't send headers, so the stream is opened with a ticket in
+    # the query string instead of the access token
+    return jsonify({'ticket': issue_stream_ticket(int(get_jwt_identity()))})
+
+
+@app.route('/api/v1/account/stream', methods=['GET'])
+@priority(EXEMPT)
+@limiter.exempt
+def stream_account():
+    """Server-Sent Events stream of the current user's balance and transactions"""
+    user_id = read_stream_ticket(request.args.get('ticket', ''))
+    if user_id is None:
+        return jsonify({'error': 'Invalid or expired stream ticket'}), 401
+    
+    # Subscribe before reading the balance so no update falls in between
+    account_notifier.ensure_listener(db.engine)
+    subscription = account_notifier.subscribe(user_id, limit=app.config['STREAMS_PER_WORKER'])
+    if subscription is None:
+        # Keep the worker's remaining threads for API requests
+        response = jsonify({'error': 'Too many open streams, try again shortly'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+    
+    user = User.query.get(user_id)
+    if not user:
+        account_notifier.unsubscribe(subscription)
+        return jsonify({'error': 'User not found'}), 401
+    
+    initial_event = {'type': 'balance', 'balance': round(user.balance, 2), 'free_spins': user.free_spins}
+    
+    # Release the database connection; the stream itself never queries
+    db.session.close()
+    
+    return Response(
+        stream_account_events(subscription, initial_event),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/v1/account/transactions/search', methods=['GET'])
+@priority(LOW)
 @jwt_required()
 def search_user_transactions():
     """Search user's transactions"""
@@ -129,7 +303,7 @@ def search_user_transactions():
     transactions = search_transactions(user, query)
     
     return jsonify({
-        'transactions': [t.to_dict() for t in transactions],
+        'transactions': serialize_transactions(transactions),
         'query': query
     })
 
@@ -141,9 +315,9 @@ def update_profile():
     user = get_current_user()
     data = request.get_json()
     
-    # Update faction
+    # Update faction (keeps faction aggregates in step)
     if 'faction' in data:
-        user.faction = data['faction'] if data['faction'] else None
+        set_user_faction(user, data['faction'])
     
     # Update profile picture (emoji or URL)
     if 'profile_picture' in data:
@@ -187,6 +361,7 @@ def change_password():
 
 
 @app.route('/api/v1/transactions', methods=['POST'])
+@priority(CRITICAL)
 @jwt_required()
 @limiter.limit("30 per minute")
 def create_user_transaction():
@@ -228,6 +403,7 @@ def create_user_transaction():
 # ============================================================================
 
 @app.route('/api/v1/external/transactions', methods=['POST'])
+@priority(CRITICAL)
 @api_key_required
 @limiter.limit("100 per minute")
 def external_transaction():
@@ -278,6 +454,7 @@ def external_check_balance(account_number):
 # ============================================================================
 
 @app.route('/api/v1/casino/glitch-grid/spin', methods=['POST'])
+@priority(LOW)
 @jwt_required()
 @limiter.limit("30 per minute")
 def spin_glitch():
@@ -306,6 +483,7 @@ def spin_glitch():
 
 
 @app.route('/api/v1/casino/starlight-smuggler/spin', methods=['POST'])
+@priority(LOW)
 @jwt_required()
 @limiter.limit("30 per minute")
 def spin_starlight():
@@ -333,17 +511,40 @@ def spin_starlight():
     return jsonify(result)
 
 
+@app.route('/api/v1/casino/jackpot', methods=['GET'])
+@priority(LOW)
+@jwt_required()
+def show_jackpot():
+    """Current progressive jackpot and its last winner"""
+    return jsonify(get_jackpot())
+
+
+@app.route('/api/v1/leaderboards', methods=['GET'])
+@priority(LOW)
+@jwt_required()
+def show_leaderboards():
+    """Biggest wins per game, richest characters and top factions"""
+    version, boards = get_leaderboards()
+    return conditional_response(
+        make_etag('leaderboards', version),
+        lambda: jsonify({'version': version, **boards}),
+        cache_control=f'private, max-age={CACHE_MAX_AGE}'
+    )
+
+
 # ============================================================================
 # Frontend Routes
 # ============================================================================
 
 @app.route('/')
+@priority(EXEMPT)
 def index():
     """Serve main application"""
     return send_from_directory(app.static_folder, 'index.html')
 
 
 @app.route('/<path:path>')
+@priority(EXEMPT)
 def serve_static(path):
     """Serve static files or return index.html for SPA routes"""
     import os
@@ -362,74 +563,39 @@ def serve_static(path):
 # ============================================================================
 
 @app.route('/health')
+@priority(EXEMPT)
 def health():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'neobank'})
 
 
+@app.route('/metrics')
+@priority(EXEMPT)
+@limiter.exempt
+def show_metrics():
+    """Prometheus metrics for all workers of this instance"""
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # ============================================================================
 # Database initialization
 # ============================================================================
 
 def init_database():
-    """Initialize database with system accounts"""
+    """Initialize database with system accounts (one query once initialized)"""
+    from .startup import ensure_database
     with app.app_context():
-        db.create_all()
-        
-        # Create system account if not exists
-        system_account = User.query.filter_by(account_number='NC-SYST-EM00').first()
-        if not system_account:
-            from .auth import hash_password
-            system_account = User(
-                character_name='SYSTEM',
-                password_hash=hash_password('system-no-login'),
-                account_number='NC-SYST-EM00',
-                balance=999999999.0,  # Unlimited funds
-                is_admin=True
-            )
-            db.session.add(system_account)
-        
-        # Create casino house account if not exists
-        house_account = User.query.filter_by(account_number='NC-CASA-0000').first()
-        if not house_account:
-            from .auth import hash_password
-            house_account = User(
-                character_name='CASINO HOUSE',
-                password_hash=hash_password('house-no-login'),
-                account_number='NC-CASA-0000',
-                balance=100000.0,  # Starting casino bank
-                is_admin=False
-            )
-            db.session.add(house_account)
-        
-        # Create default admin account if not exists
-        admin_account = User.query.filter_by(character_name='admin').first()
-        if not admin_account:
-            from .auth import hash_password
-            from .models import generate_account_number
-            admin_account = User(
-                character_name='admin',
-                password_hash=hash_password('neotropolis2025'),
-                account_number=generate_account_number(),
-                balance=1000.0,
-                is_admin=True
-            )
-            db.session.add(admin_account)
-        
-        # Initialize casino game configs with generous defaults
-        from .models import CasinoConfig
-        games = ['glitch_grid', 'starlight_smuggler']
-        for game in games:
-            if not CasinoConfig.query.filter_by(game_name=game).first():
-                config = CasinoConfig(
-                    game_name=game,
-                    is_enabled=True,
-                    payout_percentage=102.0  # Generous default: 102% RTP (player-friendly)
-                )
-                db.session.add(config)
-        
-        db.session.commit()
-        print("✅ Database initialized successfully")
+        if ensure_database():
+            print("✅ Database initialized successfully")
+        else:
+            print("✅ Database already initialized")
 
 
 if __name__ == '__main__':
@@ -5,23 +5,31 @@ import bcrypt
 from flask import jsonify, request
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from functools import wraps
-from .models import db, User, APIKey
+from .models import db, User, APIKey, AccountStats, NO_LOGIN_HASH
+from .ratelimit import remember_api_key
+from .metrics import metrics
+from .tracing import span
 from datetime import datetime
 
 
 def hash_password(password):
     """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    with metrics.timer('neobank_bcrypt_seconds', operation='hash'), span('bcrypt.hash'):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 
 def verify_password(password, password_hash):
     """Verify a password against its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    if password_hash == NO_LOGIN_HASH:
+        return False
+    with metrics.timer('neobank_bcrypt_seconds', operation='verify'), span('bcrypt.verify'):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
 
 def register_user(character_name, password, faction=None):
     """Register a new user"""
     from .models import generate_account_number
+    from .factions import set_user_faction
     
     # Check if user already exists
     if User.query.filter_by(character_name=character_name).first():
@@ -32,9 +40,10 @@ def register_user(character_name, password, faction=None):
         character_name=character_name,
         password_hash=hash_password(password),
         account_number=generate_account_number(),
-        faction=faction,
         balance=1000.0  # Welcome bonus!
     )
+    user.stats = AccountStats(sent_count=0, received_count=0, total_sent=0.0, total_received=0.0)
+    set_user_faction(user, faction)
     
     db.session.add(user)
     db.session.commit()
@@ -62,7 +71,8 @@ def get_current_user():
     """Get the current authenticated user from JWT"""
     user_id = get_jwt_identity()
     # Convert string identity back to integer
-    return User.query.get(int(user_id))
+    with span('user.load'):
+        return User.query.get(int(user_id))
 
 
 def admin_required(f):
@@ -87,19 +97,24 @@ def api_key_required(f):
             api_key = request.json.get('api_key')
         
         if not api_key:
+            metrics.inc('neobank_api_key_requests_total', outcome='missing')
             return jsonify({'error': 'API key required'}), 401
         
-        # Validate API key
-        key_obj = APIKey.query.filter_by(key_value=api_key, is_active=True).first()
-        if not key_obj:
-            return jsonify({'error': 'Invalid or inactive API key'}), 401
-        
-        # Update last used timestamp
-        key_obj.last_used = datetime.utcnow()
-        db.session.commit()
+        with metrics.timer('neobank_api_key_auth_seconds'):
+            # Validate API key
+            key_obj = APIKey.query.filter_by(key_value=api_key, is_active=True).first()
+            if not key_obj:
+                metrics.inc('neobank_api_key_requests_total', outcome='invalid')
+                return jsonify({'error': 'Invalid or inactive API key'}), 401
+            
+            # Update last used timestamp
+            key_obj.last_used = datetime.utcnow()
+            db.session.commit()
+        metrics.inc('neobank_api_key_requests_total', outcome='valid')
         
         # Store API key object in request context
         request.api_key = key_obj
+        remember_api_key(api_key)
         
         return f(*args, **kwargs)
     return decorated_function
@@ -5,6 +5,29 @@ import random
 import time
 from .models import db, User, CasinoConfig
 from .transactions import create_transaction
+from .analytics import record_spin, flush_rollups, record_player_spin
+from .leaderboards import leaderboards
+from .jackpot import jackpot_enabled, contribute, claim_jackpot, release_claim, flush_jackpot
+from .metrics import count_spin
+from .tracing import span
+
+
+def _flush_after_spin():
+    """
+    Flush buffered casino data once a spin has settled.
+
+    The player has already been charged and paid, so a failed flush must not
+    be reported as a failed spin (clients would retry and bet twice). Both
+    buffers keep what they couldn't write and the next flush retries it.
+    """
+    try:
+        flush_rollups()
+    except Exception as e:
+        print(f"⚠️  Could not flush casino rollups: {e}")
+    try:
+        flush_jackpot()
+    except Exception as e:
+        print(f"⚠️  Could not flush jackpot contributions: {e}")
 
 
 # Slot Machine 1: Glitch Grid (3-Reel Classic)
@@ -30,6 +53,7 @@ GLITCH_GRID_PAYOUTS = {
 # Slot Machine 2: Starlight Smuggler (5-Reel, 3-Row, Multi-line)
 STARLIGHT_SYMBOLS = ['🚀', '🗺️', '🔫', '💎', '🌀', '⭐']  # Freighter, Map, Blaster, Gem, Wormhole, Star
 STARLIGHT_SCATTER = '🌀'
+STARLIGHT_JACKPOT_SYMBOL = '💎'
 
 # Paylines for 5-reel, 3-row grid (9 paylines)
 STARLIGHT_PAYLINES = [
@@ -73,12 +97,13 @@ def get_casino_house_account():
 
 def get_game_config(game_name):
     """Get casino game configuration"""
-    config = CasinoConfig.query.filter_by(game_name=game_name).first()
-    if not config:
-        # Create default config with generous payout
-        config = CasinoConfig(game_name=game_name, is_enabled=True, payout_percentage=102.0)
-        db.session.add(config)
-        db.session.commit()
+    with span('casino.config', game=game_name):
+        config = CasinoConfig.query.filter_by(game_name=game_name).first()
+        if not config:
+            # Create default config with generous payout
+            config = CasinoConfig(game_name=game_name, is_enabled=True, payout_percentage=102.0)
+            db.session.add(config)
+            db.session.commit()
     return config
 
 
@@ -108,6 +133,31 @@ def spin_glitch_grid(player_account, bet_amount):
         if not config.is_enabled:
             return {'error': 'Game is currently disabled'}
         
+        # Generate random spin
+        with span('casino.rng'):
+            reels = [
+                random.choice(GLITCH_GRID_SYMBOLS),
+                random.choice(GLITCH_GRID_SYMBOLS),
+                random.choice(GLITCH_GRID_SYMBOLS)
+            ]
+        
+        # Calculate winnings
+        with span('casino.paylines'):
+            win_multiplier = calculate_glitch_grid_win(reels)
+        
+        # Adjust for payout percentage (house edge)
+        payout_factor = config.payout_percentage / 100.0
+        win_multiplier = int(win_multiplier * payout_factor)
+        
+        win_amount = bet_amount * win_multiplier
+        
+        # Three wilds also take the progressive jackpot
+        jackpot_spin = reels == [GLITCH_GRID_WILD] * 3 and jackpot_enabled()
+        
+        # Lifetime stats settle with the payout, or with the bet for a loss
+        if win_amount == 0 and not jackpot_spin:
+            record_player_spin(player.id, 'glitch_grid', wagered=bet_amount, won=0.0)
+        
         # Process bet
         house = get_casino_house_account()
         transaction, error = create_transaction(
@@ -117,39 +167,48 @@ def spin_glitch_grid(player_account, bet_amount):
         )
         
         if error:
+            db.session.rollback()
             return {'error': error}
+        contribute(bet_amount)
         
-        # Generate random spin
-        reels = [
-            random.choice(GLITCH_GRID_SYMBOLS),
-            random.choice(GLITCH_GRID_SYMBOLS),
-            random.choice(GLITCH_GRID_SYMBOLS)
-        ]
-        
-        # Calculate winnings
-        win_multiplier = calculate_glitch_grid_win(reels)
-        
-        # Adjust for payout percentage (house edge)
-        payout_factor = config.payout_percentage / 100.0
-        win_multiplier = int(win_multiplier * payout_factor)
-        
-        win_amount = bet_amount * win_multiplier
+        jackpot_won, jackpot_pending = 0.0, 0.0
+        if jackpot_spin:
+            jackpot_won, jackpot_pending = claim_jackpot(player.id)
+            win_amount += jackpot_won
         
         # Process winnings if any
         if win_amount > 0:
+            record_player_spin(player.id, 'glitch_grid', wagered=bet_amount, won=win_amount)
+            memo = f"Glitch Grid win ({win_multiplier}x)"
+            if jackpot_won:
+                memo = f"Glitch Grid JACKPOT win ({win_multiplier}x + ¤{jackpot_won:.2f})"
             win_transaction, error = create_transaction(
                 house, player, win_amount,
-                memo=f"Glitch Grid win ({win_multiplier}x)",
+                memo=memo,
                 transaction_type='casino_win'
             )
             if error:
+                db.session.rollback()
+                if jackpot_won:
+                    release_claim(jackpot_pending)
                 return {'error': f'Failed to process winnings: {error}'}
+            leaderboards.record_win('glitch_grid', player.id, player.character_name,
+                                    player.faction, win_amount)
+        elif jackpot_spin:
+            # An empty pot: the claim and the stats commit together
+            record_player_spin(player.id, 'glitch_grid', wagered=bet_amount, won=0.0)
+            db.session.commit()
+        
+        record_spin('glitch_grid', player.id, wagered=bet_amount, paid_out=win_amount)
+        count_spin('glitch_grid', wagered=bet_amount, paid_out=win_amount)
+        _flush_after_spin()
         
         return {
             'reels': reels,
             'bet': bet_amount,
             'win_multiplier': win_multiplier,
             'win_amount': win_amount,
+            'jackpot_won': jackpot_won,
             'balance': player.balance
         }
         
@@ -205,48 +264,33 @@ def spin_starlight_smuggler(player_account, bet_amount):
         
         # Check if player has free spins available
         using_free_spin = player.free_spins > 0
-        
-        # Process bet only if not using free spins
-        house = get_casino_house_account()
-        if not using_free_spin:
-            transaction, error = create_transaction(
-                player, house, total_bet,
-                memo="Starlight Smuggler bet",
-                transaction_type='casino_bet'
-            )
-            
-            if error:
-                return {'error': error}
-        else:
-            # Decrement free spins
-            player.free_spins -= 1
-            db.session.commit()
+        wagered = 0 if using_free_spin else total_bet
         
         # Generate 5x3 grid
-        grid = [
-            [random.choice(STARLIGHT_SYMBOLS) for _ in range(5)],
-            [random.choice(STARLIGHT_SYMBOLS) for _ in range(5)],
-            [random.choice(STARLIGHT_SYMBOLS) for _ in range(5)]
-        ]
+        with span('casino.rng'):
+            grid = [
+                [random.choice(STARLIGHT_SYMBOLS) for _ in range(5)],
+                [random.choice(STARLIGHT_SYMBOLS) for _ in range(5)],
+                [random.choice(STARLIGHT_SYMBOLS) for _ in range(5)]
+            ]
         
         # Check for scatter bonus (only award on non-free spins)
         scatter_count = sum(row.count(STARLIGHT_SCATTER) for row in grid)
         bonus_spins_awarded = 0
         if not using_free_spin and scatter_count >= 3:
             bonus_spins_awarded = 5
-            player.free_spins += bonus_spins_awarded
-            db.session.commit()
         
         # Calculate winnings across all paylines
         total_win_multiplier = 0
         winning_lines = []
         
-        for line_idx, payline in enumerate(STARLIGHT_PAYLINES):
-            symbols = [grid[row][col] for row, col in payline]
-            multiplier = calculate_starlight_win(symbols)
-            if multiplier > 0:
-                total_win_multiplier += multiplier
-                winning_lines.append(line_idx)
+        with span('casino.paylines'):
+            for line_idx, payline in enumerate(STARLIGHT_PAYLINES):
+                symbols = [grid[row][col] for row, col in payline]
+                multiplier = calculate_starlight_win(symbols)
+                if multiplier > 0:
+                    total_win_multiplier += multiplier
+                    winning_lines.append(line_idx)
         
         # Adjust for payout percentage
         payout_factor = config.payout_percentage / 100.0
@@ -254,15 +298,75 @@ def spin_starlight_smuggler(player_account, bet_amount):
         
         win_amount = bet_amount * total_win_multiplier
         
-        # Process winnings if any
+        # Five gems on any payline also take the progressive jackpot
+        jackpot_spin = jackpot_enabled() and any(
+            all(grid[row][col] == STARLIGHT_JACKPOT_SYMBOL for row, col in payline)
+            for payline in STARLIGHT_PAYLINES
+        )
+        
+        # The bet (or used free spin), bonus spins and - for a loss - the
+        # lifetime stats settle in one transaction
+        if using_free_spin:
+            player.free_spins -= 1
+        player.free_spins += bonus_spins_awarded
+        if win_amount == 0 and not jackpot_spin:
+            record_player_spin(player.id, 'starlight_smuggler', wagered=wagered, won=0.0,
+                               free_spin=using_free_spin)
+        
+        house = get_casino_house_account()
+        if not using_free_spin:
+            transaction, error = create_transaction(
+                player, house, total_bet,
+                memo="Starlight Smuggler bet",
+                transaction_type='casino_bet'
+            )
+            
+            if error:
+                db.session.rollback()
+                return {'error': error}
+            contribute(total_bet)
+        else:
+            db.session.commit()
+        
+        jackpot_won, jackpot_pending = 0.0, 0.0
+        if jackpot_spin:
+            jackpot_won, jackpot_pending = claim_jackpot(player.id)
+            win_amount += jackpot_won
+        
+        # Process winnings if any; lifetime stats settle with the payout
         if win_amount > 0:
+            record_player_spin(player.id, 'starlight_smuggler', wagered=wagered,
+                               won=win_amount, free_spin=using_free_spin)
+            memo = f"Starlight Smuggler win ({total_win_multiplier}x)"
+            if jackpot_won:
+                memo = f"Starlight Smuggler JACKPOT win ({total_win_multiplier}x + ¤{jackpot_won:.2f})"
             win_transaction, error = create_transaction(
                 house, player, win_amount,
-                memo=f"Starlight Smuggler win ({total_win_multiplier}x)",
+                memo=memo,
                 transaction_type='casino_win'
             )
             if error:
+                db.session.rollback()
+                if jackpot_won:
+                    release_claim(jackpot_pending)
                 return {'error': f'Failed to process winnings: {error}'}
+            leaderboards.record_win('starlight_smuggler', player.id, player.character_name,
+                                    player.faction, win_amount)
+        elif jackpot_spin:
+            # An empty pot: the claim and the stats commit together
+            record_player_spin(player.id, 'starlight_smuggler', wagered=wagered, won=0.0,
+                               free_spin=using_free_spin)
+            db.session.commit()
+        
+        record_spin(
+            'starlight_smuggler', player.id,
+            wagered=wagered,
+            paid_out=win_amount,
+            free_spin=using_free_spin,
+            free_spins_awarded=bonus_spins_awarded
+        )
+        count_spin('starlight_smuggler', wagered=wagered, paid_out=win_amount)
+        _flush_after_spin()
         
         return {
             'grid': grid,
@@ -270,6 +374,7 @@ def spin_starlight_smuggler(player_account, bet_amount):
             'total_bet': total_bet if not using_free_spin else 0,
             'win_multiplier': total_win_multiplier,
             'win_amount': win_amount,
+            'jackpot_won': jackpot_won,
             'winning_lines': winning_lines,
             'scatter_count': scatter_count,
             'bonus_spins_awarded': bonus_spins_awarded,
@@ -0,0 +1,284 @@
+"""
+Account events - live balance and transaction updates for connected clients
+
+Code that changes an account queues an event inside its database
+transaction; nothing is sent unless the transaction commits. On PostgreSQL
+committed events are handed to this worker's sender thread, which batches
+them into one pg_notify round trip on its own connection (so ledger commits
+never wait on the notification queue lock), and every worker's listener
+thread fans them out to the streams it holds. Other databases publish
+committed events locally (single process).
+
+Each open stream holds a gunicorn thread, so a worker accepts at most
+STREAMS_PER_WORKER of them and leaves the rest of its threads to API
+requests. Browsers authenticate with a short-lived stream ticket rather
+than their access token, which would otherwise end up in access logs.
+"""
+import json
+import select
+import threading
+import time
+from collections import deque
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy import event, text
+from .models import db
+
+NOTIFY_CHANNEL = 'account_events'
+
+# Per-stream event buffer; a slow client that falls this far behind gets a
+# single 'refresh' event instead
+SUBSCRIPTION_BUFFER = 100
+
+# Largest number of account ids carried by one notification (payloads are
+# limited to 8000 bytes on PostgreSQL)
+NOTIFY_BATCH_SIZE = 500
+
+# Streams end after this many seconds and the browser reconnects, so a
+# worker thread is never held indefinitely
+STREAM_MAX_SECONDS = 300
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+
+# How long a stream ticket can be used to open a stream
+STREAM_TICKET_SECONDS = 30
+
+# Seconds the sender waits to collect more events into one notification batch
+NOTIFY_BATCH_DELAY = 0.05
+
+_PENDING_KEY = 'pending_account_events'
+
+
+class Subscription:
+    """One connected stream's queue of events"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def push(self, account_event):
+        with self._ready:
+            if len(self._events) >= SUBSCRIPTION_BUFFER:
+                self._events.clear()
+                account_event = {'type': 'refresh'}
+            self._events.append(account_event)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout` seconds"""
+        with self._ready:
+            if not self._events:
+                self._ready.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+
+class AccountNotifier:
+    """Per-worker fan-out of account events to connected streams"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listener = None
+
+    def subscribe(self, user_id, limit=None):
+        """New subscription, or None if this worker already holds `limit` streams"""
+        subscription = Subscription(user_id)
+        with self._lock:
+            if limit is not None and self._count() >= limit:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            streams = self._subscribers.get(subscription.user_id)
+            if streams:
+                streams.discard(subscription)
+                if not streams:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_ids, account_event):
+        with self._lock:
+            targets = [s for user_id in user_ids for s in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            subscription.push(account_event)
+
+    def _count(self):
+        return sum(len(streams) for streams in self._subscribers.values())
+
+    def stream_count(self):
+        with self._lock:
+            return self._count()
+
+    def ensure_listener(self, engine):
+        """Start this worker's LISTEN thread (PostgreSQL only)"""
+        if engine.dialect.name != 'postgresql':
+            return
+        with self._lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen, args=(engine,), name='account-events', daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self, engine):
+        while True:
+            connection = None
+            try:
+                # A dedicated connection, so LISTEN doesn't hold a pool slot
+                connection = engine.raw_connection()
+                connection.detach()
+                raw = connection.driver_connection
+                raw.autocommit = True
+                raw.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+
+                while True:
+                    if select.select([raw], [], [], 30.0) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self._dispatch(raw.notifies.pop(0).payload)
+
+            except Exception as e:
+                print(f"⚠️  Account event listener error, reconnecting: {e}")
+                time.sleep(1.0)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, payload):
+        message = json.loads(payload)
+        self.publish(message['user_ids'], message['event'])
+
+
+# One notifier per worker process
+account_notifier = AccountNotifier()
+
+
+def notify_payloads(events):
+    """pg_notify payloads for (user_ids, event) pairs, within the size limit"""
+    return [
+        json.dumps({'user_ids': user_ids[start:start + NOTIFY_BATCH_SIZE], 'event': account_event})
+        for user_ids, account_event in events
+        for start in range(0, len(user_ids), NOTIFY_BATCH_SIZE)
+    ]
+
+
+class NotificationSender:
+    """Per-worker thread sending committed events to the other workers in batches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._pending = []
+        self._thread = None
+
+    def send(self, engine, events):
+        with self._ready:
+            self._pending.extend(events)
+            self._ready.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, args=(engine,), name='account-notify', daemon=True
+                )
+                self._thread.start()
+
+    def _take(self):
+        with self._ready:
+            while not self._pending:
+                self._ready.wait()
+        time.sleep(NOTIFY_BATCH_DELAY)
+        with self._lock:
+            events, self._pending = self._pending, []
+        return events
+
+    def _run(self, engine):
+        while True:
+            payloads = notify_payloads(self._take())
+            try:
+                # One round trip and one short transaction per batch
+                calls = ', '.join(f'pg_notify(:channel, :p{i})' for i in range(len(payloads)))
+                params = {f'p{i}': payload for i, payload in enumerate(payloads)}
+                with engine.begin() as connection:
+                    connection.execute(text(f'SELECT {calls}'), {'channel': NOTIFY_CHANNEL, **params})
+            except Exception as e:
+                # Clients resync from the balance event when their stream reconnects
+                print(f"⚠️  Could not send account events: {e}")
+
+
+notification_sender = NotificationSender()
+
+
+def queue_account_events(events):
+    """
+    Send events to accounts' streams once the current database transaction
+    commits. Nothing is sent if it rolls back.
+
+    Args:
+        events: List of (user_ids, event) pairs
+    """
+    events = [(list(user_ids), account_event) for user_ids, account_event in events if user_ids]
+    if events:
+        db.session.info.setdefault(_PENDING_KEY, []).extend(events)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_committed_events(session):
+    events = session.info.pop(_PENDING_KEY, None)
+    if not events:
+        return
+    engine = session.get_bind()
+    if engine.dialect.name == 'postgresql':
+        notification_sender.send(engine, events)
+        return
+    for user_ids, account_event in events:
+        account_notifier.publish(user_ids, account_event)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_rolled_back_events(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def _ticket_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='account-stream')
+
+
+def issue_stream_ticket(user_id):
+    """Signed ticket that opens the user's stream for the next STREAM_TICKET_SECONDS"""
+    return _ticket_serializer().dumps(user_id)
+
+
+def read_stream_ticket(ticket):
+    """User id from a stream ticket, or None if it is invalid or expired"""
+    try:
+        return int(_ticket_serializer().loads(ticket, max_age=STREAM_TICKET_SECONDS))
+    except (BadSignature, TypeError, ValueError):
+        return None
+
+
+def format_sse(account_event):
+    """Encode one event in text/event-stream format"""
+    return f"event: {account_event['type']}\ndata: {json.dumps(account_event)}\n\n"
+
+
+def stream_account_events(subscription, initial_event):
+    """Yield an account's events as text/event-stream until the stream's lifetime ends"""
+    try:
+        yield f"retry: 3000\n{format_sse(initial_event)}"
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        while time.monotonic() < deadline:
+            account_event = subscription.get(timeout=HEARTBEAT_SECONDS)
+            if account_event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield format_sse(account_event)
+    finally:
+        account_notifier.unsubscribe(subscription)
@@ -0,0 +1,274 @@
+"""
+Streaming CSV exports for the admin panel
+
+Rows are read through server-side cursors (yield_per) as plain column tuples,
+so neither the ORM identity map nor the response body grows with the export
+size - memory use stays flat whether the export is a hundred rows or millions.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from flask import Response, stream_with_context
+from sqlalchemy.orm import aliased
+from .models import db, User, Transaction, AuditLog
+from .transactions import SYSTEM_ACCOUNT, HOUSE_ACCOUNT
+
+# Rows fetched from the database cursor per round trip
+EXPORT_FETCH_SIZE = 1000
+
+# Rows buffered before a chunk is handed to the WSGI server
+EXPORT_FLUSH_ROWS = 500
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_export_filters(args):
+    """
+    Parse common export filters from request args.
+
+    Supports `since` and `until` (ISO 8601 dates or datetimes) and `faction`
+    ('None' selects users without a faction).
+
+    Returns:
+        (filters, error) tuple
+    """
+    filters = {'since': None, 'until': None, 'faction': None, 'has_faction': False}
+
+    for key in ('since', 'until'):
+        value = args.get(key)
+        if value:
+            try:
+                filters[key] = datetime.fromisoformat(value)
+            except ValueError:
+                return None, f"Invalid '{key}' timestamp, expected ISO 8601"
+
+    if 'faction' in args:
+        faction = args.get('faction')
+        filters['has_faction'] = True
+        filters['faction'] = None if faction.lower() == 'none' else faction
+
+    return filters, None
+
+
+def describe_filters(filters):
+    """Human readable summary of export filters for the audit log"""
+    parts = []
+    if filters['since']:
+        parts.append(f"since {filters['since'].isoformat()}")
+    if filters['until']:
+        parts.append(f"until {filters['until'].isoformat()}")
+    if filters['has_faction']:
+        parts.append(f"faction '{filters['faction'] or 'None'}'")
+    return ', '.join(parts) if parts else 'all rows'
+
+
+def _csv_chunks(header, rows):
+    """Encode rows as CSV text, yielding a chunk every EXPORT_FLUSH_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= EXPORT_FLUSH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _gzip_chunks(chunks):
+    """Incrementally gzip a stream of byte chunks"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(filename, header, rows, compress=False):
+    """
+    Build a streaming CSV download response.
+
+    Args:
+        filename: Download filename without extension
+        header: List of column titles
+        rows: Iterable of row tuples (consumed lazily while streaming)
+        compress: Gzip the stream and serve it as a .csv.gz download
+    """
+    body = _csv_chunks(header, rows)
+    if compress:
+        body = _gzip_chunks(body)
+        mimetype = 'application/gzip'
+        filename = f'{filename}.csv.gz'
+    else:
+        mimetype = 'text/csv'
+        filename = f'{filename}.csv'
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Accel-Buffering'] = 'no'  # let proxies pass chunks straight through
+    return response
+
+
+def _format_time(value):
+    return value.strftime(TIMESTAMP_FORMAT) if value else ''
+
+
+USER_EXPORT_HEADER = [
+    'Character Name',
+    'Account Number',
+    'Balance',
+    'Faction',
+    'Is Admin',
+    'Created At'
+]
+
+
+def iter_user_rows(filters):
+    """Yield CSV rows for regular users, ordered by character name"""
+    query = db.session.query(
+        User.character_name,
+        User.account_number,
+        User.balance,
+        User.faction,
+        User.is_admin,
+        User.created_at
+    ).filter(
+        ~User.account_number.in_([SYSTEM_ACCOUNT, HOUSE_ACCOUNT])
+    )
+    if filters['since']:
+        query = query.filter(User.created_at >= filters['since'])
+    if filters['until']:
+        query = query.filter(User.created_at < filters['until'])
+    if filters['has_faction']:
+        query = query.filter(User.faction == filters['faction'])
+
+    for name, account, balance, faction, is_admin, created_at in (
+        query.order_by(User.character_name).yield_per(EXPORT_FETCH_SIZE)
+    ):
+        yield (
+            name,
+            account,
+            f'{balance:.2f}',
+            faction or 'None',
+            'Yes' if is_admin else 'No',
+            _format_time(created_at)
+        )
+
+
+TRANSACTION_EXPORT_HEADER = [
+    'ID',
+    'Timestamp',
+    'Type',
+    'From Account',
+    'From Name',
+    'To Account',
+    'To Name',
+    'Amount',
+    'Memo'
+]
+
+
+def iter_transaction_rows(filters):
+    """
+    Yield CSV rows for ledger entries, oldest first.
+
+    Sender and receiver are joined in the same statement, so there are no
+    per-row lookups. A faction filter matches either side of the transfer.
+    """
+    sender = aliased(User)
+    receiver = aliased(User)
+
+    query = db.session.query(
+        Transaction.id,
+        Transaction.timestamp,
+        Transaction.transaction_type,
+        sender.account_number,
+        sender.character_name,
+        receiver.account_number,
+        receiver.character_name,
+        Transaction.amount,
+        Transaction.memo
+    ).join(
+        sender, Transaction.from_account_id == sender.id
+    ).join(
+        receiver, Transaction.to_account_id == receiver.id
+    )
+    if filters['since']:
+        query = query.filter(Transaction.timestamp >= filters['since'])
+    if filters['until']:
+        query = query.filter(Transaction.timestamp < filters['until'])
+    if filters['has_faction']:
+        query = query.filter(db.or_(
+            sender.faction == filters['faction'],
+            receiver.faction == filters['faction']
+        ))
+
+    for tx_id, timestamp, tx_type, from_acct, from_name, to_acct, to_name, amount, memo in (
+        query.order_by(Transaction.timestamp, Transaction.id).yield_per(EXPORT_FETCH_SIZE)
+    ):
+        yield (
+            tx_id,
+            _format_time(timestamp),
+            tx_type,
+            from_acct,
+            from_name,
+            to_acct,
+            to_name,
+            f'{amount:.2f}',
+            memo or ''
+        )
+
+
+AUDIT_EXPORT_HEADER = [
+    'ID',
+    'Timestamp',
+    'Admin',
+    'Action',
+    'Target',
+    'Details'
+]
+
+
+def iter_audit_rows(filters):
+    """Yield CSV rows for the admin audit log, oldest first"""
+    admin = aliased(User)
+    target = aliased(User)
+
+    query = db.session.query(
+        AuditLog.id,
+        AuditLog.timestamp,
+        admin.character_name,
+        AuditLog.action,
+        target.character_name,
+        AuditLog.details
+    ).join(
+        admin, AuditLog.admin_user_id == admin.id
+    ).outerjoin(
+        target, AuditLog.target_user_id == target.id
+    )
+    if filters['since']:
+        query = query.filter(AuditLog.timestamp >= filters['since'])
+    if filters['until']:
+        query = query.filter(AuditLog.timestamp < filters['until'])
+    if filters['has_faction']:
+        query = query.filter(target.faction == filters['faction'])
+
+    for log_id, timestamp, admin_name, action, target_name, details in (
+        query.order_by(AuditLog.timestamp, AuditLog.id).yield_per(EXPORT_FETCH_SIZE)
+    ):
+        yield (
+            log_id,
+            _format_time(timestamp),
+            admin_name,
+            action,
+            target_name or '',
+            details or ''
+        )
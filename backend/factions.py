@@ -0,0 +1,203 @@
+"""
+Faction registry - membership and balance aggregates maintained incrementally
+
+Every change that moves a user between factions or moves money across a
+faction boundary adjusts the affected factions' member_count/total_balance
+with atomic increments inside the caller's database transaction, so the
+faction list is a plain indexed read of the factions table.
+"""
+from sqlalchemy import bindparam, func
+from sqlalchemy.exc import IntegrityError
+from .models import db, User, Faction
+
+
+def normalize_faction_name(name):
+    """Strip whitespace; empty names mean 'no faction'"""
+    if name is None:
+        return None
+    name = name.strip()
+    return name or None
+
+
+def get_faction(name):
+    """Look up a faction by name (case-insensitive)"""
+    name = normalize_faction_name(name)
+    if not name:
+        return None
+    return Faction.query.filter_by(name_key=name.lower()).first()
+
+
+def get_or_create_faction(name, description=None):
+    """
+    Get a faction by name, creating it if it doesn't exist yet.
+
+    Returns:
+        (faction, created) tuple
+    """
+    faction = get_faction(name)
+    if faction:
+        return faction, False
+
+    name = normalize_faction_name(name)
+    faction = Faction(
+        name=name,
+        name_key=name.lower(),
+        description=description,
+        member_count=0,
+        total_balance=0.0
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(faction)
+    except IntegrityError:
+        # Created concurrently by another request
+        return get_faction(name), False
+    return faction, True
+
+
+def adjust_faction(faction_id, members=0, balance=0.0):
+    """Atomically adjust one faction's aggregates"""
+    if faction_id is None or (members == 0 and balance == 0):
+        return
+    factions = Faction.__table__
+    db.session.execute(
+        factions.update()
+        .where(factions.c.id == faction_id)
+        .values(
+            member_count=factions.c.member_count + members,
+            total_balance=factions.c.total_balance + balance
+        )
+    )
+
+
+def set_user_faction(user, name):
+    """
+    Move a user into the named faction (None leaves all factions).
+
+    The faction is created on first use. Both the old and new factions'
+    aggregates are updated in the current database transaction.
+    """
+    faction = None
+    if normalize_faction_name(name):
+        faction, _ = get_or_create_faction(name)
+
+    new_id = faction.id if faction else None
+    if user.faction_id != new_id:
+        balance = user.balance or 0.0
+        adjust_faction(user.faction_id, members=-1, balance=-balance)
+        adjust_faction(new_id, members=1, balance=balance)
+        user.faction_id = new_id
+
+    user.faction = faction.name if faction else None
+    return faction
+
+
+def record_transfer(sender, receiver, amount):
+    """Move `amount` of faction balance from the sender's faction to the receiver's"""
+    if sender.faction_id == receiver.faction_id:
+        return
+    adjust_faction(sender.faction_id, balance=-amount)
+    adjust_faction(receiver.faction_id, balance=amount)
+
+
+def record_bulk_credits(source_id, credits):
+    """
+    Apply faction balance changes for a chunk of payouts.
+
+    Args:
+        source_id: Paying user id
+        credits: List of (user_id, amount) pairs
+    """
+    user_ids = [user_id for user_id, _ in credits] + [source_id]
+    faction_of = dict(db.session.query(User.id, User.faction_id).filter(User.id.in_(user_ids)))
+
+    deltas = {}
+    total = 0.0
+    for user_id, amount in credits:
+        faction_id = faction_of.get(user_id)
+        if faction_id is not None:
+            deltas[faction_id] = deltas.get(faction_id, 0.0) + amount
+        total += amount
+
+    source_faction = faction_of.get(source_id)
+    if source_faction is not None:
+        deltas[source_faction] = deltas.get(source_faction, 0.0) - total
+
+    if deltas:
+        factions = Faction.__table__
+        db.session.execute(
+            factions.update()
+            .where(factions.c.id == bindparam('b_id'))
+            .values(total_balance=factions.c.total_balance + bindparam('b_delta')),
+            [{'b_id': faction_id, 'b_delta': delta} for faction_id, delta in deltas.items()]
+        )
+
+
+def list_factions():
+    """All factions, ordered by name"""
+    return Faction.query.order_by(Faction.name).all()
+
+
+def backfill_factions():
+    """
+    Create faction rows for legacy free-text User.faction values and link users.
+
+    Users are linked in throttled id-range batches, so this can run against
+    a live database. It runs as part of migration 2, before users.version
+    exists on older databases, so account versions are only bumped when the
+    column is there.
+
+    Returns:
+        Number of users linked
+    """
+    from .migrations import backfill, column_exists
+
+    names = [row[0] for row in db.session.query(User.faction).filter(
+        User.faction.isnot(None),
+        User.faction_id.is_(None)
+    ).distinct()]
+
+    assignments = 'faction_id = :faction_id, faction = :canonical'
+    if column_exists('users', 'version'):
+        assignments += ', version = version + 1'
+
+    linked = 0
+    for name in names:
+        if not normalize_faction_name(name):
+            continue
+        faction, _ = get_or_create_faction(name)
+        db.session.commit()
+        linked += backfill(
+            'users',
+            assignments,
+            'faction = :name AND faction_id IS NULL',
+            {'faction_id': faction.id, 'canonical': faction.name, 'name': name}
+        )
+
+    return linked
+
+
+def faction_totals(faction_id):
+    """(member count, total balance) of a faction, summed from users"""
+    return db.session.query(
+        func.count(User.id),
+        func.coalesce(func.sum(User.balance), 0.0)
+    ).filter(User.faction_id == faction_id).one()
+
+
+def rebuild_faction_aggregates():
+    """
+    Recompute member_count and total_balance for every faction from users.
+
+    Each faction is recomputed with an index range scan on users.faction_id.
+
+    Returns:
+        Number of factions rebuilt
+    """
+    factions = list_factions()
+    for faction in factions:
+        count, total = faction_totals(faction.id)
+        faction.member_count = count
+        faction.total_balance = total
+        db.session.commit()
+    return len(factions)
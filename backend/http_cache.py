@@ -0,0 +1,43 @@
+"""
+HTTP caching helpers - ETags and conditional GET
+
+Views compute a cheap version stamp first (an account's version counter,
+the newest row id of an append-only table) and only load and serialize
+rows when the client's copy is out of date.
+"""
+from flask import request, make_response
+from sqlalchemy import func
+from .models import db, User
+
+
+def make_etag(*parts):
+    """Build an ETag value from version parts (e.g. 'acct', 42, 'limit=10')"""
+    return '-'.join(str(part) for part in parts)
+
+
+def conditional_response(etag, build, cache_control='private, no-cache'):
+    """
+    Answer 304 Not Modified when the client already has `etag`.
+
+    Args:
+        etag: Current ETag value (unquoted)
+        build: Callable returning the full response; only called when needed
+        cache_control: Cache-Control header for both outcomes
+    """
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def account_version(user_id):
+    """An account's version counter, read without loading the user row"""
+    return db.session.query(User.version).filter(User.id == user_id).scalar()
+
+
+def table_watermark(column):
+    """Largest value of `column` (e.g. the newest id of an append-only table)"""
+    return db.session.query(func.max(column)).scalar() or 0
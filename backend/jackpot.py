@@ -0,0 +1,151 @@
+"""
+Progressive jackpot - funded by a slice of every paid spin
+
+Contributions accumulate in per-worker counters and are added to the single
+jackpot row every JACKPOT_FLUSH_INTERVAL seconds, so spins never contend on
+that row. A jackpot win locks the row, adds the winning worker's pending
+contributions, takes the whole pot and resets it to the seed in the same
+database transaction as the payout. Contributions still pending in other
+workers land on the reset pot and go to the next winner.
+"""
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from .models import db, Jackpot
+
+JACKPOT_ID = 1
+
+# Seconds between flushes of a worker's pending contributions
+JACKPOT_FLUSH_INTERVAL = 5.0
+
+
+class JackpotAccumulator:
+    """Per-worker pending jackpot contributions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = 0.0
+        self._last_flush = time.monotonic()
+
+    def add(self, amount):
+        with self._lock:
+            self._pending += amount
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def due(self, interval=JACKPOT_FLUSH_INTERVAL):
+        return time.monotonic() - self._last_flush >= interval
+
+    def take(self):
+        """Remove and return all pending contributions"""
+        with self._lock:
+            amount, self._pending = self._pending, 0.0
+            self._last_flush = time.monotonic()
+            return amount
+
+    def restore(self, amount):
+        """Put back contributions whose flush or claim was rolled back"""
+        with self._lock:
+            self._pending += amount
+
+
+# One accumulator per worker process
+jackpot_pool = JackpotAccumulator()
+
+
+def jackpot_enabled():
+    return current_app.config.get('JACKPOT_ENABLED', False)
+
+
+def _seed():
+    return current_app.config.get('JACKPOT_SEED', 0.0)
+
+
+def contribute(bet_amount):
+    """Add the configured slice of a paid bet to this worker's pending total"""
+    if not jackpot_enabled() or bet_amount <= 0:
+        return
+    percent = current_app.config.get('JACKPOT_CONTRIBUTION_PERCENT', 0.0)
+    jackpot_pool.add(bet_amount * percent / 100.0)
+
+
+def flush_jackpot(force=False):
+    """
+    Add this worker's pending contributions to the jackpot row.
+
+    Args:
+        force: Flush even if the flush interval hasn't elapsed
+
+    Returns:
+        Amount flushed
+    """
+    if not force and not jackpot_pool.due():
+        return 0.0
+
+    amount = jackpot_pool.take()
+    if amount <= 0:
+        return 0.0
+
+    jackpots = Jackpot.__table__
+    try:
+        result = db.session.execute(
+            jackpots.update()
+            .where(jackpots.c.id == JACKPOT_ID)
+            .values(amount=jackpots.c.amount + amount, updated_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            db.session.add(Jackpot(id=JACKPOT_ID, amount=_seed() + amount))
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        jackpot_pool.restore(amount)
+        raise
+    return amount
+
+
+def claim_jackpot(winner_id):
+    """
+    Take the whole pot for a winning spin and reset it to the seed.
+
+    The jackpot row stays locked until the caller commits the payout; if the
+    payout fails the caller must roll back and call release_claim().
+
+    Returns:
+        (amount, pending) - the exact pot won and this worker's pending
+        contributions included in it
+    """
+    pending = jackpot_pool.take()
+
+    jackpot = Jackpot.query.filter_by(id=JACKPOT_ID).with_for_update().first()
+    if not jackpot:
+        jackpot = Jackpot(id=JACKPOT_ID, amount=_seed())
+        db.session.add(jackpot)
+
+    amount = round(jackpot.amount + pending, 2)
+    jackpot.amount = _seed()
+    jackpot.last_won_amount = amount
+    jackpot.last_won_at = datetime.utcnow()
+    jackpot.last_winner_id = winner_id
+    return amount, pending
+
+
+def release_claim(pending):
+    """Return a rolled-back claim's pending contributions to this worker"""
+    jackpot_pool.restore(pending)
+
+
+def get_jackpot():
+    """Current jackpot for display (includes this worker's unflushed contributions)"""
+    jackpot = Jackpot.query.filter_by(id=JACKPOT_ID).first()
+    amount = (jackpot.amount if jackpot else _seed()) + jackpot_pool.pending()
+    return {
+        'enabled': jackpot_enabled(),
+        'amount': round(amount, 2),
+        'last_won_amount': jackpot.last_won_amount if jackpot else None,
+        'last_won_at': jackpot.last_won_at.isoformat() if jackpot and jackpot.last_won_at else None,
+        'last_winner': jackpot.last_winner.character_name if jackpot and jackpot.last_winner else None
+    }
@@ -0,0 +1,283 @@
+"""
+Leaderboards - bounded top-K boards maintained as spins and transfers settle
+
+Each worker collects updates locally (no database access on the hot path).
+Every SYNC_INTERVAL seconds the worker merges its updates into the shared
+leaderboard_snapshots rows and reloads them, so every worker serves the same
+snapshot version. Boards are recomputed from the database on first use and
+whenever an incremental merge can no longer be trusted (e.g. a top balance
+went down, so someone outside the board may now belong on it).
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from .models import (
+    db, User, Faction, PlayerGameStats, LeaderboardSnapshot, SYSTEM_ACCOUNT, HOUSE_ACCOUNT
+)
+
+LEADERBOARD_SIZE = 10
+
+# Seconds between merges of a worker's local updates into the shared snapshots
+SYNC_INTERVAL = 5.0
+
+# Minimum seconds between recomputations of a board from the database
+MIN_REBUILD_INTERVAL = 30.0
+
+# Seconds browsers may reuse a leaderboard response
+CACHE_MAX_AGE = 5
+
+GAMES = ('glitch_grid', 'starlight_smuggler')
+
+EXCLUDED_ACCOUNTS = (SYSTEM_ACCOUNT, HOUSE_ACCOUNT)
+
+
+def _biggest_wins_board(game_name):
+    return f'biggest_win:{game_name}'
+
+
+# board name -> merge rule: 'max' keeps a key's best value, 'latest' its newest
+BOARDS = {_biggest_wins_board(game): 'max' for game in GAMES}
+BOARDS['richest'] = 'latest'
+BOARDS['top_factions'] = 'latest'
+
+
+# ----------------------------------------------------------------------
+# Recompute from the database
+# ----------------------------------------------------------------------
+
+def _rebuild_biggest_wins(game_name):
+    rows = db.session.query(
+        PlayerGameStats.user_id,
+        User.character_name,
+        User.faction,
+        PlayerGameStats.biggest_win,
+        PlayerGameStats.last_played
+    ).join(User, User.id == PlayerGameStats.user_id).filter(
+        PlayerGameStats.game_name == game_name,
+        PlayerGameStats.biggest_win > 0
+    ).order_by(PlayerGameStats.biggest_win.desc()).limit(LEADERBOARD_SIZE)
+    return [
+        {'key': user_id, 'name': name, 'faction': faction, 'value': round(win, 2),
+         'at': last_played.isoformat() if last_played else None}
+        for user_id, name, faction, win, last_played in rows
+    ]
+
+
+def _rebuild_richest():
+    rows = db.session.query(
+        User.id, User.character_name, User.faction, User.balance
+    ).filter(
+        ~User.account_number.in_(EXCLUDED_ACCOUNTS)
+    ).order_by(User.balance.desc()).limit(LEADERBOARD_SIZE)
+    return [
+        {'key': user_id, 'name': name, 'faction': faction, 'value': round(balance, 2)}
+        for user_id, name, faction, balance in rows
+    ]
+
+
+def _rebuild_top_factions():
+    rows = db.session.query(
+        Faction.id, Faction.name, Faction.member_count, Faction.total_balance
+    ).order_by(Faction.total_balance.desc()).limit(LEADERBOARD_SIZE)
+    return [
+        {'key': faction_id, 'name': name, 'members': members, 'value': round(total, 2)}
+        for faction_id, name, members, total in rows
+    ]
+
+
+def rebuild_board(board):
+    """Recompute one board from the database"""
+    if board == 'richest':
+        return _rebuild_richest()
+    if board == 'top_factions':
+        return _rebuild_top_factions()
+    return _rebuild_biggest_wins(board.split(':', 1)[1])
+
+
+# ----------------------------------------------------------------------
+# Per-worker state
+# ----------------------------------------------------------------------
+
+def _merge(entries, updates, rule):
+    """
+    Merge local updates into a board.
+
+    Returns:
+        (entries, trusted) - trusted is False when a 'latest' board lost
+        value on an entry, meaning an unseen key may now outrank it.
+    """
+    by_key = {entry['key']: entry for entry in entries}
+    trusted = True
+    for key, update in updates.items():
+        current = by_key.get(key)
+        if current is None:
+            by_key[key] = update
+        elif rule == 'max':
+            if update['value'] > current['value']:
+                by_key[key] = update
+        else:
+            if update['value'] < current['value']:
+                trusted = False
+            by_key[key] = update
+
+    merged = sorted(by_key.values(), key=lambda e: e['value'], reverse=True)
+    if not trusted and len(merged) <= LEADERBOARD_SIZE:
+        # Board isn't full, so nobody is missing from it
+        trusted = True
+    return merged[:LEADERBOARD_SIZE], trusted
+
+
+class Leaderboards:
+    """Per-worker leaderboard cache plus pending local updates"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {board: {} for board in BOARDS}
+        self._stale = set()
+        self._snapshot = {}
+        self._version = 0
+        self._last_sync = 0.0
+
+    def reset(self):
+        with self._lock:
+            self._pending = {board: {} for board in BOARDS}
+            self._stale = set()
+            self._snapshot = {}
+            self._version = 0
+            self._last_sync = 0.0
+
+    def _offer(self, board, key, entry):
+        """Keep an update only if it could place on the board"""
+        with self._lock:
+            pending = self._pending[board]
+            current = self._snapshot.get(board) or []
+            on_board = any(e['key'] == key for e in current)
+            cutoff = current[-1]['value'] if len(current) >= LEADERBOARD_SIZE else None
+            if on_board or cutoff is None or entry['value'] > cutoff:
+                existing = pending.get(key)
+                if BOARDS[board] == 'latest' or existing is None or entry['value'] > existing['value']:
+                    pending[key] = entry
+
+    def record_win(self, game_name, user_id, name, faction, amount):
+        if amount <= 0:
+            return
+        self._offer(_biggest_wins_board(game_name), user_id, {
+            'key': user_id, 'name': name, 'faction': faction,
+            'value': round(amount, 2), 'at': datetime.utcnow().isoformat()
+        })
+
+    def record_balance(self, user_id, account_number, name, faction, balance):
+        if account_number in EXCLUDED_ACCOUNTS:
+            return
+        self._offer('richest', user_id, {
+            'key': user_id, 'name': name, 'faction': faction, 'value': round(balance, 2)
+        })
+
+    def mark_stale(self, board):
+        """Recompute a board at the next sync (e.g. after bulk balance changes)"""
+        with self._lock:
+            self._stale.add(board)
+
+    def _merge_into_snapshots(self, pending, stale, starting):
+        """Merge updates into the locked snapshot rows; returns (version, boards)"""
+        now = datetime.utcnow()
+        rows = {
+            row.board: row for row in LeaderboardSnapshot.query.filter(
+                LeaderboardSnapshot.board.in_(list(BOARDS))
+            ).order_by(LeaderboardSnapshot.board).with_for_update()
+        }
+
+        snapshot = {}
+        version = 0
+        for board, rule in BOARDS.items():
+            row = rows.get(board)
+            if row is None:
+                row = LeaderboardSnapshot(board=board, entries='[]', version=0)
+                db.session.add(row)
+
+            entries, trusted = _merge(json.loads(row.entries or '[]'), pending[board], rule)
+
+            # Faction totals only change in the database, so they are always
+            # re-read; other boards are recomputed when merging can't be
+            # trusted, and on a worker's first sync in case they are left
+            # over from an earlier run.
+            rebuild_due = (
+                row.rebuilt_at is None
+                or (now - row.rebuilt_at).total_seconds() >= MIN_REBUILD_INTERVAL
+            )
+            if board == 'top_factions' or board in stale or (rebuild_due and (starting or not trusted)):
+                entries = rebuild_board(board)
+                row.rebuilt_at = now
+
+            encoded = json.dumps(entries)
+            if encoded != row.entries:
+                row.entries = encoded
+                row.version = (row.version or 0) + 1
+                row.updated_at = now
+            snapshot[board] = entries
+            version += row.version
+
+        db.session.commit()
+        return version, snapshot
+
+    def sync(self, force=False):
+        """
+        Merge local updates into the shared snapshots and reload them.
+
+        Snapshot rows are locked while merging so concurrent workers never
+        overwrite each other's updates.
+        """
+        if not force and self._snapshot and time.monotonic() - self._last_sync < SYNC_INTERVAL:
+            return
+
+        with self._lock:
+            pending, self._pending = self._pending, {board: {} for board in BOARDS}
+            stale, self._stale = self._stale, set()
+            starting = not self._snapshot
+
+        try:
+            try:
+                version, snapshot = self._merge_into_snapshots(pending, stale, starting)
+            except IntegrityError:
+                # Another worker created the snapshot rows first
+                db.session.rollback()
+                version, snapshot = self._merge_into_snapshots(pending, stale, starting)
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                for board, updates in pending.items():
+                    for key, entry in updates.items():
+                        self._pending[board].setdefault(key, entry)
+                self._stale |= stale
+            raise
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._version = version
+            self._last_sync = time.monotonic()
+
+    def read(self):
+        """Current shared snapshot as (version, boards)"""
+        self.sync()
+        with self._lock:
+            return self._version, dict(self._snapshot)
+
+
+# One instance per worker process
+leaderboards = Leaderboards()
+
+
+def get_leaderboards():
+    """Public leaderboard payload plus its snapshot version"""
+    version, boards = leaderboards.read()
+
+    def public(entries):
+        return [{k: v for k, v in entry.items() if k != 'key'} for entry in entries]
+
+    return version, {
+        'biggest_wins': {game: public(boards.get(_biggest_wins_board(game), [])) for game in GAMES},
+        'richest': public(boards.get('richest', [])),
+        'top_factions': public(boards.get('top_factions', []))
+    }
@@ -0,0 +1,361 @@
+"""
+Metrics - Prometheus text exposition shared across gunicorn workers
+
+Each worker keeps its counters and histograms in memory and, at most every
+METRICS_FLUSH_INTERVAL seconds, writes a snapshot to METRICS_DIR/<pid>.json.
+GET /metrics sums the snapshots of every worker, so a scrape that lands on
+any worker sees the whole pod. Counters of exited workers keep counting
+towards the totals; gauges only come from workers that are still running.
+
+Disabled (METRICS_ENABLED=false) every hook is a single attribute check.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from flask import request, g, has_request_context
+
+# Seconds between writes of a worker's snapshot
+METRICS_FLUSH_INTERVAL = 5
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'neobank_http_request_duration_seconds': (
+        'histogram', 'Request latency by route', LATENCY_BUCKETS),
+    'neobank_http_request_db_queries': (
+        'histogram', 'Database queries issued per request', QUERY_COUNT_BUCKETS),
+    'neobank_http_request_db_seconds': (
+        'histogram', 'Time spent in database queries per request', LATENCY_BUCKETS),
+    'neobank_transaction_commit_seconds': (
+        'histogram', 'Commit latency of ledger transactions', LATENCY_BUCKETS),
+    'neobank_bcrypt_seconds': (
+        'histogram', 'Time spent hashing and verifying passwords', LATENCY_BUCKETS),
+    'neobank_api_key_auth_seconds': (
+        'histogram', 'API key validation latency', LATENCY_BUCKETS),
+    'neobank_api_key_requests_total': (
+        'counter', 'API key authentications by outcome', None),
+    'neobank_spins_total': ('counter', 'Casino spins by game', None),
+    'neobank_wagered_total': ('counter', 'Credits wagered by game', None),
+    'neobank_paid_out_total': ('counter', 'Credits paid out by game', None),
+    'neobank_cache_requests_total': ('counter', 'Cache lookups by cache and result', None),
+    'neobank_admission_requests_total': (
+        'counter', 'Admission decisions by priority and outcome', None),
+    'neobank_admission_deferred_total': ('counter', 'Background flushes deferred under load', None),
+    'neobank_admission_in_flight': ('gauge', 'Requests in flight', None),
+    'neobank_db_pool_checked_out': ('gauge', 'Database connections checked out', None),
+    'neobank_db_pool_capacity': ('gauge', 'Database connections the pool may open', None),
+    'neobank_db_pool_wait_seconds': ('gauge', 'Smoothed database connection checkout wait', None),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+_NO_TIMER = nullcontext()
+
+
+class MetricsRegistry:
+    """This worker's counters and histograms, plus gauges read at snapshot time"""
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._last_flush = 0.0
+
+    def configure(self, enabled, directory):
+        self.enabled = enabled
+        self.directory = directory
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def add_collector(self, collector):
+        """Register a callable returning [(name, labels, value), ...] read at snapshot time"""
+        self._collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        key = (name, _labels_key(labels))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                # Bucket counts, then sum and count
+                series = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def timer(self, name, **labels):
+        """Context manager observing the elapsed seconds into a histogram"""
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, name, labels)
+
+    def snapshot(self):
+        collected = []
+        for collector in self._collectors:
+            try:
+                collected.extend(collector())
+            except Exception as e:
+                print(f"⚠️  Metrics collector failed: {e}")
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, list(labels), value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(series)]
+                               for (name, labels), series in self._histograms.items()],
+                'collected': [[name, sorted(labels.items()), value]
+                              for name, labels, value in collected]
+            }
+
+    def flush(self):
+        """Write this worker's snapshot for the other workers to read"""
+        self._last_flush = time.monotonic()
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def maybe_flush(self):
+        if self.enabled and time.monotonic() - self._last_flush >= METRICS_FLUSH_INTERVAL:
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️  Could not write metrics snapshot: {e}")
+
+    def _worker_snapshots(self):
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue  # Being replaced; its counters show up next scrape
+
+    def render(self):
+        """All workers' metrics in the Prometheus text format"""
+        self.flush()
+        counters, histograms, gauges = {}, {}, {}
+
+        for worker in self._worker_snapshots():
+            alive = _pid_alive(worker['pid'])
+            for name, labels, value in worker['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, series in worker['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+            for name, labels, value in worker['collected']:
+                key = (name, tuple(map(tuple, labels)))
+                if METRICS[name][0] == 'counter':
+                    counters[key] = counters.get(key, 0) + value
+                elif alive:
+                    gauges[key] = gauges.get(key, 0) + value
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for (series_name, labels), series in sorted(histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets, series):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {series[-1]}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {series[-2]}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {series[-1]}')
+            else:
+                values = counters if kind == 'counter' else gauges
+                for (series_name, labels), value in sorted(values.items()):
+                    if series_name == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+# One registry per worker process
+metrics = MetricsRegistry()
+
+
+def count_spin(game, wagered, paid_out):
+    """Record a settled spin"""
+    if not metrics.enabled:
+        return
+    metrics.inc('neobank_spins_total', game=game)
+    metrics.inc('neobank_wagered_total', wagered, game=game)
+    metrics.inc('neobank_paid_out_total', paid_out, game=game)
+
+
+# (active, record) pairs sharing one pair of engine hooks, so each statement
+# is timed once however many modules observe it
+_query_observers = []
+_query_hooks_lock = threading.Lock()
+_query_hooks_installed = False
+
+
+def add_query_observer(active, record):
+    """
+    Receive the timing of every statement executed in a request.
+
+    active() says whether statements should be timed at all (checked before
+    each one); record(statement, seconds) runs after it, in the request.
+    """
+    global _query_hooks_installed
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _query_hooks_lock:
+        _query_observers.append((active, record))
+        if not _query_hooks_installed:
+            event.listen(Engine, 'before_cursor_execute', _on_query_start)
+            event.listen(Engine, 'after_cursor_execute', _on_query_end)
+            _query_hooks_installed = True
+
+
+def _on_query_start(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and any(active() for active, _ in _query_observers) and has_request_context():
+        context.query_started = time.perf_counter()
+
+
+def _on_query_end(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_started', None)
+    if started is None or not has_request_context():
+        return
+    seconds = time.perf_counter() - started
+    for active, record in _query_observers:
+        if active():
+            record(statement, seconds)
+
+
+def _record_request_query(statement, seconds):
+    g.db_queries = g.get('db_queries', 0) + 1
+    g.db_seconds = g.get('db_seconds', 0.0) + seconds
+
+
+def _collect_runtime():
+    """Gauges and counters owned by other modules, read when a snapshot is taken"""
+    from .admission import admission
+    from .models import db
+    from .txcache import recent_transactions_cache
+
+    def collect():
+        samples = []
+        cache = recent_transactions_cache.stats()
+        samples.append(('neobank_cache_requests_total',
+                        {'cache': 'recent_transactions', 'result': 'hit'}, cache['hits']))
+        samples.append(('neobank_cache_requests_total',
+                        {'cache': 'recent_transactions', 'result': 'miss'}, cache['misses']))
+
+        state = admission.stats()
+        for outcome in ('admitted', 'shed'):
+            for level, count in state[outcome].items():
+                samples.append(('neobank_admission_requests_total',
+                                {'priority': level, 'outcome': outcome}, count))
+        samples.append(('neobank_admission_deferred_total', {}, state['deferred']))
+        samples.append(('neobank_admission_in_flight', {}, state['in_flight']))
+        samples.append(('neobank_db_pool_wait_seconds', {}, state['pool_wait_ms'] / 1000))
+
+        pool = db.engine.pool
+        if hasattr(pool, 'checkedout'):
+            samples.append(('neobank_db_pool_checked_out', {}, pool.checkedout()))
+            samples.append(('neobank_db_pool_capacity', {}, pool.size() + max(pool._max_overflow, 0)))
+        return samples
+
+    return collect
+
+
+def init_metrics(app):
+    """Install request and query instrumentation (inert unless METRICS_ENABLED is set)"""
+    metrics.configure(app.config.get('METRICS_ENABLED', False), app.config['METRICS_DIR'])
+
+    add_query_observer(lambda: metrics.enabled, _record_request_query)
+    metrics.add_collector(_collect_runtime())
+
+    @app.before_request
+    def start_request_timer():
+        if metrics.enabled:
+            g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {'route': route, 'method': request.method, 'status': response.status_code}
+        metrics.observe('neobank_http_request_duration_seconds',
+                        time.perf_counter() - started, **labels)
+        metrics.observe('neobank_http_request_db_queries', g.get('db_queries', 0), route=route)
+        metrics.observe('neobank_http_request_db_seconds', g.get('db_seconds', 0.0), route=route)
+        metrics.maybe_flush()
+        return response
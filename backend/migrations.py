@@ -0,0 +1,279 @@
+"""
+Migrations - ordered, versioned schema changes for live databases
+
+Each migration is a function registered with @migration(version, name) and
+is recorded in schema_migrations once applied; `python migrate.py` runs the
+pending ones in version order under MIGRATION_LOCK_ID, its own advisory lock
+rather than startup's. Startup applies pending migrations too, taking the
+migration lock inside its own, so the two never run migrations at once.
+Fresh databases get the current schema from create_all() and are marked
+fully migrated when they are initialized.
+
+Migrations can't run in one transaction (PostgreSQL builds indexes
+CONCURRENTLY outside of one), so each must be safe to re-run after a
+failure part way. The helpers are written that way:
+
+  add_column()   ALTER TABLE with a short lock_timeout, retried, so it never
+                 queues behind a long transaction and blocks traffic
+  create_index() CREATE INDEX CONCURRENTLY, replacing an invalid index left
+                 by an interrupted build
+  backfill()     UPDATE in primary-key batches, each its own transaction,
+                 with a pause between batches
+
+To roll out a denormalized column during an event: add it nullable (or with
+a constant default; PostgreSQL 11+ does that without a rewrite), backfill
+it, then index it. On SQLite the same helpers fall back to plain DDL.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+# The models (and with them Flask) are imported inside the functions, so
+# startup can read MIGRATIONS for its fast path without loading them
+
+# Rows updated per backfill transaction
+BACKFILL_BATCH_SIZE = 5000
+
+# Seconds to sleep between backfill batches, letting live traffic through
+BACKFILL_PAUSE = 0.05
+
+# How long ALTER TABLE may wait for its lock before giving up and retrying
+DDL_LOCK_TIMEOUT = '5s'
+DDL_ATTEMPTS = 5
+
+# pg_advisory_lock key serializing migration runs ("NeoM"); separate from
+# startup's, so booting pods don't wait for an index build
+MIGRATION_LOCK_ID = 0x4E656F4D
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register a migration; versions must be unique"""
+    def decorator(f):
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, name, f))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return f
+    return decorator
+
+
+# ============================================================================
+# Helpers
+# ============================================================================
+
+def column_exists(table, column):
+    from .models import db
+    return column in [c['name'] for c in inspect(db.engine).get_columns(table)]
+
+
+def add_column(table, column, ddl):
+    """
+    ALTER TABLE table ADD COLUMN column ddl, unless it exists.
+
+    Returns:
+        True if the column was added
+    """
+    from .models import db
+    if column_exists(table, column):
+        return False
+
+    statement = f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'
+    if db.engine.dialect.name != 'postgresql':
+        with db.engine.begin() as connection:
+            connection.execute(text(statement))
+        return True
+
+    for attempt in range(1, DDL_ATTEMPTS + 1):
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+                connection.execute(text(statement))
+            return True
+        except OperationalError as e:
+            # 55P03: lock not granted in time; let the blocking transaction finish
+            if getattr(e.orig, 'pgcode', None) != '55P03' or attempt == DDL_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+
+def create_index(name, table, columns, using=None):
+    """
+    Create an index without blocking writes (CONCURRENTLY on PostgreSQL).
+
+    Args:
+        columns: Column list as SQL, e.g. 'from_account_id, timestamp'
+        using: Index method, e.g. 'gin'
+
+    Returns:
+        True if the index was built
+    """
+    from .models import db
+    method = f' USING {using}' if using else ''
+    if db.engine.dialect.name != 'postgresql':
+        if name in [index['name'] for index in inspect(db.engine).get_indexes(table)]:
+            return False
+        with db.engine.begin() as connection:
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table}{method} ({columns})'))
+        return True
+
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        valid = connection.execute(text(
+            "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+            "WHERE c.relname = :name"
+        ), {'name': name}).scalar()
+        if valid:
+            return False
+        if valid is not None:
+            # An interrupted concurrent build leaves an invalid index behind
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        connection.execute(text(f'CREATE INDEX CONCURRENTLY {name} ON {table}{method} ({columns})'))
+    return True
+
+
+def backfill(table, assignments, where, params=None, batch_size=None, pause=None, progress=None):
+    """
+    UPDATE table SET assignments WHERE where, one id range at a time.
+
+    Each batch is its own short transaction, so row locks are held briefly
+    and live writes interleave with the backfill; `where` must exclude rows
+    already done so a re-run picks up where it stopped.
+
+    Returns:
+        Number of rows updated
+    """
+    from .models import db
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    pause = BACKFILL_PAUSE if pause is None else pause
+    with db.engine.connect() as connection:
+        low, high = connection.execute(text(f'SELECT MIN(id), MAX(id) FROM {table}')).one()
+    if low is None:
+        return 0
+
+    statement = text(
+        f'UPDATE {table} SET {assignments} WHERE id BETWEEN :batch_low AND :batch_high AND ({where})'
+    )
+    updated = 0
+    for start in range(low, high + 1, batch_size):
+        with db.engine.begin() as connection:
+            result = connection.execute(statement, dict(
+                params or {}, batch_low=start, batch_high=start + batch_size - 1
+            ))
+        updated += result.rowcount
+        if progress:
+            progress(min(start + batch_size - 1, high), high)
+        if pause:
+            time.sleep(pause)
+    return updated
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+def applied_versions():
+    from .models import db, SchemaMigration
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return set(db.session.scalars(db.select(SchemaMigration.version)))
+
+
+def pending_migrations(target=None):
+    """(version, name, function) not yet applied, up to target, in order"""
+    applied = applied_versions()
+    return [
+        entry for entry in MIGRATIONS
+        if entry[0] not in applied and (target is None or entry[0] <= target)
+    ]
+
+
+def record_applied(version, name):
+    from .models import db, SchemaMigration
+    db.session.merge(SchemaMigration(version=version, name=name, applied_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def mark_all_applied():
+    """Record every migration as applied (for a database built by create_all)"""
+    for version, name, _ in pending_migrations():
+        record_applied(version, name)
+
+
+def run_migrations(target=None, progress=None):
+    """
+    Apply pending migrations in order, one process at a time.
+
+    Args:
+        target: Highest version to apply (default: all)
+        progress: Called with (version, name) before each migration
+
+    Returns:
+        List of (version, name, seconds) applied
+    """
+    from .startup import advisory_lock
+    done = []
+    with advisory_lock(MIGRATION_LOCK_ID):
+        for version, name, function in pending_migrations(target):
+            if progress:
+                progress(version, name)
+            started = time.monotonic()
+            function()
+            record_applied(version, name)
+            done.append((version, name, time.monotonic() - started))
+    return done
+
+
+# ============================================================================
+# Migrations
+# ============================================================================
+
+@migration(1, 'Add users.free_spins')
+def add_free_spins_column():
+    add_column('users', 'free_spins', 'INTEGER DEFAULT 0 NOT NULL')
+
+
+@migration(2, 'Add factions table and users.faction_id')
+def add_factions_table():
+    from .models import db, Faction
+    from .factions import backfill_factions, rebuild_faction_aggregates
+
+    Faction.__table__.create(db.engine, checkfirst=True)
+    add_column('users', 'faction_id', 'INTEGER REFERENCES factions(id)')
+    create_index('ix_users_faction_id', 'users', 'faction_id')
+    backfill_factions()
+    rebuild_faction_aggregates()
+
+
+@migration(3, 'Add users.version')
+def add_account_version_column():
+    add_column('users', 'version', 'INTEGER DEFAULT 0 NOT NULL')
+
+
+@migration(4, 'Index transactions by account and time')
+def add_transaction_history_indexes():
+    create_index('ix_transactions_from_account_timestamp', 'transactions', 'from_account_id, timestamp')
+    create_index('ix_transactions_to_account_timestamp', 'transactions', 'to_account_id, timestamp')
+
+
+@migration(5, 'Backfill account statistics')
+def backfill_account_stats():
+    from .models import db, AccountStats
+    from .transactions import rebuild_account_stats
+
+    # New activity keeps account_stats current; older ledger rows are counted
+    # here, one locked chunk of users per transaction, pausing in between
+    AccountStats.__table__.create(db.engine, checkfirst=True)
+    rebuild_account_stats(chunk_size=BACKFILL_BATCH_SIZE // 5,
+                          progress=lambda done, total: time.sleep(BACKFILL_PAUSE))
+
+
+@migration(6, 'Backfill player casino statistics')
+def backfill_player_casino_stats():
+    from .models import db, PlayerGameStats
+    from .analytics import backfill_player_stats
+
+    PlayerGameStats.__table__.create(db.engine, checkfirst=True)
+    backfill_player_stats(chunk_size=BACKFILL_BATCH_SIZE // 5,
+                          progress=lambda done, total: time.sleep(BACKFILL_PAUSE))
@@ -2,12 +2,20 @@
 Database models for NeoBank & Chrome Slots
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
 from datetime import datetime
 import secrets
 import string
 
 db = SQLAlchemy()
 
+# Built-in accounts that are not real characters
+SYSTEM_ACCOUNT = 'NC-SYST-EM00'
+HOUSE_ACCOUNT = 'NC-CASA-0000'
+
+# password_hash of accounts nobody logs in to (never a valid bcrypt hash)
+NO_LOGIN_HASH = '!no-login'
+
 def generate_account_number():
     """Generate a unique account number in NC-XXXX-XXXX format"""
     chars = string.ascii_uppercase + string.digits
@@ -23,6 +31,22 @@ def generate_api_key():
     """Generate a secure API key"""
     return secrets.token_urlsafe(32)
 
+def dialect_insert(table, dialect_name=None):
+    """
+    INSERT construct supporting ON CONFLICT for the active database.
+    
+    PostgreSQL and SQLite both support on_conflict_do_update/do_nothing,
+    but through their own dialect-specific insert() constructs.
+    """
+    dialect_name = dialect_name or db.engine.dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect_name}")
+    return insert(table)
+
 
 class User(db.Model):
     """User account model"""
@@ -32,11 +56,13 @@ class User(db.Model):
     character_name = db.Column(db.String(100), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     account_number = db.Column(db.String(20), unique=True, nullable=False, index=True)
-    faction = db.Column(db.String(50), nullable=True)
+    faction = db.Column(db.String(50), nullable=True)  # Display name, mirrors factions.name
+    faction_id = db.Column(db.Integer, db.ForeignKey('factions.id'), nullable=True, index=True)
     balance = db.Column(db.Float, default=1000.0, nullable=False)  # New users start with $1000
     is_admin = db.Column(db.Boolean, default=False)
     profile_picture = db.Column(db.String(255), nullable=True)  # URL or emoji for profile picture
     free_spins = db.Column(db.Integer, default=0, nullable=False)  # Available free spins for Starlight Smuggler
+    version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every visible account change (ETags)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -64,9 +90,31 @@ class User(db.Model):
         return data
 
 
+# Columns whose changes are visible in account or transaction payloads
+VERSIONED_USER_COLUMNS = (
+    'character_name', 'faction', 'faction_id', 'balance', 'is_admin', 'profile_picture', 'free_spins'
+)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_account_versions(session, flush_context, instances):
+    """Bump User.version in the same UPDATE as any visible change to the account"""
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[name].history.has_changes() for name in VERSIONED_USER_COLUMNS):
+            obj.version = User.version + 1
+
+
 class Transaction(db.Model):
     """Transaction records"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Newest-first history per account (migration 4 on older databases)
+        db.Index('ix_transactions_from_account_timestamp', 'from_account_id', 'timestamp'),
+        db.Index('ix_transactions_to_account_timestamp', 'to_account_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     from_account_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -90,6 +138,54 @@ class Transaction(db.Model):
         }
 
 
+class Faction(db.Model):
+    """Factions with incrementally maintained membership aggregates"""
+    __tablename__ = 'factions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    name_key = db.Column(db.String(50), unique=True, nullable=False, index=True)  # lower(name)
+    description = db.Column(db.String(255), nullable=True)
+    member_count = db.Column(db.Integer, default=0, nullable=False)
+    total_balance = db.Column(db.Float, default=0.0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    members = db.relationship('User', backref='faction_record', lazy='dynamic')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'faction': self.name,
+            'description': self.description,
+            'user_count': self.member_count,
+            'total_balance': round(self.total_balance, 2),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class AccountStats(db.Model):
+    """Per-account activity counters, maintained alongside every ledger write"""
+    __tablename__ = 'account_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    sent_count = db.Column(db.Integer, default=0, nullable=False)
+    received_count = db.Column(db.Integer, default=0, nullable=False)
+    total_sent = db.Column(db.Float, default=0.0, nullable=False)
+    total_received = db.Column(db.Float, default=0.0, nullable=False)
+    last_activity = db.Column(db.DateTime, nullable=True)
+    
+    user = db.relationship('User', backref=db.backref('stats', uselist=False))
+    
+    def to_dict(self):
+        return {
+            'sent_count': self.sent_count,
+            'received_count': self.received_count,
+            'total_sent': round(self.total_sent, 2),
+            'total_received': round(self.total_received, 2),
+            'last_activity': self.last_activity.isoformat() if self.last_activity else None
+        }
+
+
 class APIKey(db.Model):
     """API keys for external system integration"""
     __tablename__ = 'api_keys'
@@ -158,3 +254,124 @@ class CasinoConfig(db.Model):
             'payout_percentage': self.payout_percentage,
             'updated_at': self.updated_at.isoformat()
         }
+
+
+class CasinoRollup(db.Model):
+    """Hourly and daily per-game casino aggregates"""
+    __tablename__ = 'casino_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('game_name', 'period', 'bucket_start', name='uq_casino_rollups_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    game_name = db.Column(db.String(50), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False, index=True)
+    spins = db.Column(db.Integer, default=0, nullable=False)
+    free_spins_played = db.Column(db.Integer, default=0, nullable=False)
+    wagered = db.Column(db.Float, default=0.0, nullable=False)
+    paid_out = db.Column(db.Float, default=0.0, nullable=False)
+    free_spins_awarded = db.Column(db.Integer, default=0, nullable=False)
+    unique_players = db.Column(db.Integer, default=0, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'game_name': self.game_name,
+            'period': self.period,
+            'bucket_start': self.bucket_start.isoformat(),
+            'spins': self.spins,
+            'free_spins_played': self.free_spins_played,
+            'wagered': round(self.wagered, 2),
+            'paid_out': round(self.paid_out, 2),
+            'rtp': round(self.paid_out / self.wagered * 100, 2) if self.wagered else None,
+            'free_spins_awarded': self.free_spins_awarded,
+            'unique_players': self.unique_players
+        }
+
+
+class CasinoRollupPlayer(db.Model):
+    """Players seen per rollup bucket (backs CasinoRollup.unique_players)"""
+    __tablename__ = 'casino_rollup_players'
+    
+    game_name = db.Column(db.String(50), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+
+
+class PlayerGameStats(db.Model):
+    """Lifetime per-player, per-game casino counters"""
+    __tablename__ = 'player_game_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    game_name = db.Column(db.String(50), primary_key=True)
+    spins = db.Column(db.Integer, default=0, nullable=False)
+    total_wagered = db.Column(db.Float, default=0.0, nullable=False)
+    total_won = db.Column(db.Float, default=0.0, nullable=False)
+    biggest_win = db.Column(db.Float, default=0.0, nullable=False)
+    free_spins_used = db.Column(db.Integer, default=0, nullable=False)
+    last_played = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'game_name': self.game_name,
+            'spins': self.spins,
+            'total_wagered': round(self.total_wagered, 2),
+            'total_won': round(self.total_won, 2),
+            'net': round(self.total_won - self.total_wagered, 2),
+            'biggest_win': round(self.biggest_win, 2),
+            'free_spins_used': self.free_spins_used,
+            'last_played': self.last_played.isoformat() if self.last_played else None
+        }
+
+
+class LeaderboardSnapshot(db.Model):
+    """Shared leaderboard state, merged from every worker's local updates"""
+    __tablename__ = 'leaderboard_snapshots'
+    
+    board = db.Column(db.String(50), primary_key=True)
+    entries = db.Column(db.Text, nullable=False, default='[]')  # JSON list, best first
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rebuilt_at = db.Column(db.DateTime, nullable=True)
+
+
+class Jackpot(db.Model):
+    """The progressive jackpot pot (a single row)"""
+    __tablename__ = 'jackpots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    amount = db.Column(db.Float, default=0.0, nullable=False)
+    last_won_amount = db.Column(db.Float, nullable=True)
+    last_won_at = db.Column(db.DateTime, nullable=True)
+    last_winner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    last_winner = db.relationship('User', foreign_keys=[last_winner_id])
+
+
+class RateLimitCounter(db.Model):
+    """Fixed-window rate limit counters shared by all workers"""
+    __tablename__ = 'rate_limit_counters'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    expires_at = db.Column(db.Float, nullable=False, index=True)  # Unix time the window ends
+
+
+class SchemaVersion(db.Model):
+    """Version the database was last initialized at (a single row)"""
+    __tablename__ = 'schema_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    initialized_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SchemaMigration(db.Model):
+    """Migrations applied to this database (see backend/migrations.py)"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,160 @@
+"""
+Live profiling - stack sampling and heap snapshots for one worker
+
+sample_stacks() runs in the requesting thread and samples every other
+thread's Python stack with sys._current_frames(), so it works in the
+threaded gunicorn workers without signals or a restart. Stacks come back
+collapsed ("outer;inner count" lines) for flamegraph.pl or speedscope.
+Threads parked in a lock, queue or select are skipped unless asked for.
+
+take_heap_snapshot() starts tracemalloc on first use; later calls return
+the largest allocation sites and the difference to the previous snapshot.
+Both only ever see the worker that served the request.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Longest profile a single request may run; with one profile at a time per
+# worker, that is the most a profile holds of one request thread
+PROFILE_MAX_SECONDS = 30
+
+# Seconds between samples (100 Hz)
+PROFILE_DEFAULT_INTERVAL = 0.01
+
+# Allocation sites listed per heap snapshot
+HEAP_TOP_STATS = 25
+
+# Frames tracemalloc keeps per allocation
+HEAP_TRACE_FRAMES = 10
+
+# (file, function) of a leaf frame that means the thread is waiting, not working
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('queue.py', 'get'),
+}
+
+_profile_lock = threading.Lock()
+_heap_lock = threading.Lock()
+_previous_snapshot = None
+
+
+def _short_path(filename):
+    """site-packages/flask/app.py -> flask/app.py; backend/casino.py stays as is"""
+    for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    parts = filename.split(os.sep)
+    return os.sep.join(parts[-2:])
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+def sample_stacks(seconds, interval=PROFILE_DEFAULT_INTERVAL, include_idle=False):
+    """
+    Sample all other threads' stacks for `seconds`.
+
+    Returns:
+        ((Counter of collapsed stack -> samples, number of sampling rounds), error) tuple
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None, "A profile is already running in this worker"
+
+    try:
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        rounds = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread or (not include_idle and _is_idle(frame)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stacks[';'.join(reversed(stack))] += 1
+            rounds += 1
+            time.sleep(interval)
+        return (stacks, rounds), None
+    finally:
+        _profile_lock.release()
+
+
+def collapse(stacks):
+    """Collapsed-stack text, busiest stacks first"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def _stat_to_dict(stat):
+    frame = stat.traceback[0]
+    data = {
+        'location': f'{_short_path(frame.filename)}:{frame.lineno}',
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count
+    }
+    if hasattr(stat, 'size_diff'):
+        data['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+        data['count_diff'] = stat.count_diff
+    return data
+
+
+def take_heap_snapshot(limit=HEAP_TOP_STATS, frames=HEAP_TRACE_FRAMES):
+    """Largest allocation sites now, and growth since the previous snapshot"""
+    global _previous_snapshot
+
+    with _heap_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _previous_snapshot = None
+            return {
+                'tracing': True,
+                'message': 'Allocation tracing started; take another snapshot to see allocations',
+                'worker_pid': os.getpid()
+            }
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            'tracing': True,
+            'traced_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'top': [_stat_to_dict(stat) for stat in snapshot.statistics('lineno')[:limit]],
+            'growth': None,
+            'worker_pid': os.getpid()
+        }
+        if _previous_snapshot is not None:
+            result['growth'] = [
+                _stat_to_dict(stat)
+                for stat in snapshot.compare_to(_previous_snapshot, 'lineno')[:limit]
+            ]
+        _previous_snapshot = snapshot
+        return result
+
+
+def stop_heap_tracing():
+    """Stop tracemalloc and drop the stored snapshot"""
+    global _previous_snapshot
+
+    with _heap_lock:
+        was_tracing = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        _previous_snapshot = None
+        return was_tracing
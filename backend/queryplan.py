@@ -0,0 +1,154 @@
+"""
+Query plans - EXPLAIN the statements behind the critical queries
+
+check_query_plans() runs each CRITICAL_QUERIES entry through the real code
+path, captures the SELECTs it issues and explains them (EXPLAIN QUERY PLAN
+on SQLite, EXPLAIN on PostgreSQL). A query fails when its plan never uses
+the expected index, or when it fully scans one of the tables that grow
+with the event. The test suite runs this on SQLite; run
+scripts/check-query-plans.py against a seeded PostgreSQL for the real
+planner.
+
+On PostgreSQL sequential scans are disabled while explaining, so a small
+dataset shows the index the planner *can* use rather than the scan it
+prefers at that size.
+"""
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from .models import db, User, Transaction, APIKey
+from .transactions import get_user_transactions, search_transactions, get_all_transactions
+from .factions import faction_totals
+
+# Tables a full scan of is an outage at event scale
+LARGE_TABLES = {'users', 'transactions', 'api_keys', 'audit_logs', 'account_stats'}
+
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def _account_lookup(user):
+    return User.query.filter_by(account_number=user.account_number).first()
+
+
+def _api_key_lookup(user):
+    return APIKey.query.filter_by(key_value='plan-check', is_active=True).first()
+
+
+def _faction_aggregate(user):
+    return faction_totals(user.faction_id or 0)
+
+
+# Either index serves an account's side of the ledger
+SENT_INDEXES = ('ix_transactions_from_account_timestamp', 'ix_transactions_from_account_id')
+RECEIVED_INDEXES = ('ix_transactions_to_account_timestamp', 'ix_transactions_to_account_id')
+
+# (name, indexes the plan must use - a tuple entry means any one of them,
+#  function of a sample user running the query)
+CRITICAL_QUERIES = [
+    ('transaction history', ('ix_transactions_from_account_timestamp', 'ix_transactions_to_account_timestamp'),
+     lambda user: get_user_transactions(user, limit=50)),
+    ('transaction search', (SENT_INDEXES, RECEIVED_INDEXES),
+     lambda user: search_transactions(user, 'NC-')),
+    ('account lookup', ('ix_users_account_number',), _account_lookup),
+    ('api key lookup', ('ix_api_keys_key_value',), _api_key_lookup),
+    ('faction aggregation', ('ix_users_faction_id',), _faction_aggregate),
+    ('admin transaction log', ('ix_transactions_timestamp',),
+     lambda user: get_all_transactions(limit=100)),
+]
+
+
+@contextmanager
+def capture_statements():
+    """Collect (statement, parameters) of every SELECT run inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def explain(statement, parameters):
+    """Plan lines for one captured statement"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        try:
+            rows = connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).all()
+        finally:
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = on')
+        return [row[0].strip() for row in rows]
+
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan, allowed_index=()):
+    """Large tables the plan reads in full (an index walk over allowed_index is fine)"""
+    scanned = []
+    for line in plan:
+        match = SQLITE_SCAN.match(line) or POSTGRES_SCAN.search(line)
+        if not match:
+            continue
+        # Aliased tables show up as users_1, users_2...
+        table = re.sub(r'_\d+$', '', match.group(1))
+        if table in LARGE_TABLES and not any(index in line for index in allowed_index):
+            scanned.append(table)
+    return scanned
+
+
+def check_query(name, indexes, run, user):
+    """
+    Explain one critical query.
+
+    Returns:
+        (plan lines, list of problems) tuple
+    """
+    with capture_statements() as statements:
+        run(user)
+
+    plan = []
+    for statement, parameters in statements:
+        plan.extend(explain(statement, parameters))
+
+    problems = []
+    for index in indexes:
+        options = index if isinstance(index, tuple) else (index,)
+        if not any(option in line for option in options for line in plan):
+            problems.append(f"{name}: does not use {' or '.join(options)}")
+    allowed = [option for index in indexes
+               for option in (index if isinstance(index, tuple) else (index,))]
+    for table in full_scans(plan, allowed):
+        problems.append(f'{name}: full scan of {table}')
+    return plan, problems
+
+
+def sample_user():
+    """The sender of the newest transaction, or the first user on an empty ledger"""
+    newest = Transaction.query.order_by(Transaction.id.desc()).first()
+    if newest is not None:
+        return db.session.get(User, newest.from_account_id)
+    return User.query.order_by(User.id).first()
+
+
+def check_query_plans(user=None):
+    """
+    Explain every critical query.
+
+    Returns:
+        {name: (plan lines, list of problems)}
+    """
+    user = user or sample_user()
+    results = {}
+    for name, indexes, run in CRITICAL_QUERIES:
+        results[name] = check_query(name, indexes, run, user)
+    return results
@@ -0,0 +1,277 @@
+"""
+Rate limiting - shared counters keyed by account
+
+Flask-Limiter's in-memory storage keeps separate counters in every worker,
+so the effective limits were workers x replicas times the configured ones.
+SyncedCounterStorage (storage URI "sqlsync://") counts hits locally and,
+at most every RATE_LIMIT_SYNC_INTERVAL seconds, adds the local deltas to
+the rate_limit_counters table in one batched upsert and reads back the
+cluster-wide counts. Syncs run on a background thread per worker, so
+enforcement never touches the database on the request path.
+
+The counters are fixed windows, not token buckets, so limits are
+approximate. A burst straddling a window boundary can reach up to 2x the
+limit, as with any fixed window, and on top of that each worker can accept
+up to one sync interval of hits the other workers haven't seen yet. The
+worst case is about 2x the limit plus RATE_LIMIT_SYNC_INTERVAL seconds of
+traffic from every other worker. "memory://" remains available as a local
+stand-in.
+"""
+import hashlib
+import threading
+import time
+from flask import request, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_limiter.util import get_remote_address
+from limits.storage import Storage
+from sqlalchemy import case, select, delete
+from sqlalchemy.exc import SQLAlchemyError
+from .models import db, RateLimitCounter, dialect_insert
+
+# Seconds between synchronizations of a worker's counters with the database
+RATE_LIMIT_SYNC_INTERVAL = 1.0
+
+# Seconds an expired counter row is kept before it is deleted
+EXPIRED_ROW_GRACE = 60.0
+
+# Hashes of API keys that passed validation in this worker
+_known_api_keys = set()
+_known_api_keys_lock = threading.Lock()
+
+
+def _api_key_hash(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()[:24]
+
+
+def remember_api_key(api_key):
+    """Let later requests with this (validated) API key use its own bucket"""
+    with _known_api_keys_lock:
+        _known_api_keys.add(_api_key_hash(api_key))
+
+
+def rate_limit_key():
+    """
+    Rate limit bucket for the current request.
+
+    Authenticated players are limited per account and integrations per API
+    key, so everyone behind the venue's shared NAT address doesn't share one
+    bucket. Unknown API keys and anonymous requests fall back to the client
+    address, so inventing keys or tokens doesn't create fresh buckets.
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        key_hash = _api_key_hash(api_key)
+        with _known_api_keys_lock:
+            if key_hash in _known_api_keys:
+                return f'apikey:{key_hash}'
+
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    if identity:
+        return f'user:{identity}'
+
+    return f'ip:{get_remote_address()}'
+
+
+def credential_limit_key():
+    """
+    Rate limit bucket for login and registration attempts.
+
+    These requests are anonymous, and with cluster-wide counters a per-address
+    bucket would be shared by every player behind the venue's NAT. Attempts
+    are counted per address and character name instead, which still stops
+    password guessing against one character.
+    """
+    data = request.get_json(silent=True)
+    name = data.get('character_name') if isinstance(data, dict) else None
+    name = str(name or '').strip().lower()[:100]
+    return f'ip:{get_remote_address()}:name:{name}'
+
+
+class _Counter:
+    __slots__ = ('shared', 'delta', 'expires_at')
+
+    def __init__(self, expires_at):
+        self.shared = 0      # Cluster-wide count as of the last sync
+        self.delta = 0       # This worker's hits not yet synced
+        self.expires_at = expires_at
+
+
+class SyncedCounterStorage(Storage):
+    """
+    Fixed-window counters shared through the database with batched syncs.
+
+    Overshoot is bounded by 2x the limit at window edges plus up to
+    RATE_LIMIT_SYNC_INTERVAL seconds of unsynced hits per worker.
+    """
+
+    STORAGE_SCHEME = ['sqlsync']
+
+    def __init__(self, uri=None, wrap_exceptions=False, background_sync=True, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.background_sync = background_sync
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._counters = {}
+        self._last_sync = time.monotonic()
+        self._last_purge = time.time()
+        self._syncer = None
+
+    @property
+    def base_exceptions(self):
+        return SQLAlchemyError
+
+    def _live_counter(self, key, now):
+        counter = self._counters.get(key)
+        if counter is not None and counter.expires_at <= now:
+            del self._counters[key]
+            counter = None
+        return counter
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self._lock:
+            counter = self._live_counter(key, now)
+            if counter is None:
+                counter = self._counters[key] = _Counter(now + expiry)
+            counter.delta += amount
+            value = counter.shared + counter.delta
+        self._maybe_sync()
+        return value
+
+    def get(self, key):
+        with self._lock:
+            counter = self._live_counter(key, time.time())
+            return counter.shared + counter.delta if counter else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        with self._lock:
+            counter = self._live_counter(key, now)
+            return counter.expires_at if counter else now
+
+    def check(self):
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(select(1))
+            return True
+        except SQLAlchemyError:
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+        with db.engine.begin() as connection:
+            return connection.execute(delete(RateLimitCounter.__table__)).rowcount
+
+    def clear(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+        counters = RateLimitCounter.__table__
+        with db.engine.begin() as connection:
+            connection.execute(delete(counters).where(counters.c.key == key))
+
+    def _maybe_sync(self):
+        """Start this worker's sync thread unless it is running"""
+        if not self.background_sync or (self._syncer is not None and self._syncer.is_alive()):
+            return
+        with self._sync_lock:
+            if self._syncer is not None and self._syncer.is_alive():
+                return
+            self._syncer = threading.Thread(
+                target=self._sync_loop, args=(current_app._get_current_object(),),
+                name='rate-limit-sync', daemon=True
+            )
+            self._syncer.start()
+
+    def _sync_loop(self, app):
+        while True:
+            time.sleep(max(0.0, RATE_LIMIT_SYNC_INTERVAL - (time.monotonic() - self._last_sync)))
+            try:
+                with app.app_context():
+                    self.sync()
+            except SQLAlchemyError as e:
+                print(f"⚠️  Rate limit sync failed, enforcing locally: {e}")
+            with self._lock:
+                if not self._counters:
+                    # Idle; the next hit starts a new thread
+                    self._syncer = None
+                    return
+
+    def sync(self):
+        """Push local deltas and pull cluster-wide counts in one database transaction"""
+        now = time.time()
+        self._last_sync = time.monotonic()
+
+        with self._lock:
+            for key in [k for k, c in self._counters.items() if c.expires_at <= now]:
+                del self._counters[key]
+            pending = {
+                key: (counter.delta, counter.expires_at)
+                for key, counter in self._counters.items() if counter.delta
+            }
+            for key in pending:
+                counter = self._counters[key]
+                counter.shared += counter.delta
+                counter.delta = 0
+            keys = list(self._counters)
+
+        if not keys:
+            return
+
+        counters = RateLimitCounter.__table__
+        try:
+            with db.engine.begin() as connection:
+                if pending:
+                    insert = dialect_insert(counters, connection.dialect.name)
+                    # A row from an expired window restarts at this worker's delta
+                    expired = counters.c.expires_at <= now
+                    connection.execute(
+                        insert.on_conflict_do_update(
+                            index_elements=['key'],
+                            set_={
+                                'count': case(
+                                    (expired, insert.excluded.count),
+                                    else_=counters.c.count + insert.excluded.count
+                                ),
+                                'expires_at': case(
+                                    (expired, insert.excluded.expires_at),
+                                    else_=counters.c.expires_at
+                                )
+                            }
+                        ),
+                        [{'key': key, 'count': delta, 'expires_at': expires_at}
+                         for key, (delta, expires_at) in pending.items()]
+                    )
+
+                rows = connection.execute(
+                    select(counters.c.key, counters.c.count, counters.c.expires_at)
+                    .where(counters.c.key.in_(keys))
+                    .where(counters.c.expires_at > now)
+                ).all()
+
+                if now - self._last_purge >= EXPIRED_ROW_GRACE:
+                    connection.execute(
+                        delete(counters).where(counters.c.expires_at < now - EXPIRED_ROW_GRACE)
+                    )
+                    self._last_purge = now
+
+        except SQLAlchemyError:
+            # Put the unsynced hits back so they are pushed next time
+            with self._lock:
+                for key, (delta, _) in pending.items():
+                    counter = self._counters.get(key)
+                    if counter is not None:
+                        counter.shared -= delta
+                        counter.delta += delta
+            raise
+
+        with self._lock:
+            for key, count, expires_at in rows:
+                counter = self._counters.get(key)
+                if counter is not None:
+                    counter.shared = count
+                    counter.expires_at = expires_at
@@ -0,0 +1,315 @@
+"""
+Admin user search - per-worker prefix index with an indexed database fallback
+"""
+import bisect
+import re
+import threading
+import time
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import object_session
+from .models import db, User
+
+# How often a worker checks for newly registered users (seconds)
+SEARCH_REFRESH_INTERVAL = 2.0
+
+# Ranking buckets - lower sorts first
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_WORD_PREFIX = 2
+RANK_SUBSTRING = 3
+
+# Shortest query the database infix fallback runs for: trigram indexes can't
+# serve shorter patterns, so those are matched in the index instead
+TRIGRAM_MIN_LENGTH = 3
+
+# session.info key for renames waiting for their transaction to commit
+_PENDING_RENAMES_KEY = 'search_pending_renames'
+
+_WORD_SPLIT = re.compile(r'[\s\-_.]+')
+
+
+class UserSearchIndex:
+    """
+    Sorted-array prefix index of character names and account numbers.
+
+    `_full` holds the complete lowercased name and account number of every user,
+    `_words` holds the individual words of names and the segments of account
+    numbers (NC-8A6F-4E2B -> 8a6f, 4e2b). Both are kept sorted so a prefix
+    lookup is a bisect plus a short forward scan. New registrations are picked
+    up incrementally using the highest user id seen as a watermark; renames in
+    this worker are applied once they commit. Queries shorter than
+    TRIGRAM_MIN_LENGTH also get infix matches from a scan of the entries.
+    Lookups take the same lock as maintenance, since bisect.insort shifts the
+    lists in place.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._full = []
+        self._words = []
+        self._entries = {}  # user_id -> (name_lower, account_lower)
+        self._max_id = 0
+        self._last_refresh = 0.0
+        self._loaded = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def _terms(self, name_lower, account_lower):
+        words = set(w for w in _WORD_SPLIT.split(name_lower) if w)
+        words.update(account_lower.split('-')[1:])
+        words.discard(name_lower)
+        return words
+
+    def _add(self, user_id, character_name, account_number, presorted=False):
+        name_lower = character_name.lower()
+        account_lower = account_number.lower()
+        self._entries[user_id] = (name_lower, account_lower)
+        self._max_id = max(self._max_id, user_id)
+
+        full = [(name_lower, user_id), (account_lower, user_id)]
+        words = [(w, user_id) for w in self._terms(name_lower, account_lower)]
+        if presorted:
+            self._full.extend(full)
+            self._words.extend(words)
+        else:
+            for item in full:
+                bisect.insort(self._full, item)
+            for item in words:
+                bisect.insort(self._words, item)
+
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        name_lower, account_lower = entry
+        for keys, items in ((self._full, [name_lower, account_lower]),
+                            (self._words, self._terms(name_lower, account_lower))):
+            for key in items:
+                i = bisect.bisect_left(keys, (key, user_id))
+                if i < len(keys) and keys[i] == (key, user_id):
+                    del keys[i]
+
+    def update(self, user_id, character_name, account_number):
+        """Re-index a renamed user (no-op until the index is loaded)"""
+        with self._lock:
+            if not self._loaded or user_id > self._max_id:
+                return
+            self._remove(user_id)
+            self._add(user_id, character_name, account_number)
+
+    def _load(self):
+        """Build the index from scratch (first use in this worker)"""
+        self.reset()
+        rows = db.session.query(
+            User.id, User.character_name, User.account_number
+        ).order_by(User.id).yield_per(5000)
+        for user_id, name, account in rows:
+            self._add(user_id, name, account, presorted=True)
+        self._full.sort()
+        self._words.sort()
+        self._loaded = True
+        self._last_refresh = time.monotonic()
+
+    def refresh(self, force=False):
+        """Pull in users registered since the last refresh"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                return
+            if not force and time.monotonic() - self._last_refresh < SEARCH_REFRESH_INTERVAL:
+                return
+
+            max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+            if max_id < self._max_id:
+                # The table shrank underneath us (restore/reset) - start over
+                self._load()
+                return
+
+            if max_id > self._max_id:
+                new_users = db.session.query(
+                    User.id, User.character_name, User.account_number
+                ).filter(User.id > self._max_id).order_by(User.id).all()
+                for user_id, name, account in new_users:
+                    self._add(user_id, name, account)
+
+            self._last_refresh = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def _scan(self, keys, prefix, limit, seen):
+        """Yield user ids whose key starts with prefix, in key order"""
+        found = []
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and len(found) < limit:
+            key, user_id = keys[i]
+            if not key.startswith(prefix):
+                break
+            if user_id not in seen:
+                seen.add(user_id)
+                found.append(user_id)
+            i += 1
+        return found
+
+    def _infix(self, q, limit, seen):
+        """User ids whose name or account number contains q (short queries only)"""
+        found = []
+        for user_id, (name_lower, account_lower) in self._entries.items():
+            if len(found) >= limit:
+                break
+            if user_id not in seen and (q in name_lower or q in account_lower):
+                seen.add(user_id)
+                found.append(user_id)
+        return found
+
+    def lookup(self, query, limit=20):
+        """
+        Return [(rank, user_id)] for exact, prefix and word-prefix matches,
+        plus infix matches for queries shorter than TRIGRAM_MIN_LENGTH, best
+        first.
+        """
+        q = query.strip().lower()
+        if not q:
+            return []
+
+        seen = set()
+        ranked = []
+        with self._lock:
+            for user_id in self._scan(self._full, q, limit, seen):
+                name_lower, account_lower = self._entries[user_id]
+                rank = RANK_EXACT if q in (name_lower, account_lower) else RANK_PREFIX
+                ranked.append((rank, user_id))
+
+            if len(ranked) < limit:
+                for user_id in self._scan(self._words, q, limit - len(ranked), seen):
+                    ranked.append((RANK_WORD_PREFIX, user_id))
+
+            if len(ranked) < limit and len(q) < TRIGRAM_MIN_LENGTH:
+                for user_id in self._infix(q, limit - len(ranked), seen):
+                    ranked.append((RANK_SUBSTRING, user_id))
+
+            ranked.sort(key=lambda r: (r[0], self._entries[r[1]][0]))
+        return ranked
+
+    def matches(self, user):
+        """Check an index entry still describes the given user row"""
+        with self._lock:
+            entry = self._entries.get(user.id)
+        return entry == (user.character_name.lower(), user.account_number.lower())
+
+
+# One index per worker process
+user_search_index = UserSearchIndex()
+
+
+@event.listens_for(User, 'after_update')
+def _queue_renamed_user(mapper, connection, target):
+    """Remember a rename until its transaction commits (other workers catch up on lookup)"""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('character_name', 'account_number')):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(_PENDING_RENAMES_KEY, {})[target.id] = (
+                target.character_name, target.account_number
+            )
+
+
+@event.listens_for(db.session, 'after_commit')
+def _reindex_renamed_users(session):
+    renames = session.info.pop(_PENDING_RENAMES_KEY, None)
+    for user_id, (character_name, account_number) in (renames or {}).items():
+        user_search_index.update(user_id, character_name, account_number)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_rolled_back_renames(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_RENAMES_KEY, None)
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_user_accounts(query, limit=20):
+    """
+    Search users by character name or account number.
+
+    Exact and prefix matches come from the in-memory index. If that yields
+    fewer than `limit` results, the remainder is filled with infix matches:
+    from the index for queries shorter than TRIGRAM_MIN_LENGTH, otherwise
+    from the database (served by trigram indexes on PostgreSQL), so short
+    queries never scan the users table.
+
+    Returns a list of User objects, best match first.
+    """
+    index = user_search_index
+    for attempt in range(2):
+        index.refresh()
+        ranked = index.lookup(query, limit=limit)
+        ids = [user_id for _, user_id in ranked]
+
+        users_by_id = {}
+        if ids:
+            users_by_id = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()}
+
+        if all(uid in users_by_id and index.matches(users_by_id[uid]) for uid in ids):
+            break
+        # Index is out of step with the table (e.g. database restored) - rebuild once
+        with index._lock:
+            index.reset()
+
+    results = [users_by_id[uid] for uid in ids if uid in users_by_id]
+
+    q = query.strip()
+    if len(results) < limit and len(q) >= TRIGRAM_MIN_LENGTH:
+        pattern = f'%{_escape_like(q)}%'
+        fallback = User.query.filter(
+            db.or_(
+                User.character_name.ilike(pattern, escape='\\'),
+                User.account_number.ilike(pattern, escape='\\')
+            )
+        )
+        if ids:
+            fallback = fallback.filter(~User.id.in_(ids))
+        results.extend(
+            fallback.order_by(User.character_name).limit(limit - len(results)).all()
+        )
+
+    return results
+
+
+def ensure_search_indexes():
+    """
+    Create trigram indexes backing the infix search fallback (PostgreSQL only).
+
+    GIN trigram indexes serve both prefix and infix ILIKE patterns, so the
+    fallback query never has to scan the users table. Requires the pg_trgm
+    extension; if it cannot be created the search still works, just slower.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    statements = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_users_character_name_trgm "
+        "ON users USING gin (character_name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_users_account_number_trgm "
+        "ON users USING gin (account_number gin_trgm_ops)",
+    ]
+    for statement in statements:
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(statement))
+        except Exception as e:
+            print(f"⚠️  Could not create search index ({statement.split(' ON ')[0]}): {e}")
+            return
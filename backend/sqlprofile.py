@@ -0,0 +1,154 @@
+"""
+SQL profiler - per-request statement log with N+1 detection
+
+With SQL_PROFILE enabled, every statement a request executes is timed and
+grouped by its normalized text (literals and IN lists collapsed). A
+statement repeated N_PLUS_ONE_THRESHOLD times or more in one request is
+flagged as an N+1 pattern - typically to_dict() lazy-loading a
+relationship per row. Each response gets an X-SQL-Profile summary header,
+and the worker keeps totals per statement for GET /api/admin/system/sql-profile.
+
+Off by default; the engine hooks are a single flag check when disabled.
+"""
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from flask import request, g
+
+# Executions of one statement in one request that count as N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+# Statements listed by the admin endpoint
+PROFILE_TOP_STATEMENTS = 50
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_NAMED_PARAM = re.compile(r'%\(\w+\)s|:\w+\b|\$\d+|%s')
+_IN_LIST = re.compile(r'\bIN \((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'(VALUES \([^)]*\))(?:\s*,\s*\([^)]*\))+', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Statement text with literals and parameter lists replaced by placeholders"""
+    sql = _WHITESPACE.sub(' ', statement).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _NAMED_PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_LIST.sub(r'\1, ...', sql)
+
+
+class RequestProfile:
+    """Statements executed while serving one request"""
+
+    def __init__(self):
+        self.statements = []  # (normalized sql, seconds)
+
+    def record(self, statement, seconds):
+        self.statements.append((normalize_sql(statement), seconds))
+
+    @property
+    def query_count(self):
+        return len(self.statements)
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """[(sql, executions)] for statements run at least `threshold` times"""
+        counts = Counter(sql for sql, _ in self.statements)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+    def header(self):
+        return (f'queries={self.query_count}; time={self.total_seconds * 1000:.1f}ms; '
+                f'n+1={len(self.repeated())}')
+
+
+class SQLProfiler:
+    """Per-worker switch, statement totals and test watchers"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._totals = {}  # sql -> [executions, seconds, max seconds, n+1 requests]
+        self._watchers = []
+
+    def add_request(self, label, profile):
+        """Fold a finished request into the totals and report N+1 patterns"""
+        repeated = dict(profile.repeated())
+        with self._lock:
+            for sql, seconds in profile.statements:
+                total = self._totals.setdefault(sql, [0, 0.0, 0.0, 0])
+                total[0] += 1
+                total[1] += seconds
+                total[2] = max(total[2], seconds)
+            for sql in repeated:
+                self._totals[sql][3] += 1
+            watchers = list(self._watchers)
+        for watcher in watchers:
+            watcher.append((label, profile))
+        for sql, count in repeated.items():
+            print(f"⚠️  N+1 in {label}: {count}x {sql[:200]}")
+
+    @contextmanager
+    def watch(self):
+        """Collect (label, RequestProfile) for every request finished inside the block"""
+        requests = []
+        was_enabled = self.enabled
+        self.enabled = True
+        with self._lock:
+            self._watchers.append(requests)
+        try:
+            yield requests
+        finally:
+            with self._lock:
+                self._watchers.remove(requests)
+            self.enabled = was_enabled
+
+    def top(self, limit=PROFILE_TOP_STATEMENTS):
+        """Statements by total time spent"""
+        with self._lock:
+            rows = sorted(self._totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{
+            'sql': sql,
+            'executions': executions,
+            'total_ms': round(seconds * 1000, 2),
+            'max_ms': round(slowest * 1000, 2),
+            'n_plus_one_requests': n_plus_one
+        } for sql, (executions, seconds, slowest, n_plus_one) in rows]
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+
+
+# One profiler per worker process
+profiler = SQLProfiler()
+
+
+def _record_query(statement, seconds):
+    profile = g.get('sql_profile')
+    if profile is None:
+        profile = g.sql_profile = RequestProfile()
+    profile.record(statement, seconds)
+
+
+def init_sql_profiler(app):
+    """Install the profiling hooks (inert unless SQL_PROFILE is set)"""
+    from .metrics import add_query_observer
+
+    profiler.enabled = app.config.get('SQL_PROFILE', False)
+    # Statements are timed by the engine hooks shared with metrics
+    add_query_observer(lambda: profiler.enabled, _record_query)
+
+    @app.after_request
+    def attach_sql_profile(response):
+        if not profiler.enabled:
+            return response
+        profile = g.pop('sql_profile', None) or RequestProfile()
+        profiler.add_request(f'{request.method} {request.path}', profile)
+        response.headers['X-SQL-Profile'] = profile.header()
+        return response
@@ -0,0 +1,196 @@
+"""
+Startup - idempotent database initialization with a one-query fast path
+
+Every pod runs init_db.py before gunicorn starts. schema_version records
+the latest migration the database was initialized at; once that matches,
+database_is_current() costs one SELECT on it and returns. Otherwise the
+first process to take the initialization lock (a PostgreSQL advisory
+lock) applies any pending migrations, then creates the tables and
+built-in rows while the others wait, and they then find the version
+recorded and return without repeating the work.
+
+The fast path only loads SQLAlchemy and the migration list: Flask and the
+models are imported once initialization is needed, and init_db.py never
+loads the rest of the application (limiter, JWT, blueprints, casino).
+When seed_database() gains new built-in rows, add a migration for them so
+the latest version changes and every database is seeded again.
+"""
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.pool import NullPool
+
+DEFAULT_DATABASE_URL = 'sqlite:///neobank.db'
+
+# pg_advisory_lock key serializing initialization across pods ("NeoB")
+INIT_LOCK_ID = 0x4E656F42
+
+CASINO_GAMES = ('glitch_grid', 'starlight_smuggler')
+
+
+def create_startup_app():
+    """Bare Flask app bound to DATABASE_URL, for initializing without the full app"""
+    from flask import Flask
+    from .models import db
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JACKPOT_SEED'] = float(os.environ.get('JACKPOT_SEED', 5000.0))
+    db.init_app(app)
+    return app
+
+
+def latest_schema_version():
+    """Version of the newest migration, which an initialized database is recorded at"""
+    # Imported here: migrations imports advisory_lock from this module
+    from .migrations import MIGRATIONS
+    return MIGRATIONS[-1][0]
+
+
+def database_is_current(url=None):
+    """
+    Whether the database is initialized at the latest schema version.
+
+    One query on a bare engine, without Flask or the models. Relative SQLite
+    paths are resolved by Flask-SQLAlchemy (into the instance folder), so
+    those always answer False and take the full path.
+    """
+    url = make_url(url or os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+            and not os.path.isabs(url.database):
+        return False
+
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        with engine.connect() as connection:
+            version = connection.execute(text('SELECT version FROM schema_version')).scalar()
+    except (OperationalError, ProgrammingError):
+        # Table (or database file) doesn't exist yet
+        return False
+    finally:
+        engine.dispose()
+    return version == latest_schema_version()
+
+
+def current_schema_version():
+    """Version recorded in schema_version, or None before the first initialization"""
+    from .models import db
+    try:
+        with db.engine.connect() as connection:
+            return connection.execute(text('SELECT version FROM schema_version')).scalar()
+    except (OperationalError, ProgrammingError):
+        # Table doesn't exist yet
+        return None
+
+
+@contextmanager
+def advisory_lock(lock_id):
+    """Hold a cluster-wide advisory lock (PostgreSQL only)"""
+    from .models import db
+    if db.engine.dialect.name != 'postgresql':
+        yield
+        return
+
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': lock_id})
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': lock_id})
+            connection.commit()
+
+
+def seed_database():
+    """Create missing tables, built-in accounts, casino configs and the jackpot"""
+    from flask import current_app
+    from .models import (
+        db, User, CasinoConfig, Jackpot, SYSTEM_ACCOUNT, HOUSE_ACCOUNT, NO_LOGIN_HASH
+    )
+    fresh = not inspect(db.engine).has_table('users')
+    db.create_all()
+    if fresh:
+        # create_all built the current schema; nothing for the migrations to do
+        from .migrations import mark_all_applied
+        mark_all_applied()
+
+    # Built-in accounts nobody logs in to don't need a (slow) bcrypt hash
+    if not User.query.filter_by(account_number=SYSTEM_ACCOUNT).first():
+        db.session.add(User(
+            character_name='SYSTEM',
+            password_hash=NO_LOGIN_HASH,
+            account_number=SYSTEM_ACCOUNT,
+            balance=999999999.0,  # Unlimited funds
+            is_admin=True
+        ))
+
+    if not User.query.filter_by(account_number=HOUSE_ACCOUNT).first():
+        db.session.add(User(
+            character_name='CASINO HOUSE',
+            password_hash=NO_LOGIN_HASH,
+            account_number=HOUSE_ACCOUNT,
+            balance=100000.0,  # Starting casino bank
+            is_admin=False
+        ))
+
+    if not User.query.filter_by(character_name='admin').first():
+        from .auth import hash_password
+        from .models import generate_account_number
+        db.session.add(User(
+            character_name='admin',
+            password_hash=hash_password('neotropolis2025'),
+            account_number=generate_account_number(),
+            balance=1000.0,
+            is_admin=True
+        ))
+
+    # Casino game configs with generous defaults (102% RTP)
+    for game in CASINO_GAMES:
+        if not CasinoConfig.query.filter_by(game_name=game).first():
+            db.session.add(CasinoConfig(game_name=game, is_enabled=True, payout_percentage=102.0))
+
+    # Progressive jackpot pot, starting at the seed amount
+    from .jackpot import JACKPOT_ID
+    if not Jackpot.query.filter_by(id=JACKPOT_ID).first():
+        db.session.add(Jackpot(id=JACKPOT_ID, amount=current_app.config['JACKPOT_SEED']))
+
+    db.session.commit()
+
+    # Trigram indexes for admin user search (PostgreSQL only)
+    from .search import ensure_search_indexes
+    ensure_search_indexes()
+
+
+def ensure_database():
+    """
+    Initialize the database unless it is already at the latest schema version.
+
+    An existing database gets its pending migrations first, so seeding
+    always sees the current schema.
+
+    Returns:
+        True if this call initialized it, False if it already was
+    """
+    from .models import db, SchemaVersion
+    latest = latest_schema_version()
+    if current_schema_version() == latest:
+        return False
+
+    with advisory_lock(INIT_LOCK_ID):
+        # Another pod may have finished while we waited for the lock
+        if current_schema_version() == latest:
+            return False
+
+        if inspect(db.engine).has_table('users'):
+            from .migrations import run_migrations
+            for version, name, seconds in run_migrations():
+                print(f"🔧 Applied migration {version:03d} {name} ({seconds:.1f}s)")
+
+        seed_database()
+        db.session.merge(SchemaVersion(id=1, version=latest, initialized_at=datetime.utcnow()))
+        db.session.commit()
+        return True
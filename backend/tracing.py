@@ -0,0 +1,258 @@
+"""
+Request tracing - spans per request, exported as JSON lines
+
+With TRACING_ENABLED, every request gets a trace whose child spans cover
+JWT decoding, the user load, casino config reads, RNG draws, payline
+evaluation, database flushes and commits, and JSON serialization. Spans
+are recorded for every request and the sampling decision is made when the
+request ends: traces slower than TRACE_SLOW_MS are always exported, the
+rest at TRACE_SAMPLE_RATE (or a per-route rate from
+TRACE_ROUTE_SAMPLE_RATES, e.g. "/api/v1/casino/*=0.5,/health=0").
+
+Each exported trace is one JSON line on stdout or appended to the file
+named by TRACE_EXPORT. Wall-clock start times, pid and thread name let
+overlapping requests (a bcrypt login next to a slow spin) be lined up.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from fnmatch import fnmatch
+from flask import request, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import JWTManager
+
+# Export traces at least this slow regardless of sampling
+DEFAULT_SLOW_MS = 500
+
+_NO_SPAN = nullcontext()
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'started', 'wall_start', 'duration', 'attrs')
+
+    def __init__(self, name, parent_id, attrs):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.started = time.perf_counter()
+        self.wall_start = time.time()
+        self.duration = None
+        self.attrs = attrs
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': round(self.wall_start, 6),
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            **({'attrs': self.attrs} if self.attrs else {})
+        }
+
+
+class Trace:
+    """Spans of one request; the innermost open span parents new ones"""
+
+    def __init__(self, name, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.root = Span(name, None, attrs)
+        self.spans = [self.root]
+        self._open = [self.root]
+
+    def start(self, name, attrs):
+        span = Span(name, self._open[-1].span_id, attrs)
+        self.spans.append(span)
+        self._open.append(span)
+        return span
+
+    def finish(self, span):
+        if span.duration is not None:
+            return
+        span.duration = time.perf_counter() - span.started
+        if span in self._open:
+            self._open.remove(span)
+
+    def finish_all(self):
+        for span in reversed(self._open):
+            span.duration = time.perf_counter() - span.started
+        self._open.clear()
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'duration_ms': round(self.root.duration * 1000, 3),
+            'spans': [span.to_dict() for span in self.spans]
+        }
+
+
+class _SpanContext:
+    __slots__ = ('trace', 'name', 'attrs', 'span')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span = self.trace.start(self.name, self.attrs)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.span.attrs['error'] = exc_type.__name__
+        self.trace.finish(self.span)
+        return False
+
+
+class Tracer:
+    """Sampling settings and the span exporter for this worker"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.route_rates = []
+        self.slow_seconds = DEFAULT_SLOW_MS / 1000
+        self.export_to = 'stdout'
+        self._lock = threading.Lock()
+
+    def configure(self, enabled, export_to='stdout', sample_rate=0.0, route_rates='',
+                  slow_ms=DEFAULT_SLOW_MS):
+        self.enabled = enabled
+        self.export_to = export_to
+        self.sample_rate = sample_rate
+        self.route_rates = parse_route_rates(route_rates)
+        self.slow_seconds = slow_ms / 1000
+
+    def should_export(self, route, seconds):
+        if seconds >= self.slow_seconds:
+            return True
+        rate = self.sample_rate
+        for pattern, route_rate in self.route_rates:
+            if fnmatch(route, pattern):
+                rate = route_rate
+                break
+        return random.random() < rate
+
+    def export(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self.export_to == 'stdout':
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.export_to, 'a') as f:
+                    f.write(line)
+
+
+# One tracer per worker process
+tracer = Tracer()
+
+
+def parse_route_rates(value):
+    """'/api/v1/casino/*=0.5,/health=0' -> [('/api/v1/casino/*', 0.5), ('/health', 0.0)]"""
+    rates = []
+    for item in (value or '').split(','):
+        if '=' in item:
+            pattern, rate = item.rsplit('=', 1)
+            rates.append((pattern.strip(), float(rate)))
+    return rates
+
+
+def current_trace():
+    if not tracer.enabled or not has_request_context():
+        return None
+    return g.get('trace')
+
+
+def span(name, **attrs):
+    """Context manager timing a child span of the current request (no-op when not tracing)"""
+    trace = current_trace()
+    if trace is None:
+        return _NO_SPAN
+    return _SpanContext(trace, name, attrs)
+
+
+class TracedJWTManager(JWTManager):
+    """JWTManager that times token decoding (it has no public hook for that)"""
+
+    def _decode_jwt_from_config(self, *args, **kwargs):
+        with span('jwt.decode'):
+            return super()._decode_jwt_from_config(*args, **kwargs)
+
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """JSON provider that times response serialization"""
+
+    def response(self, *args, **kwargs):
+        with span('json.serialize'):
+            return super().response(*args, **kwargs)
+
+
+def _start_session_span(session, key, name):
+    trace = current_trace()
+    if trace is not None and key not in session.info:
+        session.info[key] = trace.start(name, {})
+
+
+def _finish_session_span(session, key):
+    span_ = session.info.pop(key, None)
+    trace = current_trace()
+    if span_ is not None and trace is not None:
+        trace.finish(span_)
+
+
+def init_tracing(app, session):
+    """Install request and session hooks (inert unless TRACING_ENABLED is set)"""
+    from sqlalchemy import event
+
+    tracer.configure(
+        app.config.get('TRACING_ENABLED', False),
+        export_to=app.config.get('TRACE_EXPORT', 'stdout'),
+        sample_rate=app.config.get('TRACE_SAMPLE_RATE', 0.0),
+        route_rates=app.config.get('TRACE_ROUTE_SAMPLE_RATES', ''),
+        slow_ms=app.config.get('TRACE_SLOW_MS', DEFAULT_SLOW_MS)
+    )
+    app.json = TracedJSONProvider(app)
+
+    # Flushes (where row locks are taken) and commits, nested under the current span
+    event.listen(session, 'before_flush',
+                 lambda s, ctx, instances: _start_session_span(s, 'trace_flush', 'db.flush'))
+    event.listen(session, 'after_flush_postexec',
+                 lambda s, ctx: _finish_session_span(s, 'trace_flush'))
+    event.listen(session, 'before_commit',
+                 lambda s: _start_session_span(s, 'trace_commit', 'db.commit'))
+    event.listen(session, 'after_commit',
+                 lambda s: _finish_session_span(s, 'trace_commit'))
+
+    @event.listens_for(session, 'after_soft_rollback')
+    def _close_failed_spans(s, previous_transaction):
+        _finish_session_span(s, 'trace_flush')
+        _finish_session_span(s, 'trace_commit')
+
+    @app.before_request
+    def start_trace():
+        if tracer.enabled:
+            g.trace = Trace('request', method=request.method, path=request.path)
+
+    @app.after_request
+    def finish_trace(response):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+        trace.finish_all()
+        route = request.url_rule.rule if request.url_rule else request.path
+        trace.root.attrs.update(route=route, status=response.status_code)
+        response.headers['X-Trace-Id'] = trace.trace_id
+        if tracer.should_export(route, trace.root.duration):
+            try:
+                tracer.export(trace.to_dict())
+            except OSError as e:
+                print(f"⚠️  Could not export trace: {e}")
+        return response
@@ -1,8 +1,15 @@
 """
 Transaction engine - Atomic, secure transaction processing
 """
-from .models import db, User, Transaction
+from .models import db, User, Transaction, AccountStats, SYSTEM_ACCOUNT, HOUSE_ACCOUNT, dialect_insert
+from .factions import record_transfer, record_bulk_credits
+from .leaderboards import leaderboards
+from .events import queue_account_events
+from .txcache import recent_transactions_cache
+from .metrics import metrics
+from sqlalchemy import bindparam
 from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
 
 
 def create_transaction(from_account, to_account, amount, memo=None, transaction_type='transfer'):
@@ -47,21 +54,46 @@ def create_transaction(from_account, to_account, amount, memo=None, transaction_
         if memo and len(memo) > 140:
             return None, "Memo exceeds 140 characters"
         
+        # Account versions before this write, for patching cached history
+        previous_versions = {sender.id: sender.version, receiver.id: receiver.version}
+        
         # Begin atomic transaction
         sender.balance -= amount
         receiver.balance += amount
         
         # Create transaction record
+        timestamp = datetime.utcnow()
         transaction = Transaction(
             from_account_id=sender.id,
             to_account_id=receiver.id,
             amount=amount,
             memo=memo,
+            timestamp=timestamp,
             transaction_type=transaction_type
         )
         
         db.session.add(transaction)
-        db.session.commit()
+        record_account_activity(sender.id, receiver.id, amount, timestamp)
+        record_transfer(sender, receiver, amount)
+        
+        # Live updates for both parties' connected clients
+        db.session.flush()
+        transaction_data = transaction.to_dict()
+        queue_account_events([
+            ([user.id], {'type': 'transaction', 'balance': round(user.balance, 2),
+                         'transaction': transaction_data})
+            for user in (sender, receiver)
+        ])
+        
+        # Captured before commit expires the objects
+        settled = [(u.id, u.account_number, u.character_name, u.faction, u.balance)
+                   for u in (sender, receiver)]
+        with metrics.timer('neobank_transaction_commit_seconds', type=transaction_type):
+            db.session.commit()
+        
+        for user_id, account_number, name, faction, balance in settled:
+            leaderboards.record_balance(user_id, account_number, name, faction, balance)
+        _patch_recent_transactions(previous_versions, transaction_data)
         
         return transaction, None
         
@@ -73,19 +105,331 @@ def create_transaction(from_account, to_account, amount, memo=None, transaction_
         return None, f"Transaction failed: {str(e)}"
 
 
+def _patch_recent_transactions(previous_versions, transaction_data):
+    """Prepend a committed transaction to this worker's cached history pages"""
+    cached = [user_id for user_id in previous_versions if recent_transactions_cache.contains(user_id)]
+    if not cached:
+        return
+    versions = dict(db.session.query(User.id, User.version).filter(User.id.in_(cached)))
+    for user_id in cached:
+        recent_transactions_cache.patch(
+            user_id, previous_versions[user_id], versions.get(user_id), transaction_data
+        )
+
+
+def _bump_account_stats(user_id, timestamp, sent_count=0, received_count=0,
+                        total_sent=0.0, total_received=0.0):
+    """Atomically increment one account's counters, creating the row if needed"""
+    stats = AccountStats.__table__
+    insert = dialect_insert(stats).values(
+        user_id=user_id,
+        sent_count=sent_count,
+        received_count=received_count,
+        total_sent=total_sent,
+        total_received=total_received,
+        last_activity=timestamp
+    )
+    # A single upsert, so two first transfers for the same account can't
+    # both try to create its row
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            'sent_count': stats.c.sent_count + insert.excluded.sent_count,
+            'received_count': stats.c.received_count + insert.excluded.received_count,
+            'total_sent': stats.c.total_sent + insert.excluded.total_sent,
+            'total_received': stats.c.total_received + insert.excluded.total_received,
+            'last_activity': insert.excluded.last_activity,
+        }
+    ))
+
+
+def record_account_activity(sender_id, receiver_id, amount, timestamp):
+    """
+    Update activity counters for both sides of a ledger entry.
+    
+    Runs inside the caller's database transaction, so the counters commit
+    or roll back together with the balances and the transaction row.
+    """
+    _bump_account_stats(sender_id, timestamp, sent_count=1, total_sent=amount)
+    _bump_account_stats(receiver_id, timestamp, received_count=1, total_received=amount)
+
+
+def _bump_account_stats_bulk(credits, timestamp):
+    """
+    Record one received transaction for each (user_id, amount) in credits.
+    
+    Missing counter rows are created first (ignoring rows created concurrently)
+    so the increment can run as a single executemany UPDATE.
+    """
+    stats = AccountStats.__table__
+    user_ids = [user_id for user_id, _ in credits]
+    
+    existing = {row[0] for row in db.session.execute(
+        db.select(stats.c.user_id).where(stats.c.user_id.in_(user_ids))
+    )}
+    missing = [
+        {'user_id': user_id, 'sent_count': 0, 'received_count': 0,
+         'total_sent': 0.0, 'total_received': 0.0}
+        for user_id in user_ids if user_id not in existing
+    ]
+    if missing:
+        db.session.execute(dialect_insert(stats).on_conflict_do_nothing(), missing)
+    
+    db.session.execute(
+        stats.update()
+        .where(stats.c.user_id == bindparam('b_user_id'))
+        .values(
+            received_count=stats.c.received_count + 1,
+            total_received=stats.c.total_received + bindparam('b_amount'),
+            last_activity=timestamp
+        ),
+        [{'b_user_id': user_id, 'b_amount': amount} for user_id, amount in credits]
+    )
+
+
+def get_account_stats(user):
+    """Get activity counters for a user (single primary key lookup)"""
+    stats = db.session.get(AccountStats, user.id)
+    if not stats:
+        stats = AccountStats(user_id=user.id, sent_count=0, received_count=0,
+                             total_sent=0.0, total_received=0.0)
+    return stats
+
+
+def rebuild_account_stats(chunk_size=1000, progress=None):
+    """
+    Recompute account_stats from the transaction ledger.
+    
+    Works through users in id ranges of `chunk_size`, committing after each
+    chunk. The chunk's user rows are locked while its counters are rebuilt so
+    concurrent transfers cannot slip between the aggregate and the write.
+    
+    Args:
+        chunk_size: Number of user ids per chunk
+        progress: Optional callable(done_up_to_id, max_id)
+    
+    Returns:
+        Number of accounts rebuilt
+    """
+    from sqlalchemy import func
+    
+    max_id = db.session.query(func.max(User.id)).scalar() or 0
+    rebuilt = 0
+    
+    for low in range(1, max_id + 1, chunk_size):
+        high = low + chunk_size - 1
+        
+        user_ids = [row[0] for row in db.session.query(User.id).filter(
+            User.id.between(low, high)
+        ).order_by(User.id).with_for_update().all()]
+        
+        if user_ids:
+            sent = {
+                row[0]: row[1:] for row in db.session.query(
+                    Transaction.from_account_id,
+                    func.count(Transaction.id),
+                    func.sum(Transaction.amount),
+                    func.max(Transaction.timestamp)
+                ).filter(
+                    Transaction.from_account_id.between(low, high)
+                ).group_by(Transaction.from_account_id)
+            }
+            received = {
+                row[0]: row[1:] for row in db.session.query(
+                    Transaction.to_account_id,
+                    func.count(Transaction.id),
+                    func.sum(Transaction.amount),
+                    func.max(Transaction.timestamp)
+                ).filter(
+                    Transaction.to_account_id.between(low, high)
+                ).group_by(Transaction.to_account_id)
+            }
+            existing = {
+                s.user_id: s for s in AccountStats.query.filter(
+                    AccountStats.user_id.between(low, high)
+                )
+            }
+            
+            for user_id in user_ids:
+                sent_count, total_sent, last_sent = sent.get(user_id, (0, 0.0, None))
+                received_count, total_received, last_received = received.get(user_id, (0, 0.0, None))
+                
+                stats = existing.get(user_id)
+                if not stats:
+                    stats = AccountStats(user_id=user_id)
+                    db.session.add(stats)
+                
+                stats.sent_count = sent_count
+                stats.received_count = received_count
+                stats.total_sent = total_sent or 0.0
+                stats.total_received = total_received or 0.0
+                stats.last_activity = max(
+                    (t for t in (last_sent, last_received) if t), default=None
+                )
+                rebuilt += 1
+        
+        db.session.commit()
+        if progress:
+            progress(min(high, max_id), max_id)
+    
+    return rebuilt
+
+
+def bulk_payout(source, payouts, memo, transaction_type='admin_adjustment', chunk_size=1000):
+    """
+    Credit many accounts from a single source account using set-based writes.
+    
+    Each chunk is written as one executemany UPDATE of recipient balances,
+    one bulk INSERT of ledger rows and one guarded debit of the source
+    account, committed together. The ledger therefore balances after every
+    chunk, and a very large payout never holds locks on every recipient at
+    once.
+    
+    Args:
+        source: User object paying out (normally the system account)
+        payouts: Iterable of (user_id, amount) pairs; amounts must be positive
+        memo: Memo recorded on every ledger row (max 140 chars)
+        transaction_type: Type recorded on every ledger row
+        chunk_size: Recipients per database transaction
+    
+    Returns:
+        (paid_count, paid_total, error) tuple. On error, chunks committed
+        before the failure stay committed and are reflected in the counts.
+    """
+    users = User.__table__
+    transactions = Transaction.__table__
+    source_id = source.id
+    memo = memo[:140] if memo else memo
+    
+    paid_count = 0
+    paid_total = 0.0
+    
+    def flush(chunk):
+        timestamp = datetime.utcnow()
+        chunk_total = sum(amount for _, amount in chunk)
+        
+        debit = db.session.execute(
+            users.update()
+            .where(users.c.id == source_id)
+            .where(users.c.balance >= chunk_total)
+            .values(balance=users.c.balance - chunk_total, version=users.c.version + 1)
+        )
+        if debit.rowcount == 0:
+            raise ValueError("Insufficient funds in source account")
+        
+        db.session.execute(
+            users.update()
+            .where(users.c.id == bindparam('b_user_id'))
+            .values(balance=users.c.balance + bindparam('b_amount'), version=users.c.version + 1),
+            [{'b_user_id': user_id, 'b_amount': amount} for user_id, amount in chunk]
+        )
+        db.session.execute(transactions.insert(), [
+            {
+                'from_account_id': source_id,
+                'to_account_id': user_id,
+                'amount': amount,
+                'memo': memo,
+                'timestamp': timestamp,
+                'transaction_type': transaction_type
+            }
+            for user_id, amount in chunk
+        ])
+        
+        _bump_account_stats(source_id, timestamp, sent_count=len(chunk), total_sent=chunk_total)
+        _bump_account_stats_bulk(chunk, timestamp)
+        record_bulk_credits(source_id, chunk)
+        
+        queue_account_events([([user_id for user_id, _ in chunk], {'type': 'refresh'})])
+        db.session.commit()
+        recent_transactions_cache.invalidate([source_id] + [user_id for user_id, _ in chunk])
+        leaderboards.mark_stale('richest')
+        return len(chunk), chunk_total
+    
+    try:
+        chunk = []
+        for user_id, amount in payouts:
+            if amount <= 0:
+                raise ValueError("Payout amounts must be positive")
+            if user_id == source_id:
+                continue
+            chunk.append((user_id, amount))
+            if len(chunk) >= chunk_size:
+                count, total = flush(chunk)
+                paid_count += count
+                paid_total += total
+                chunk = []
+        if chunk:
+            count, total = flush(chunk)
+            paid_count += count
+            paid_total += total
+        
+        return paid_count, paid_total, None
+    
+    except ValueError as e:
+        db.session.rollback()
+        return paid_count, paid_total, str(e)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return paid_count, paid_total, f"Database error: {str(e)}"
+
+
+def iter_faction_member_ids(faction_id, chunk_size=1000):
+    """Yield ids of regular (non-system) accounts in a faction, keyset-paginated"""
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.session.query(User.id).filter(
+            User.faction_id == faction_id,
+            ~User.account_number.in_([SYSTEM_ACCOUNT, HOUSE_ACCOUNT]),
+            User.id > last_id
+        ).order_by(User.id).limit(chunk_size)]
+        if not ids:
+            return
+        yield from ids
+        last_id = ids[-1]
+
+
+def credit_faction(faction, amount, memo, chunk_size=1000):
+    """
+    Credit every member of a faction with the same amount from the system account.
+    
+    Args:
+        faction: Faction object, or None for users without a faction
+    
+    Returns:
+        (paid_count, paid_total, error) tuple
+    """
+    system_account = User.query.filter_by(account_number=SYSTEM_ACCOUNT).first()
+    if not system_account:
+        return 0, 0.0, "System account not found"
+    
+    faction_id = faction.id if faction else None
+    payouts = ((user_id, amount) for user_id in iter_faction_member_ids(faction_id, chunk_size))
+    return bulk_payout(system_account, payouts, memo, chunk_size=chunk_size)
+
+
 def get_user_transactions(user, limit=None, offset=0):
     """Get transaction history for a user"""
     # Get all transactions where user is sender or receiver
     sent = user.sent_transactions
     received = user.received_transactions
     
-    # Combine and sort by timestamp
-    all_transactions = sent.union(received).order_by(Transaction.timestamp.desc())
-    
     if limit:
-        all_transactions = all_transactions.limit(limit).offset(offset)
+        # A page only needs each side's newest offset + limit rows, which the
+        # (account, timestamp) indexes return without reading the whole history
+        depth = offset + limit
+        newest_sent = sent.with_entities(Transaction.id).order_by(
+            Transaction.timestamp.desc()
+        ).limit(depth).subquery()
+        newest_received = received.with_entities(Transaction.id).order_by(
+            Transaction.timestamp.desc()
+        ).limit(depth).subquery()
+        return Transaction.query.filter(db.or_(
+            Transaction.id.in_(db.select(newest_sent.c.id)),
+            Transaction.id.in_(db.select(newest_received.c.id))
+        )).order_by(Transaction.timestamp.desc()).limit(limit).offset(offset).all()
     
-    return all_transactions.all()
+    # Combine and sort by timestamp
+    return sent.union(received).order_by(Transaction.timestamp.desc()).all()
 
 
 def get_recent_transactions(user, limit=10):
@@ -93,18 +437,65 @@ def get_recent_transactions(user, limit=10):
     return get_user_transactions(user, limit=limit)
 
 
+def get_recent_transaction_page(user_id, version, limit=10):
+    """
+    Serialized newest transactions for an account, served from this worker's
+    cache when it holds the account at `version`.
+
+    Args:
+        user_id: Account's user id
+        version: The account's current User.version
+        limit: Page size
+    """
+    page = recent_transactions_cache.get(user_id, version, limit)
+    if page is not None:
+        return page
+
+    # Read a full cache entry even for a short page, so later pages hit
+    depth = max(limit, recent_transactions_cache.depth)
+    user = User.query.get(user_id)
+    transactions = serialize_transactions(get_user_transactions(user, limit=depth))
+    if limit <= recent_transactions_cache.depth:
+        recent_transactions_cache.put(user_id, version, transactions,
+                                      complete=len(transactions) < depth)
+    return transactions[:limit]
+
+
+def serialize_transactions(transactions):
+    """
+    Serialize transactions with to_dict().
+
+    Every sender and receiver is loaded with one query first (and kept
+    referenced while serializing), so to_dict() finds them in the session
+    instead of querying once per row.
+    """
+    user_ids = {t.from_account_id for t in transactions} | {t.to_account_id for t in transactions}
+    counterparties = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
+    return [t.to_dict() for t in transactions]
+
+
 def search_transactions(user, query, limit=50):
-    """Search user's transactions by memo or account number"""
-    sent = user.sent_transactions.filter(
+    """Search user's transactions by memo or counterparty account number"""
+    pattern = f'%{query}%'
+    
+    # Join each side to its counterparty by primary key; filtering on a bare
+    # User column would cross join every transaction with the users table
+    recipient = db.aliased(User)
+    sent = user.sent_transactions.join(
+        recipient, Transaction.to_account_id == recipient.id
+    ).filter(
         db.or_(
-            Transaction.memo.ilike(f'%{query}%'),
-            User.account_number.ilike(f'%{query}%')
+            Transaction.memo.ilike(pattern),
+            recipient.account_number.ilike(pattern)
         )
     )
-    received = user.received_transactions.filter(
+    sender = db.aliased(User)
+    received = user.received_transactions.join(
+        sender, Transaction.from_account_id == sender.id
+    ).filter(
         db.or_(
-            Transaction.memo.ilike(f'%{query}%'),
-            User.account_number.ilike(f'%{query}%')
+            Transaction.memo.ilike(pattern),
+            sender.account_number.ilike(pattern)
         )
     )
     
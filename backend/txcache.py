@@ -0,0 +1,104 @@
+"""
+Recent transactions cache - per-worker LRU of each account's newest transactions
+
+Entries hold an account's most recent serialized transactions together with
+the account version they were read at. A lookup passes the account's current
+version (read from the database, which is how changes made by other workers
+are noticed) and only an entry at exactly that version is served.
+create_transaction patches this worker's entries in place when it can prove
+no other write happened in between, and drops them otherwise.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+# Accounts kept per worker
+RECENT_CACHE_ACCOUNTS = 10000
+
+# Transactions kept per account; larger pages bypass the cache
+RECENT_CACHE_DEPTH = 20
+
+
+class RecentTransactionCache:
+    """Bounded LRU of account id -> (version, transactions newest first, complete)"""
+
+    def __init__(self, capacity=RECENT_CACHE_ACCOUNTS, depth=RECENT_CACHE_DEPTH):
+        self.capacity = capacity
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'patches': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get(self, user_id, version, limit):
+        """A page of up to `limit` transactions, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == version and (limit <= len(entry[1]) or entry[2]):
+                self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return entry[1][:limit]
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, user_id, version, transactions, complete):
+        """
+        Store an account's newest transactions.
+
+        complete means the account has no transactions beyond these.
+        """
+        with self._lock:
+            self._entries[user_id] = (version, list(transactions[:self.depth]),
+                                      complete and len(transactions) <= self.depth)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def contains(self, user_id):
+        with self._lock:
+            return user_id in self._entries
+
+    def patch(self, user_id, previous_version, version, transaction):
+        """
+        Prepend a new transaction if the entry is exactly one write behind.
+
+        Otherwise the entry may be missing other writes and is dropped.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if not entry:
+                return
+            if entry[0] != previous_version or version != previous_version + 1:
+                del self._entries[user_id]
+                self._stats['invalidations'] += 1
+                return
+            transactions = [transaction] + entry[1]
+            complete = entry[2] and len(transactions) <= self.depth
+            self._entries[user_id] = (version, transactions[:self.depth], complete)
+            self._stats['patches'] += 1
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                if self._entries.pop(user_id, None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else None,
+                'entries': len(self._entries),
+                'capacity': self.capacity,
+                'depth': self.depth,
+                'worker_pid': os.getpid()
+            }
+
+
+# One cache per worker process
+recent_transactions_cache = RecentTransactionCache()
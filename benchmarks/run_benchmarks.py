@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the casino engine and ledger hot paths
+
+Times the payline evaluators, both spin functions, create_transaction,
+get_user_transactions, search_transactions and every model's to_dict()
+against SQLite and, when BENCH_POSTGRES_URL is set and reachable, a local
+PostgreSQL, at several ledger sizes. Results are microseconds per call
+(median of several rounds), keyed "<database>/<size>/<benchmark>".
+
+    python benchmarks/run_benchmarks.py                 # run and print
+    python benchmarks/run_benchmarks.py --save          # record benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare       # flag regressions against it
+
+Each database runs in its own process, since the backend binds to
+DATABASE_URL when it is imported. Baselines are only comparable on the
+machine that recorded them, so none is committed; record one with --save
+before tuning.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Make the backend package importable when run from a checkout
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+DEFAULT_SIZES = (1000, 10000)
+
+# Slowdown (fraction) beyond which --compare reports a regression
+DEFAULT_THRESHOLD = 0.25
+
+# Seconds each benchmark is timed for, split across ROUNDS
+MIN_TIME = 0.5
+ROUNDS = 5
+
+
+def measure(fn, min_time=MIN_TIME, rounds=ROUNDS):
+    """Median seconds per call of fn() over `rounds` rounds"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / rounds or number >= 100000:
+            break
+        number = max(number * 2, int(number * (min_time / rounds) / max(elapsed, 1e-9)))
+
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return statistics.median(samples)
+
+
+# ============================================================================
+# Worker: runs inside one database's process
+# ============================================================================
+
+def seed_ledger(size):
+    """Fresh schema with size transactions among size/20 rich players"""
+    from backend.app import app, init_database
+    from backend.models import (
+        db, User, Transaction, AccountStats, Faction, APIKey, AuditLog,
+        CasinoRollup, PlayerGameStats
+    )
+
+    with app.app_context():
+        db.drop_all()
+    init_database()
+
+    rng = random.Random(size)
+    with app.app_context():
+        users = User.__table__
+        player_count = max(50, size // 20)
+        db.session.execute(users.insert(), [
+            {'character_name': f'bench-{i:06d}', 'password_hash': 'x',
+             'account_number': f'NC-BN{i // 10000:02d}-{i % 10000:04d}', 'balance': 1e9,
+             'is_admin': False, 'free_spins': 0, 'version': 0, 'faction': 'Chrome Syndicate'}
+            for i in range(player_count)
+        ])
+        ids = db.session.execute(
+            db.select(users.c.id).where(users.c.character_name.like('bench-%'))
+        ).scalars().all()
+        db.session.execute(AccountStats.__table__.insert(), [
+            {'user_id': user_id, 'sent_count': 0, 'received_count': 0,
+             'total_sent': 0.0, 'total_received': 0.0} for user_id in ids
+        ])
+
+        # A tenth of the ledger involves the first player, the "busy" account
+        busy = ids[0]
+        start = datetime.utcnow() - timedelta(days=30)
+        rows = []
+        for i in range(size):
+            sender, receiver = rng.sample(ids, 2)
+            if i % 10 == 0:
+                sender = busy if receiver != busy else sender
+            rows.append({
+                'from_account_id': sender, 'to_account_id': receiver,
+                'amount': round(rng.uniform(1, 500), 2),
+                'memo': f'{rng.choice(["Drinks at the Neon Bar", "Ship repairs", "Data chip", "Rent"])} #{i}',
+                'timestamp': start + timedelta(seconds=i * 2592000 / size),
+                'transaction_type': 'transfer'
+            })
+        for offset in range(0, len(rows), 5000):
+            db.session.execute(Transaction.__table__.insert(), rows[offset:offset + 5000])
+
+        admin = User.query.filter_by(character_name='admin').first()
+        db.session.add(Faction(name='Chrome Syndicate', name_key='chrome syndicate',
+                               member_count=player_count, total_balance=1e9 * player_count))
+        db.session.add(APIKey(key_value='bench-key', description='bench', created_by_user_id=admin.id))
+        db.session.add(AuditLog(admin_user_id=admin.id, action='adjust_balance',
+                                target_user_id=busy, details='Benchmark'))
+        db.session.add(CasinoRollup(game_name='glitch_grid', period='hour',
+                                    bucket_start=start, spins=100, wagered=500.0, paid_out=480.0))
+        db.session.add(PlayerGameStats(user_id=busy, game_name='glitch_grid', spins=10,
+                                       total_wagered=50.0, total_won=40.0, biggest_win=20.0))
+        db.session.commit()
+        return ids
+
+
+def serializer_benchmarks():
+    """(name, model) for every model with a to_dict()"""
+    from backend.models import (
+        User, Transaction, Faction, AccountStats, APIKey, AuditLog, CasinoConfig,
+        CasinoRollup, PlayerGameStats
+    )
+    return [
+        (f'to_dict.{model.__name__}', model)
+        for model in (User, Transaction, Faction, AccountStats, APIKey, AuditLog,
+                      CasinoConfig, CasinoRollup, PlayerGameStats)
+    ]
+
+
+def run_pure_benchmarks():
+    """Benchmarks that don't touch the database"""
+    from backend.casino import (
+        calculate_glitch_grid_win, calculate_starlight_win,
+        GLITCH_GRID_SYMBOLS, STARLIGHT_SYMBOLS
+    )
+    rng = random.Random(1)
+    reels = [[rng.choice(GLITCH_GRID_SYMBOLS) for _ in range(3)] for _ in range(64)]
+    lines = [[rng.choice(STARLIGHT_SYMBOLS) for _ in range(5)] for _ in range(64)]
+    reel_cycle = itertools.cycle(reels)
+    line_cycle = itertools.cycle(lines)
+    return {
+        'calculate_glitch_grid_win': measure(lambda: calculate_glitch_grid_win(next(reel_cycle))),
+        'calculate_starlight_win': measure(lambda: calculate_starlight_win(next(line_cycle))),
+    }
+
+
+def run_database_benchmarks(size):
+    from backend.app import app, limiter
+    from backend.models import db, User
+    from backend.casino import spin_glitch_grid, spin_starlight_smuggler
+    from backend.transactions import create_transaction, get_user_transactions, search_transactions
+
+    limiter.enabled = False
+    ids = seed_ledger(size)
+    rng = random.Random(size)
+    results = {}
+
+    with app.test_request_context():
+        busy = db.session.get(User, ids[0])
+        player = db.session.get(User, ids[1])
+
+        results['get_user_transactions'] = measure(lambda: get_user_transactions(busy, limit=50))
+        results['search_transactions'] = measure(lambda: search_transactions(busy, 'Neon'))
+
+        for name, model in serializer_benchmarks():
+            instance = model.query.first()
+            instance.to_dict()  # Load relationships once, as a page of rows would
+            results[name] = measure(instance.to_dict)
+
+        players = [db.session.get(User, user_id) for user_id in ids[:200]]
+        results['create_transaction'] = measure(
+            lambda: create_transaction(*rng.sample(players, 2), 5.0, memo='Benchmark transfer')
+        )
+        results['spin_glitch_grid'] = measure(lambda: spin_glitch_grid(player, 1.0))
+        results['spin_starlight_smuggler'] = measure(lambda: spin_starlight_smuggler(player, 1.0))
+
+    return results
+
+
+def run_worker(database, sizes):
+    """Print {"<database>/<size>/<benchmark>": microseconds} as JSON"""
+    results = {f'{database}/-/{name}': seconds
+               for name, seconds in run_pure_benchmarks().items()}
+    for size in sizes:
+        print(f"   ... {database} with {size} transactions", file=sys.stderr)
+        for name, seconds in run_database_benchmarks(size).items():
+            results[f'{database}/{size}/{name}'] = seconds
+    print(json.dumps({key: round(seconds * 1e6, 2) for key, seconds in results.items()}))
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+def postgres_available(url):
+    try:
+        from sqlalchemy import create_engine, text
+        engine = create_engine(url)
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        engine.dispose()
+        return True
+    except Exception as e:
+        print(f"⚠️  Skipping PostgreSQL ({e.__class__.__name__}: {e})")
+        return False
+
+
+def run_database(database, url, sizes):
+    env = dict(os.environ, DATABASE_URL=url, JACKPOT_ENABLED='false')
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', database,
+         '--sizes', ','.join(map(str, sizes))],
+        env=env, stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(BENCH_DIR)
+    )
+    if process.returncode != 0:
+        print(f"❌ {database} benchmarks failed")
+        sys.exit(1)
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Print each benchmark against the baseline; returns the regressed keys"""
+    regressions = []
+    print(f"\n{'benchmark':<58}{'baseline us':>13}{'now us':>11}{'change':>9}")
+    for key in sorted(results):
+        now = results[key]
+        before = baseline.get(key)
+        if before is None:
+            print(f"{key:<58}{'-':>13}{now:>11.2f}{'new':>9}")
+            continue
+        change = (now - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  ❌ regression'
+            regressions.append(key)
+        elif change < -threshold:
+            flag = '  ✅ faster'
+        print(f"{key:<58}{before:>13.2f}{now:>11.2f}{change:>+9.0%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark casino and ledger hot paths')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma-separated ledger sizes (transactions) to benchmark')
+    parser.add_argument('--save', action='store_true', help=f'Write results to {BASELINE_PATH}')
+    parser.add_argument('--compare', action='store_true', help='Compare against the saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown fraction reported as a regression (default 0.25)')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    if args.worker:
+        run_worker(args.worker, sizes)
+        sys.exit(0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        print("⏱️  Benchmarking on SQLite...")
+        results.update(run_database('sqlite', f'sqlite:///{os.path.join(directory, "bench.db")}', sizes))
+
+    postgres_url = os.environ.get('BENCH_POSTGRES_URL')
+    if postgres_url and postgres_available(postgres_url):
+        print("⏱️  Benchmarking on PostgreSQL (its tables are dropped and recreated)...")
+        results.update(run_database('postgres', postgres_url, sizes))
+
+    if args.compare:
+        if not os.path.exists(BASELINE_PATH):
+            print(f"❌ No baseline at {BASELINE_PATH}; record one with --save")
+            sys.exit(1)
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+    else:
+        for key in sorted(results):
+            print(f"{key:<58}{results[key]:>11.2f} us")
+
+    if args.save:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({
+                'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'python': sys.version.split()[0],
+                'results': results
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"✅ Baseline written to {BASELINE_PATH}")
@@ -0,0 +1,65 @@
+"""
+Pytest configuration - isolated test database and per-request SQL query budgets
+
+Tests run against a throwaway SQLite file with rate limiting off; the
+client fixture recreates its tables for every test.
+
+    @pytest.mark.query_budget(6)
+    def test_history(self, client, auth_headers):
+        ...
+
+fails the test when any request it makes executes more than 6 statements,
+and lists the statements that request repeated. Only the test body is
+watched, so requests made by fixtures (registering, logging in) don't count.
+"""
+import sys
+import os
+import tempfile
+
+# The app binds to DATABASE_URL when it is imported, so the test
+# configuration has to be in place before test_suite imports it
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='neobank-test-'), 'test.db')
+os.environ['RATELIMIT_ENABLED'] = 'false'
+os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='neobank-test-metrics-')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from backend.sqlprofile import profiler
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'query_budget(n): fail if any request in the test executes more than n SQL statements'
+    )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker('query_budget')
+    if marker is None:
+        yield
+        return
+
+    budget = marker.args[0]
+    with profiler.watch() as requests:
+        yield
+
+    over_budget = [(label, profile) for label, profile in requests if profile.query_count > budget]
+    if over_budget:
+        lines = [f'query budget of {budget} exceeded:']
+        for label, profile in over_budget:
+            lines.append(f'  {label}: {profile.query_count} queries')
+            for sql, count in profile.repeated(threshold=2):
+                lines.append(f'    {count}x {sql[:160]}')
+        item.query_budget_failure = '\n'.join(lines)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    failure = getattr(item, 'query_budget_failure', None)
+    if failure and report.when == 'call' and report.passed:
+        report.outcome = 'failed'
+        report.longrepr = failure
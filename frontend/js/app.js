@@ -6,6 +6,12 @@ const { createApp } = Vue;
 
 const API_BASE = window.location.origin;
 
+// Live stream retries after a rejected stream (e.g. the server is at its
+// stream cap): exponential backoff with jitter, polling in the meantime
+const STREAM_RETRY_BASE_MS = 10000;
+const STREAM_RETRY_MAX_MS = 300000;
+const POLL_INTERVAL_MS = 30000;
+
 createApp({
     data() {
         return {
@@ -67,6 +73,8 @@ createApp({
             adjustReason: '',
             apiKeys: [],
             casinoGames: [],
+            leaderboards: null,
+            jackpot: null,
             factions: [],
             factionCreditsModal: null,
             factionCreditsAmount: 0,
@@ -74,6 +82,12 @@ createApp({
             newFactionName: '',
             newFactionDescription: '',
             
+            // Live account updates
+            eventSource: null,
+            streamRetryTimer: null,
+            streamFailures: 0,
+            pollTimer: null,
+            
             // Notifications
             toasts: []
         };
@@ -146,6 +160,8 @@ createApp({
         },
         
         logout() {
+            this.disconnectStream();
+            this.stopPolling();
             this.user = null;
             this.token = null;
             localStorage.removeItem('neobank_token');
@@ -154,7 +170,8 @@ createApp({
         
         async loadUserData() {
             try {
-                const response = await fetch(`${API_BASE}/api/v1/account`, {
+                // Account, recent transactions and admin panels in one round trip
+                const response = await fetch(`${API_BASE}/api/v1/bootstrap`, {
                     headers: { 'Authorization': `Bearer ${this.token}` }
                 });
                 
@@ -164,7 +181,15 @@ createApp({
                 
                 const data = await response.json();
                 this.user = data.account;
-                await this.loadTransactions();
+                this.transactions = data.transactions;
+                if (data.admin) {
+                    this.casinoGames = data.admin.casino_config;
+                    this.factions = data.admin.factions;
+                    this.apiKeys = data.admin.api_keys;
+                }
+                if (!this.eventSource) {
+                    this.connectStream();
+                }
                 
             } catch (err) {
                 this.logout();
@@ -174,6 +199,142 @@ createApp({
             }
         },
         
+        // ============ Live Updates ============
+        async connectStream() {
+            this.disconnectStream();
+            
+            // Streams are opened with a short-lived ticket, keeping the access
+            // token out of URLs (and so out of access logs)
+            let ticket;
+            try {
+                const response = await fetch(`${API_BASE}/api/v1/account/stream-ticket`, {
+                    method: 'POST',
+                    headers: { 'Authorization': `Bearer ${this.token}` }
+                });
+                if (!response.ok) throw new Error('No stream ticket');
+                ticket = (await response.json()).ticket;
+            } catch (error) {
+                this.streamRejected();
+                return;
+            }
+            if (!this.token) return;
+            this.disconnectStream();  // a concurrent call may have connected meanwhile
+            
+            const source = new EventSource(
+                `${API_BASE}/api/v1/account/stream?ticket=${encodeURIComponent(ticket)}`
+            );
+            
+            let opened = false;
+            source.onopen = () => {
+                opened = true;
+                this.streamFailures = 0;
+                this.stopPolling();
+            };
+            
+            // When the server ends a stream the browser retries with the same,
+            // now expired, ticket and gives up; reconnect with a fresh one. A
+            // stream that never opened was refused (503 at the stream cap):
+            // back off and poll instead of retrying every few seconds
+            source.onerror = () => {
+                if (source.readyState !== EventSource.CLOSED) return;
+                if (opened) {
+                    this.scheduleStreamReconnect(1000 + Math.random() * 2000);
+                } else {
+                    this.streamRejected();
+                }
+            };
+            
+            source.addEventListener('balance', (e) => {
+                const data = JSON.parse(e.data);
+                this.user.balance = data.balance;
+                this.user.free_spins = data.free_spins;
+            });
+            
+            source.addEventListener('transaction', (e) => {
+                const data = JSON.parse(e.data);
+                const tx = data.transaction;
+                this.user.balance = data.balance;
+                
+                if (!this.searchQuery.trim() && !this.transactions.some(t => t.id === tx.id)) {
+                    this.transactions = [tx, ...this.transactions].slice(0, 10);
+                }
+                if (tx.type === 'transfer' && tx.to_account === this.user.account_number) {
+                    this.showToast(`Received ¤${tx.amount} from ${tx.from_name}`, 'success');
+                }
+            });
+            
+            source.addEventListener('refresh', () => {
+                this.loadUserData();
+            });
+            
+            this.eventSource = source;
+        },
+        
+        disconnectStream() {
+            clearTimeout(this.streamRetryTimer);
+            if (this.eventSource) {
+                this.eventSource.close();
+                this.eventSource = null;
+            }
+        },
+        
+        scheduleStreamReconnect(delay) {
+            this.disconnectStream();
+            if (this.token) {
+                this.streamRetryTimer = setTimeout(() => this.connectStream(), delay);
+            }
+        },
+        
+        streamRejected() {
+            this.streamFailures += 1;
+            this.startPolling();
+            const backoff = Math.min(
+                STREAM_RETRY_MAX_MS,
+                STREAM_RETRY_BASE_MS * 2 ** (this.streamFailures - 1)
+            );
+            this.scheduleStreamReconnect(backoff / 2 + Math.random() * backoff / 2);
+        },
+        
+        isStreamOpen() {
+            return this.eventSource !== null && this.eventSource.readyState === EventSource.OPEN;
+        },
+        
+        startPolling() {
+            if (this.pollTimer || !this.token) return;
+            const poll = async () => {
+                await this.pollAccount();
+                if (this.pollTimer) {
+                    this.pollTimer = setTimeout(poll, POLL_INTERVAL_MS * (0.75 + Math.random() / 2));
+                }
+            };
+            this.pollTimer = setTimeout(poll, POLL_INTERVAL_MS * (0.75 + Math.random() / 2));
+        },
+        
+        stopPolling() {
+            clearTimeout(this.pollTimer);
+            this.pollTimer = null;
+        },
+        
+        async pollAccount() {
+            // Without a live stream, refresh the balance and history now and then;
+            // both endpoints answer 304 when nothing changed
+            try {
+                const response = await fetch(`${API_BASE}/api/v1/account`, {
+                    headers: { 'Authorization': `Bearer ${this.token}` },
+                    cache: 'no-cache'
+                });
+                if (!response.ok) return;
+                const data = await response.json();
+                this.user.balance = data.account.balance;
+                this.user.free_spins = data.account.free_spins;
+                if (!this.searchQuery.trim()) {
+                    await this.loadTransactions();
+                }
+            } catch (err) {
+                console.error('Failed to refresh account:', err);
+            }
+        },
+        
         // ============ Banking ============
         async loadTransactions(limit = 10) {
             try {
@@ -212,8 +373,10 @@ createApp({
                 // Reset form
                 this.transferForm = { to_account: '', amount: '', memo: '' };
                 
-                // Reload transactions
-                await this.loadTransactions();
+                // The live stream delivers the new transaction; without one, reload
+                if (!this.isStreamOpen()) {
+                    await this.loadTransactions();
+                }
                 
             } catch (err) {
                 this.showToast(err.message, 'error');
@@ -302,7 +465,10 @@ createApp({
                     this.lastResult = data;
                     this.user.balance = data.balance;
                     
-                    if (data.win_amount > 0) {
+                    if (data.jackpot_won > 0) {
+                        this.showToast(`JACKPOT! You won ¤${data.jackpot_won}!`, 'success');
+                        this.loadJackpot();
+                    } else if (data.win_amount > 0) {
                         this.showToast(`You won ¤${data.win_amount}!`, 'success');
                     }
                     
@@ -316,6 +482,36 @@ createApp({
             }
         },
         
+        async loadLeaderboards() {
+            try {
+                const response = await fetch(`${API_BASE}/api/v1/leaderboards`, {
+                    headers: { 'Authorization': `Bearer ${this.token}` }
+                });
+                
+                if (response.ok) {
+                    this.leaderboards = await response.json();
+                }
+                
+            } catch (err) {
+                console.error('Failed to load leaderboards:', err);
+            }
+        },
+        
+        async loadJackpot() {
+            try {
+                const response = await fetch(`${API_BASE}/api/v1/casino/jackpot`, {
+                    headers: { 'Authorization': `Bearer ${this.token}` }
+                });
+                
+                if (response.ok) {
+                    this.jackpot = await response.json();
+                }
+                
+            } catch (err) {
+                console.error('Failed to load jackpot:', err);
+            }
+        },
+        
         async spinStarlight() {
             if (this.spinning) return;
             
@@ -364,7 +560,10 @@ createApp({
                         this.showToast(`🎉 ${data.bonus_spins_awarded} FREE SPINS AWARDED!`, 'success');
                     }
                     
-                    if (data.win_amount > 0) {
+                    if (data.jackpot_won > 0) {
+                        this.showToast(`JACKPOT! You won ¤${data.jackpot_won}!`, 'success');
+                        this.loadJackpot();
+                    } else if (data.win_amount > 0) {
                         this.showToast(`You won ¤${data.win_amount}!`, 'success');
                     }
                     
@@ -718,7 +917,7 @@ createApp({
                     throw new Error(data.error || 'Failed to add credits');
                 }
                 
-                this.showToast(`Added ¤${this.factionCreditsAmount} to ${data.users_affected} users in ${this.factionCreditsModal}`, 'success');
+                this.showToast(`Added ¤${this.factionCreditsAmount} to ${data.affected_users} users in ${this.factionCreditsModal}`, 'success');
                 this.factionCreditsModal = null;
                 await this.loadFactions();
                 
@@ -830,6 +1029,10 @@ createApp({
     
     watch: {
         currentView(newView) {
+            if (newView === 'casino') {
+                this.loadLeaderboards();
+                this.loadJackpot();
+            }
             if (newView === 'admin' && this.user.is_admin) {
                 this.loadApiKeys();
                 this.loadCasinoGames();
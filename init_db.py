@@ -1,19 +1,35 @@
 """
 Database initialization script for NeoBank & Chrome Slots
 Run this script to set up the database with initial data
+
+Safe to run on every container start: once the database is initialized at
+the latest migration it returns after a single query, without loading
+Flask or the models. Otherwise it applies pending migrations and seeds,
+and concurrent pods wait for whichever one is initializing instead of
+racing it.
 """
 import sys
 import os
+import time
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from backend.app import app, init_database
+from backend.startup import database_is_current, create_startup_app, ensure_database
 
 if __name__ == '__main__':
-    print("🚀 Initializing NeoBank database...")
-    init_database()
-    print("✅ Database initialization complete!")
+    started = time.monotonic()
+    initialized = False
+    if not database_is_current():
+        app = create_startup_app()
+        with app.app_context():
+            initialized = ensure_database()
+
+    if not initialized:
+        print(f"✅ Database already initialized ({time.monotonic() - started:.2f}s)")
+        sys.exit(0)
+
+    print(f"✅ Database initialization complete! ({time.monotonic() - started:.2f}s)")
     print("\n📋 Default admin credentials:")
     print("   Username: admin")
     print("   Password: neotropolis2025")
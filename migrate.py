@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Database migration runner for NeoBank & Chrome Slots
+
+Applies the pending migrations in backend/migrations.py, in version order.
+Safe on a live database: indexes are built CONCURRENTLY on PostgreSQL and
+backfills run in small, throttled batches. Only one runner works at a time.
+init_db.py runs the pending migrations by itself on container start; use
+this to apply or inspect them by hand. A database that hasn't been
+initialized yet is left to init_db.py, which creates the current schema
+and marks every migration applied.
+
+    python migrate.py              # apply everything pending
+    python migrate.py --status     # list applied and pending migrations
+    python migrate.py --target 3   # apply up to and including version 3
+"""
+import argparse
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import inspect
+
+from backend.startup import create_startup_app
+from backend import migrations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending database migrations')
+    parser.add_argument('--status', action='store_true', help='List migrations without applying any')
+    parser.add_argument('--target', type=int, help='Highest version to apply')
+    parser.add_argument('--batch-size', type=int, default=migrations.BACKFILL_BATCH_SIZE,
+                        help='Rows updated per backfill transaction')
+    parser.add_argument('--pause', type=float, default=migrations.BACKFILL_PAUSE,
+                        help='Seconds to sleep between backfill batches')
+    args = parser.parse_args()
+
+    migrations.BACKFILL_BATCH_SIZE = args.batch_size
+    migrations.BACKFILL_PAUSE = args.pause
+
+    app = create_startup_app()
+    with app.app_context():
+        if not inspect(migrations.db.engine).has_table('users'):
+            print("✅ Database not initialized yet; init_db.py will create the current schema")
+            sys.exit(0)
+
+        if args.status:
+            applied = migrations.applied_versions()
+            for version, name, _ in migrations.MIGRATIONS:
+                mark = '✅' if version in applied else '⏳'
+                print(f"{mark} {version:03d} {name}")
+            sys.exit(0)
+
+        if not migrations.pending_migrations(args.target):
+            print("✅ Database is up to date")
+            sys.exit(0)
+
+        started = time.monotonic()
+        try:
+            done = migrations.run_migrations(
+                args.target,
+                progress=lambda version, name: print(f"🔧 {version:03d} {name}...")
+            )
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+
+        for version, name, seconds in done:
+            print(f"   {version:03d} done in {seconds:.1f}s")
+        print(f"✅ Applied {len(done)} migration(s) in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Check the plans of the critical queries against DATABASE_URL
+
+Explains transaction history, search, account and API key lookups, faction
+aggregation and the admin transaction log, and exits non-zero when one
+misses its index or fully scans a large table. Point it at a database
+filled by scripts/seed_dataset.py to see the PostgreSQL planner's choices.
+"""
+import argparse
+import os
+import sys
+
+# Make the backend package importable when run from a checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.app import app
+from backend.queryplan import check_query_plans
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the plans of the critical queries')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print every plan')
+    args = parser.parse_args()
+
+    with app.app_context():
+        results = check_query_plans()
+
+    failed = 0
+    for name, (plan, problems) in results.items():
+        if problems:
+            failed += 1
+            print(f"❌ {name}")
+            for problem in problems:
+                print(f"   {problem}")
+        else:
+            print(f"✅ {name}")
+        if args.verbose or problems:
+            for line in plan:
+                print(f"      {line}")
+
+    if failed:
+        print(f"\n❌ {failed} critical queries have regressed plans")
+        sys.exit(1)
@@ -6,8 +6,9 @@ echo "🚀 Starting NeoBank application..."
 # Wait for database to be ready
 python /app/scripts/wait-for-db.py
 
-# Initialize database if needed
-echo "📦 Initializing database..."
+# Migrate and initialize the database if needed (one query once it is at the
+# latest migration; pods take turns)
+echo "📦 Checking database..."
 python /app/init_db.py
 
 # Start the application
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Load generator simulating event-day traffic
+
+Drives the real API with a weighted mix of logins, transfers, history
+views, Glitch Grid and Starlight spins, external API payouts and admin
+searches, spread over thousands of synthetic characters, and reports
+throughput and latency percentiles per endpoint.
+
+By default requests go through app.test_client() in this process; with
+--url they go to a running server over HTTP. Either way the characters,
+a funded sponsor account and an API key are created directly in the
+database named by DATABASE_URL, so it must be the server's database.
+
+Each character logs in once and all players reuse its token; only the
+'login' operation logs in again. Every 4xx/5xx counts as an error. The
+load comes from a handful of addresses, so rate limits trip quickly:
+--no-rate-limit switches them off for in-process runs, and a server
+targeted with --url should be started with RATELIMIT_ENABLED=false.
+
+    python scripts/loadtest.py --characters 2000 --concurrency 32 --duration 60
+    python scripts/loadtest.py --url http://localhost:5000 --mix transfer=50,glitch=50
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# Make the backend package importable when run from a checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.app import app, init_database, limiter
+from backend.models import db, User, APIKey, AccountStats, generate_api_key
+from backend.auth import hash_password
+
+CHARACTER_PREFIX = 'loadtest-'
+SPONSOR_NAME = 'loadtest-sponsor'
+PASSWORD = 'loadtest-password'
+
+# Relative weight of each operation in the default mix
+DEFAULT_MIX = {
+    'login': 5,
+    'transfer': 20,
+    'history': 25,
+    'glitch': 20,
+    'starlight': 15,
+    'payout': 10,
+    'admin_search': 5,
+}
+
+PERCENTILES = (50, 90, 99)
+
+
+# ============================================================================
+# Transports
+# ============================================================================
+
+class InProcessClient:
+    """Flask test client; one per thread"""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, body=None):
+        response = self.client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    """Keep-alive HTTP connection to a running server; one per thread"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                            else http.client.HTTPConnection)
+        self.connection = connection_class(parts.netloc, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, headers=None, body=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 0, None
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+# ============================================================================
+# Setup
+# ============================================================================
+
+def ensure_characters(count, chunk_size=1000):
+    """
+    Create loadtest-00000 ... characters that don't exist yet.
+
+    All share one bcrypt hash so setup takes seconds, not minutes.
+    Returns [(character_name, account_number)].
+    """
+    users = User.__table__
+    existing = {name for (name,) in db.session.execute(
+        db.select(users.c.character_name).where(users.c.character_name.like(f'{CHARACTER_PREFIX}%'))
+    )}
+    password_hash = hash_password(PASSWORD)
+    wanted = [(f'{CHARACTER_PREFIX}{i:05d}', f'NC-LT{i // 10000:02d}-{i % 10000:04d}')
+              for i in range(count)]
+    missing = [(name, account) for name, account in wanted if name not in existing]
+
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        db.session.execute(users.insert(), [
+            {'character_name': name, 'password_hash': password_hash, 'account_number': account,
+             'balance': 1000.0, 'is_admin': False, 'free_spins': 0, 'version': 0}
+            for name, account in chunk
+        ])
+        ids = db.session.execute(
+            db.select(users.c.id).where(users.c.character_name.in_([name for name, _ in chunk]))
+        ).scalars().all()
+        db.session.execute(AccountStats.__table__.insert(), [
+            {'user_id': user_id, 'sent_count': 0, 'received_count': 0,
+             'total_sent': 0.0, 'total_received': 0.0}
+            for user_id in ids
+        ])
+        db.session.commit()
+        print(f"   ... {start + len(chunk)}/{len(missing)} characters created")
+
+    return wanted
+
+
+def ensure_sponsor_and_key():
+    """A deep-pocketed account for external payouts, and an API key to make them with"""
+    sponsor = User.query.filter_by(character_name=SPONSOR_NAME).first()
+    if not sponsor:
+        sponsor = User(character_name=SPONSOR_NAME, password_hash=hash_password(PASSWORD),
+                       account_number='NC-LTSP-0000', balance=1e12)
+        sponsor.stats = AccountStats(sent_count=0, received_count=0, total_sent=0.0, total_received=0.0)
+        db.session.add(sponsor)
+    else:
+        sponsor.balance = 1e12
+
+    key = APIKey.query.filter_by(description='loadtest', is_active=True).first()
+    if not key:
+        admin = User.query.filter_by(is_admin=True).first()
+        key = APIKey(key_value=generate_api_key(), description='loadtest',
+                     created_by_user_id=admin.id)
+        db.session.add(key)
+    db.session.commit()
+    return sponsor.account_number, key.key_value
+
+
+# ============================================================================
+# Workload
+# ============================================================================
+
+class Recorder:
+    """Latencies and status codes per operation, shared by all threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, operation, seconds, status):
+        with self._lock:
+            self.latencies[operation].append(seconds)
+            self.statuses[operation][status] += 1
+
+
+class TokenCache:
+    """Access tokens per character, shared by all threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def get(self, name):
+        with self._lock:
+            return self._tokens.get(name)
+
+    def set(self, name, token):
+        with self._lock:
+            self._tokens[name] = token
+
+
+class VirtualPlayer:
+    """One load thread: plays random characters through one client"""
+
+    def __init__(self, client, recorder, tokens, characters, sponsor_account, api_key,
+                 admin_password):
+        self.client = client
+        self.recorder = recorder
+        self.tokens = tokens
+        self.characters = characters
+        self.sponsor_account = sponsor_account
+        self.api_key = api_key
+        self.admin_password = admin_password
+
+    def call(self, operation, method, path, headers=None, body=None):
+        started = time.perf_counter()
+        status, data = self.client.request(method, path, headers=headers, body=body)
+        self.recorder.record(operation, time.perf_counter() - started, status)
+        return status, data
+
+    def login(self, name, password=PASSWORD):
+        status, data = self.call('login', 'POST', '/api/v1/auth/login',
+                                 body={'character_name': name, 'password': password})
+        if status == 200:
+            self.tokens.set(name, data['access_token'])
+        return self.tokens.get(name)
+
+    def auth(self, name, password=PASSWORD):
+        token = self.tokens.get(name) or self.login(name, password)
+        return {'Authorization': f'Bearer {token}'} if token else None
+
+    def run(self, operation):
+        name, account = random.choice(self.characters)
+
+        if operation == 'login':
+            self.login(name)
+            return
+
+        if operation == 'payout':
+            self.call('payout', 'POST', '/api/v1/external/transactions',
+                      headers={'X-API-Key': self.api_key},
+                      body={'from_account': self.sponsor_account, 'to_account': account,
+                            'amount': round(random.uniform(5, 50), 2), 'memo': 'Event payout'})
+            return
+
+        if operation == 'admin_search':
+            headers = self.auth('admin', self.admin_password)
+            if headers:
+                _, other = random.choice(self.characters)
+                self.call('admin_search', 'GET', f'/api/admin/users/search?q={other[-4:]}',
+                          headers=headers)
+            return
+
+        headers = self.auth(name)
+        if not headers:
+            return
+
+        if operation == 'transfer':
+            _, to_account = random.choice(self.characters)
+            if to_account != account:
+                self.call('transfer', 'POST', '/api/v1/transactions', headers=headers,
+                          body={'to_account': to_account, 'amount': round(random.uniform(1, 20), 2),
+                                'memo': 'Drinks at the Neon Bar'})
+        elif operation == 'history':
+            self.call('history', 'GET', '/api/v1/account/transactions?limit=10', headers=headers)
+        elif operation == 'glitch':
+            self.call('glitch', 'POST', '/api/v1/casino/glitch-grid/spin', headers=headers,
+                      body={'bet_amount': random.choice([1, 2, 5, 10])})
+        elif operation == 'starlight':
+            self.call('starlight', 'POST', '/api/v1/casino/starlight-smuggler/spin', headers=headers,
+                      body={'bet_amount': random.choice([1, 2])})
+
+
+def parse_mix(value):
+    """'transfer=50,glitch=50' -> {'transfer': 50, 'glitch': 50}"""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in value.split(','):
+        operation, weight = item.split('=')
+        if operation not in DEFAULT_MIX:
+            raise ValueError(f"Unknown operation '{operation}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[operation] = float(weight)
+    return mix
+
+
+def run_load(make_client, characters, sponsor_account, api_key, admin_password,
+             mix, concurrency, duration=None, total_requests=None):
+    """Run the mix from `concurrency` threads; returns (Recorder, elapsed seconds)"""
+    recorder = Recorder()
+    tokens = TokenCache()
+    operations, weights = zip(*mix.items())
+    deadline = time.monotonic() + duration if duration else None
+    remaining = [total_requests]
+    remaining_lock = threading.Lock()
+
+    def take_turn():
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        if total_requests is not None:
+            with remaining_lock:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+        return True
+
+    def worker():
+        player = VirtualPlayer(make_client(), recorder, tokens, characters, sponsor_account,
+                               api_key, admin_password)
+        while take_turn():
+            player.run(random.choices(operations, weights)[0])
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, name=f'load-{i}') for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.monotonic() - started
+
+
+# ============================================================================
+# Report
+# ============================================================================
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def build_report(recorder, elapsed):
+    """{operation: {requests, rps, errors, rate_limited, statuses, p50_ms, p90_ms, p99_ms, max_ms}}"""
+    report = {}
+    for operation, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        statuses = dict(recorder.statuses[operation])
+        entry = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 400),
+            'rate_limited': statuses.get(429, 0),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        }
+        for pct in PERCENTILES:
+            entry[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 1)
+        entry['max_ms'] = round(latencies[-1] * 1000, 1)
+        report[operation] = entry
+    return report
+
+
+def print_report(report, elapsed):
+    total = sum(entry['requests'] for entry in report.values())
+    print(f"\n📊 {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    print(f"{'operation':<14}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}{'errors':>8}  statuses")
+    for operation, entry in report.items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in entry['statuses'].items())
+        print(f"{operation:<14}{entry['requests']:>10}{entry['rps']:>9}{entry['p50_ms']:>9}"
+              f"{entry['p90_ms']:>9}{entry['p99_ms']:>9}{entry['max_ms']:>9}{entry['errors']:>8}  {statuses}")
+    if any(entry['rate_limited'] for entry in report.values()):
+        print("\n⚠️  Requests were rate limited (429); use --no-rate-limit, or start the "
+              "server with RATELIMIT_ENABLED=false for --url runs")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate event-day traffic against the API')
+    parser.add_argument('--url', help='Base URL of a running server (default: in-process test client)')
+    parser.add_argument('--characters', type=int, default=2000, help='Synthetic characters to play')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent virtual players')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--requests', type=int, help='Stop after this many operations instead')
+    parser.add_argument('--mix', help=f"Operation weights, e.g. transfer=50,glitch=50 "
+                                      f"(operations: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--admin-password', default=os.environ.get('ADMIN_PASSWORD', 'neotropolis2025'))
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help='Disable rate limiting in-process; for --url start the server '
+                             'with RATELIMIT_ENABLED=false')
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    init_database()
+    with app.app_context():
+        print(f"👥 Preparing {args.characters} characters...")
+        characters = ensure_characters(args.characters)
+        sponsor_account, api_key = ensure_sponsor_and_key()
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+        target = args.url
+        if args.no_rate_limit:
+            print("⚠️  --no-rate-limit has no effect on a remote server; "
+                  "start it with RATELIMIT_ENABLED=false instead")
+    else:
+        make_client = InProcessClient
+        target = 'in-process test client'
+        if args.no_rate_limit:
+            limiter.enabled = False
+
+    print(f"🚀 {args.concurrency} players against {target} "
+          f"for {f'{args.requests} requests' if args.requests else f'{args.duration:.0f}s'}...")
+    recorder, elapsed = run_load(
+        make_client, characters, sponsor_account, api_key, args.admin_password, mix,
+        args.concurrency,
+        duration=None if args.requests else args.duration,
+        total_requests=args.requests
+    )
+
+    report = build_report(recorder, elapsed)
+    print_report(report, elapsed)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'elapsed_seconds': round(elapsed, 2), 'concurrency': args.concurrency,
+                       'characters': args.characters, 'mix': mix, 'target': target,
+                       'operations': report}, f, indent=2)
+        print(f"\n✅ Report written to {args.json}")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Rebuild denormalized statistics from the transaction ledger
+
+Run after restoring a backup, or whenever the counters shown in the admin
+panel are suspected to have drifted from the ledger.
+"""
+import argparse
+import os
+import sys
+
+# Make the backend package importable when run from a checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.app import app
+from backend.transactions import rebuild_account_stats
+from backend.factions import rebuild_faction_aggregates
+from backend.analytics import backfill_player_stats
+
+
+def print_progress(done, total):
+    print(f"   ... users up to id {done}/{total}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild denormalized statistics from the ledger')
+    parser.add_argument('target', nargs='?', default='all',
+                        choices=['all', 'accounts', 'factions', 'players'],
+                        help='Which statistics to rebuild')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='Number of user ids to rebuild per database transaction')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.target in ('all', 'accounts'):
+            print("📊 Rebuilding account statistics...")
+            count = rebuild_account_stats(chunk_size=args.chunk_size, progress=print_progress)
+            print(f"✅ Rebuilt statistics for {count} accounts")
+
+        if args.target in ('all', 'factions'):
+            print("📊 Rebuilding faction aggregates...")
+            count = rebuild_faction_aggregates()
+            print(f"✅ Rebuilt aggregates for {count} factions")
+
+        if args.target in ('all', 'players'):
+            print("🎰 Backfilling player casino statistics...")
+            count = backfill_player_stats(chunk_size=args.chunk_size, progress=print_progress)
+            print(f"✅ Wrote {count} player/game statistics rows")
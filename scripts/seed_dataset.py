@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Synthetic large-dataset generator for capacity testing
+
+Fills the database named by DATABASE_URL with seed-NNNNNNN characters
+spread over factions and a ledger of transfers, casino bets and wins whose
+timestamps follow an evening-heavy daily cycle with busier event days.
+Player activity is skewed, so a few whales own much of the ledger, as on
+a real event floor.
+
+Rows are bulk-loaded in chunks: COPY on PostgreSQL, executemany on SQLite.
+Every character shares one precomputed bcrypt hash (password
+"seed-password"). Balances and derived counters are not replayed from the
+generated ledger; pass --rebuild-stats to recompute account, faction and
+player statistics afterwards.
+
+    python scripts/seed_dataset.py --users 200000 --transactions 50000000
+"""
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Make the backend package importable when run from a checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.app import app, init_database
+from backend.models import db, User, Faction, HOUSE_ACCOUNT
+from backend.auth import hash_password
+
+CHARACTER_PREFIX = 'seed-'
+PASSWORD = 'seed-password'
+
+FACTIONS = ['CorpSec', 'Runners', 'Syndicate', 'Technocrats']
+
+# Share of players without a faction
+UNAFFILIATED_SHARE = 0.2
+
+# Ledger mix by transaction type
+TRANSACTION_MIX = {
+    'transfer': 0.35,
+    'casino_bet': 0.45,
+    'casino_win': 0.20,
+}
+
+TRANSFER_MEMOS = [
+    'Drinks at the Neon Bar', 'Ship repairs', 'Data chip', 'Rent', 'Noodles',
+    'Cyberdeck parts', 'Lost bet', 'Ammo', None, None
+]
+GAMES = [('Glitch Grid', 0.6), ('Starlight Smuggler', 0.4)]
+
+# Relative traffic per hour of day (evening peak)
+HOURLY_WEIGHTS = [2, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 6, 7, 7, 7, 8, 9, 11, 14, 16, 16, 14, 9, 4]
+
+# Every EVENT_DAY_INTERVAL-th day is an event day with this much more traffic
+EVENT_DAY_INTERVAL = 7
+EVENT_DAY_FACTOR = 4
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+# ============================================================================
+# Bulk loading
+# ============================================================================
+
+def bulk_load(connection, table, columns, rows):
+    """COPY rows into table on PostgreSQL, executemany elsewhere"""
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+    else:
+        placeholders = ', '.join('?' for _ in columns)
+        connection.exec_driver_sql(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+        )
+
+
+def prepare_connection(connection):
+    if connection.dialect.name == 'sqlite':
+        # Throwaway data: trade durability for load speed
+        connection.exec_driver_sql('PRAGMA synchronous = OFF')
+        connection.exec_driver_sql('PRAGMA journal_mode = MEMORY')
+
+
+# ============================================================================
+# Generators
+# ============================================================================
+
+def seed_factions(connection):
+    """Create the standard factions if needed; returns {name: id}"""
+    factions = Faction.__table__
+    existing = dict(connection.execute(db.select(factions.c.name, factions.c.id)).all())
+    missing = [name for name in FACTIONS if name not in existing]
+    if missing:
+        connection.execute(factions.insert(), [
+            {'name': name, 'name_key': name.lower(), 'member_count': 0, 'total_balance': 0.0,
+             'created_at': datetime.utcnow()}
+            for name in missing
+        ])
+        existing = dict(connection.execute(db.select(factions.c.name, factions.c.id)).all())
+    return {name: existing[name] for name in FACTIONS}
+
+
+def seed_users(connection, count, faction_ids, chunk_size, rng):
+    """Insert count characters; returns their ids in creation order"""
+    password_hash = hash_password(PASSWORD)
+    created_at = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    factions = list(faction_ids.items())
+    columns = ('character_name', 'password_hash', 'account_number', 'faction', 'faction_id',
+               'balance', 'is_admin', 'free_spins', 'version', 'created_at')
+
+    for start in range(0, count, chunk_size):
+        rows = []
+        for i in range(start, min(start + chunk_size, count)):
+            if rng.random() < UNAFFILIATED_SHARE:
+                faction, faction_id = None, None
+            else:
+                faction, faction_id = rng.choice(factions)
+            rows.append((
+                f'{CHARACTER_PREFIX}{i:07d}', password_hash,
+                f'NC-S{i // 10000:03d}-{i % 10000:04d}', faction, faction_id,
+                round(rng.lognormvariate(7, 1.2), 2), False, 0, 0, created_at
+            ))
+        bulk_load(connection, 'users', columns, rows)
+        connection.commit()
+        print(f"   ... {start + len(rows)}/{count} characters")
+
+    ids = connection.execute(
+        db.select(User.__table__.c.id)
+        .where(User.__table__.c.character_name.like(f'{CHARACTER_PREFIX}%'))
+        .order_by(User.__table__.c.id)
+    ).scalars().all()
+
+    for start in range(0, len(ids), chunk_size):
+        bulk_load(connection, 'account_stats',
+                  ('user_id', 'sent_count', 'received_count', 'total_sent', 'total_received'),
+                  [(user_id, 0, 0, 0.0, 0.0) for user_id in ids[start:start + chunk_size]])
+        connection.commit()
+    return ids
+
+
+def hour_weight(hour):
+    """Relative traffic in the given hour since the (midnight) start of the period"""
+    day = hour // 24
+    factor = EVENT_DAY_FACTOR if day % EVENT_DAY_INTERVAL == EVENT_DAY_INTERVAL - 1 else 1
+    return factor * HOURLY_WEIGHTS[hour % 24]
+
+
+def traffic_hour(cumulative, share):
+    """
+    Hour (fractional, since the period start) by which `share` of the
+    period's traffic has happened; cumulative holds the running hour weights.
+    """
+    target = share * cumulative[-1]
+    hour = min(bisect.bisect_left(cumulative, target), len(cumulative) - 1)
+    before = cumulative[hour - 1] if hour else 0
+    return hour + (target - before) / hour_weight(hour)
+
+
+def chunk_timestamps(count, start, first_hour, last_hour, rng):
+    """
+    count sorted timestamps in [start + first_hour, start + last_hour).
+
+    Hours are counted from the start of the period, so the daily cycle and
+    event days fall on the same calendar hours and days whichever chunk
+    generates them. A partly covered hour is weighted by the covered part.
+    """
+    slots, weights = [], []
+    for hour in range(math.floor(first_hour), math.ceil(last_hour)):
+        low, high = max(first_hour, hour), min(last_hour, hour + 1)
+        if high > low:
+            slots.append((low, high))
+            weights.append(hour_weight(hour) * (high - low))
+    picks = rng.choices(slots, weights=weights, k=count)
+    stamps = sorted(
+        start + timedelta(hours=low + rng.random() * (high - low))
+        for low, high in picks
+    )
+    return [stamp.strftime(TIMESTAMP_FORMAT) for stamp in stamps]
+
+
+def seed_transactions(connection, count, user_ids, house_id, days, chunk_size, rng):
+    """Bulk-load count ledger rows in chunks, oldest chunk first"""
+    columns = ('from_account_id', 'to_account_id', 'amount', 'memo', 'timestamp', 'transaction_type')
+    types, type_weights = zip(*TRANSACTION_MIX.items())
+    games, game_weights = zip(*GAMES)
+    player_count = len(user_ids)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    cumulative = list(itertools.accumulate(hour_weight(hour) for hour in range(days * 24)))
+    loaded = 0
+    started = time.monotonic()
+
+    def player():
+        # Cubic skew: low indexes (the whales) play far more often
+        return user_ids[int(player_count * rng.random() ** 3)]
+
+    while loaded < count:
+        size = min(chunk_size, count - loaded)
+        # Each chunk covers the next slice of the period, sized by its share of
+        # the traffic, so ids follow time and busy hours get their rows
+        first_hour = traffic_hour(cumulative, loaded / count)
+        last_hour = traffic_hour(cumulative, (loaded + size) / count)
+        stamps = chunk_timestamps(size, start, first_hour, last_hour, rng)
+        kinds = rng.choices(types, weights=type_weights, k=size)
+        rows = []
+        for stamp, kind in zip(stamps, kinds):
+            if kind == 'transfer':
+                sender, receiver = player(), player()
+                if sender == receiver:
+                    receiver = user_ids[rng.randrange(player_count)]
+                rows.append((sender, receiver, round(rng.lognormvariate(3, 1.1), 2),
+                             rng.choice(TRANSFER_MEMOS), stamp, kind))
+            elif kind == 'casino_bet':
+                game = rng.choices(games, weights=game_weights)[0]
+                rows.append((player(), house_id, float(rng.choice((1, 2, 5, 10, 25, 50))),
+                             f'{game} bet', stamp, kind))
+            else:
+                game = rng.choices(games, weights=game_weights)[0]
+                multiplier = rng.choice((2, 2, 3, 5, 10, 25))
+                rows.append((house_id, player(), float(rng.choice((1, 2, 5, 10)) * multiplier),
+                             f'{game} win ({multiplier}x)', stamp, kind))
+        bulk_load(connection, 'transactions', columns, rows)
+        connection.commit()
+        loaded += size
+        rate = loaded / max(time.monotonic() - started, 1e-9)
+        print(f"   ... {loaded}/{count} transactions ({rate:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill the database with a large synthetic dataset')
+    parser.add_argument('--users', type=int, default=200000, help='Characters to create')
+    parser.add_argument('--transactions', type=int, default=1000000, help='Ledger rows to create')
+    parser.add_argument('--days', type=int, default=30, help='Days of history to spread them over')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows per bulk load and commit')
+    parser.add_argument('--seed', type=int, default=2077, help='Random seed, for repeatable datasets')
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help='Recompute account, faction and player statistics afterwards')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    init_database()
+
+    with app.app_context():
+        if User.query.filter(User.character_name.like(f'{CHARACTER_PREFIX}%')).first():
+            print("❌ Seed characters already exist; use a fresh database")
+            sys.exit(1)
+
+        house_id = User.query.filter_by(account_number=HOUSE_ACCOUNT).first().id
+        started = time.monotonic()
+
+        with db.engine.connect() as connection:
+            prepare_connection(connection)
+
+            print("🏴 Creating factions...")
+            faction_ids = seed_factions(connection)
+            connection.commit()
+
+            print(f"👥 Creating {args.users} characters...")
+            user_ids = seed_users(connection, args.users, faction_ids, args.chunk_size, rng)
+
+            print(f"💸 Creating {args.transactions} transactions over {args.days} days...")
+            seed_transactions(connection, args.transactions, user_ids, house_id,
+                              args.days, args.chunk_size, rng)
+
+            if connection.dialect.name == 'postgresql':
+                print("📈 Analyzing tables...")
+                connection.exec_driver_sql('ANALYZE users')
+                connection.exec_driver_sql('ANALYZE transactions')
+                connection.commit()
+
+        print(f"✅ Seeded in {time.monotonic() - started:.0f}s")
+
+        if args.rebuild_stats:
+            from backend.transactions import rebuild_account_stats
+            from backend.factions import rebuild_faction_aggregates
+            from backend.analytics import backfill_player_stats
+
+            print("📊 Rebuilding statistics...")
+            rebuild_account_stats(chunk_size=5000)
+            rebuild_faction_aggregates()
+            backfill_player_stats(chunk_size=5000)
+            print("✅ Statistics rebuilt")
+        else:
+            print("ℹ️  Account, faction and player statistics were not rebuilt "
+                  "(run scripts/rebuild-stats.py or pass --rebuild-stats)")
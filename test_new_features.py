@@ -100,7 +100,7 @@ def test_faction_features(token):
     )
     if response.status_code == 200:
         data = response.json()
-        print(f"✓ Credits added: {data['users_affected']} users received ¤100")
+        print(f"✓ Credits added: {data['affected_users']} users received ¤100")
     else:
         print(f"✗ Add credits failed: {response.text}")
 
@@ -2,25 +2,27 @@
 Test Suite for NeoBank & Chrome Slots
 Run with: pytest test_suite.py
 """
-import sys
-import os
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
-
 import pytest
-from app import app, db, init_database
-from models import User, Transaction, APIKey, generate_account_number
-from auth import hash_password, verify_password
-from transactions import create_transaction
+from backend.app import app, db, init_database
+from backend.models import User, Transaction, APIKey, generate_account_number
+from backend.auth import hash_password, verify_password
+from backend.transactions import create_transaction
 
 @pytest.fixture
 def client():
-    """Create test client"""
+    """Create test client on empty tables (see conftest.py for the test database)"""
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     
+    # Per-worker caches would otherwise outlive each test's database
+    from backend.txcache import recent_transactions_cache
+    recent_transactions_cache.clear()
+    from backend.search import user_search_index
+    user_search_index.reset()
+    
+    with app.app_context():
+        db.drop_all()
+    init_database()
     with app.test_client() as client:
-        with app.app_context():
-            init_database()
         yield client
 
 @pytest.fixture
@@ -45,6 +47,18 @@ def auth_headers(client):
     
     return {'Authorization': f'Bearer {token}'}
 
+@pytest.fixture
+def admin_headers(client):
+    """Login as the default admin and return headers"""
+    response = client.post('/api/v1/auth/login', json={
+        'character_name': 'admin',
+        'password': 'neotropolis2025'
+    })
+    assert response.status_code == 200
+    token = response.get_json()['access_token']
+    
+    return {'Authorization': f'Bearer {token}'}
+
 
 class TestAuthentication:
     def test_registration(self, client):
@@ -244,8 +258,1360 @@ class TestCasino:
         assert 'error' in data
 
 
+class TestAdminSearch:
+    def test_exact_and_prefix_ranked_first(self, client, admin_headers):
+        """Exact match first, then prefix, then word matches"""
+        for name in ['Neon', 'Neon Viper', 'Ghost Neon', 'Neonate']:
+            client.post('/api/v1/auth/register', json={
+                'character_name': name,
+                'password': 'password123'
+            })
+        
+        response = client.get('/api/admin/users/search?q=neon', headers=admin_headers)
+        assert response.status_code == 200
+        names = [u['character_name'] for u in response.get_json()['users']]
+        assert names[0] == 'Neon'
+        assert set(names[1:3]) == {'Neon Viper', 'Neonate'}
+        assert names[3] == 'Ghost Neon'
+    
+    def test_search_by_account_segment(self, client, admin_headers):
+        """Account numbers match on any segment"""
+        response = client.post('/api/v1/auth/register', json={
+            'character_name': 'Segment',
+            'password': 'password123'
+        })
+        account = response.get_json()['user']['account_number']
+        
+        response = client.get(f'/api/admin/users/search?q={account.split("-")[2]}',
+                              headers=admin_headers)
+        accounts = [u['account_number'] for u in response.get_json()['users']]
+        assert account in accounts
+    
+    def test_new_registrations_are_searchable(self, client, admin_headers):
+        """Users registered after the index was built are found"""
+        client.get('/api/admin/users/search?q=admin', headers=admin_headers)
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Latecomer',
+            'password': 'password123'
+        })
+        
+        from backend.search import user_search_index
+        user_search_index.refresh(force=True)
+        response = client.get('/api/admin/users/search?q=late', headers=admin_headers)
+        names = [u['character_name'] for u in response.get_json()['users']]
+        assert names == ['Latecomer']
+
+    def test_short_queries_match_inside_names(self, client, admin_headers):
+        """Short queries still fall back to substring matches"""
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Bob',
+            'password': 'password123'
+        })
+
+        from backend.search import user_search_index
+        user_search_index.refresh(force=True)
+        response = client.get('/api/admin/users/search?q=ob', headers=admin_headers)
+        names = [u['character_name'] for u in response.get_json()['users']]
+        assert 'Bob' in names
+
+    def test_renamed_users_are_reindexed(self, client, admin_headers):
+        """A rename replaces the user's prefixes in the index"""
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Oldhandle',
+            'password': 'password123'
+        })
+        client.get('/api/admin/users/search?q=old', headers=admin_headers)
+
+        from backend.search import user_search_index
+        with app.app_context():
+            User.query.filter_by(character_name='Oldhandle').first().character_name = 'Newhandle'
+            db.session.commit()
+            assert [user_id for _, user_id in user_search_index.lookup('old')] == []
+            assert len(user_search_index.lookup('newh')) == 1
+
+    def test_rolled_back_rename_is_not_indexed(self, client, admin_headers):
+        """The index only takes renames that commit"""
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Keephandle',
+            'password': 'password123'
+        })
+        from backend.search import user_search_index
+        with app.app_context():
+            user_search_index.refresh(force=True)
+            User.query.filter_by(character_name='Keephandle').first().character_name = 'Losthandle'
+            db.session.flush()
+            db.session.rollback()
+            assert len(user_search_index.lookup('keep')) == 1
+            assert user_search_index.lookup('lost') == []
+
+    def test_short_queries_skip_database_fallback(self, client, admin_headers):
+        """One- and two-character queries are answered from the index alone"""
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Bob',
+            'password': 'password123'
+        })
+        from sqlalchemy import event as sa_event
+        from backend.search import user_search_index
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():
+            user_search_index.refresh(force=True)
+            engine = db.engine
+        sa_event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/api/admin/users/search?q=ob', headers=admin_headers)
+        finally:
+            sa_event.remove(engine, 'before_cursor_execute', record)
+        assert 'Bob' in [u['character_name'] for u in response.get_json()['users']]
+        assert not any('LIKE' in s.upper() for s in statements)
+
+
+class TestAccountStats:
+    def test_counters_follow_transfers(self, client, auth_headers, admin_headers):
+        """User detail counters are maintained by create_transaction"""
+        response = client.post('/api/v1/auth/register', json={
+            'character_name': 'Payee',
+            'password': 'password123'
+        })
+        payee = response.get_json()['user']['account_number']
+        
+        for amount in (10.0, 15.0):
+            response = client.post('/api/v1/transactions', headers=auth_headers,
+                                   json={'to_account': payee, 'amount': amount})
+            assert response.status_code == 201
+        
+        response = client.get(f'/api/admin/users/{payee}', headers=admin_headers)
+        data = response.get_json()
+        assert data['total_received'] == 2
+        assert data['total_sent'] == 0
+        assert data['stats']['total_received'] == 25.0
+        assert data['stats']['last_activity'] is not None
+    
+    def test_rebuild_matches_ledger(self, client, auth_headers):
+        """Rebuilding from the ledger reproduces the live counters"""
+        response = client.post('/api/v1/auth/register', json={
+            'character_name': 'Rebuilt',
+            'password': 'password123'
+        })
+        payee = response.get_json()['user']['account_number']
+        client.post('/api/v1/transactions', headers=auth_headers,
+                    json={'to_account': payee, 'amount': 42.0})
+        
+        from backend.transactions import rebuild_account_stats
+        from backend.models import AccountStats
+        with app.app_context():
+            user = User.query.filter_by(account_number=payee).first()
+            live = user.stats.to_dict()
+            AccountStats.query.delete()
+            db.session.commit()
+            
+            rebuild_account_stats(chunk_size=2)
+            rebuilt = db.session.get(AccountStats, user.id).to_dict()
+            assert rebuilt == live
+
+
+class TestFactionPayouts:
+    def test_faction_credits_write_ledger_rows(self, client, auth_headers, admin_headers):
+        """Faction credits debit the system account and record transactions"""
+        with app.app_context():
+            system_before = User.query.filter_by(account_number='NC-SYST-EM00').first().balance
+        
+        response = client.post('/api/admin/factions/Runners/add-credits',
+                               headers=admin_headers,
+                               json={'amount': 50, 'reason': 'Heist payout'})
+        assert response.status_code == 200
+        assert response.get_json()['affected_users'] == 1
+        
+        with app.app_context():
+            player = User.query.filter_by(character_name='TestUser').first()
+            system = User.query.filter_by(account_number='NC-SYST-EM00').first()
+            assert player.balance == 1050.0
+            assert system.balance == system_before - 50.0
+            
+            credit = Transaction.query.filter_by(to_account_id=player.id).one()
+            assert credit.from_account_id == system.id
+            assert credit.transaction_type == 'admin_adjustment'
+            assert player.stats.received_count == 1
+    
+    def test_payroll_pays_individual_amounts(self, client, auth_headers, admin_headers):
+        """Payroll credits each member its own amount"""
+        response = client.get('/api/v1/account', headers=auth_headers)
+        account = response.get_json()['account']['account_number']
+        
+        response = client.post('/api/admin/factions/Runners/payroll',
+                               headers=admin_headers,
+                               json={'payouts': [{'account_number': account, 'amount': 75}]})
+        assert response.status_code == 200
+        assert response.get_json()['total_amount'] == 75.0
+        
+        response = client.get('/api/v1/account', headers=auth_headers)
+        assert response.get_json()['account']['balance'] == 1075.0
+    
+    def test_payroll_rejects_non_members(self, client, auth_headers, admin_headers):
+        """Payroll only pays members of the faction"""
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Suit',
+            'password': 'password123',
+            'faction': 'CorpSec'
+        })
+        response = client.get('/api/v1/account', headers=auth_headers)
+        account = response.get_json()['account']['account_number']
+        
+        response = client.post('/api/admin/factions/CorpSec/payroll',
+                               headers=admin_headers,
+                               json={'payouts': [{'account_number': account, 'amount': 75}]})
+        assert response.status_code == 400
+
+
+class TestFactions:
+    def test_registration_maintains_aggregates(self, client, auth_headers, admin_headers):
+        """Registering into a faction bumps its member count and balance"""
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Runner2',
+            'password': 'password123',
+            'faction': 'runners'
+        })
+        
+        response = client.get('/api/admin/factions/list', headers=admin_headers)
+        factions = {f['faction']: f for f in response.get_json()['factions']}
+        assert factions['Runners']['user_count'] == 2
+        assert factions['Runners']['total_balance'] == 2000.0
+    
+    def test_profile_change_and_transfers_move_aggregates(self, client, auth_headers, admin_headers):
+        """Faction totals follow profile changes and cross-faction transfers"""
+        response = client.post('/api/v1/auth/register', json={
+            'character_name': 'Suit',
+            'password': 'password123',
+            'faction': 'CorpSec'
+        })
+        suit = response.get_json()['user']['account_number']
+        
+        client.post('/api/v1/transactions', headers=auth_headers,
+                    json={'to_account': suit, 'amount': 100.0})
+        response = client.get('/api/admin/factions/list', headers=admin_headers)
+        factions = {f['faction']: f for f in response.get_json()['factions']}
+        assert factions['Runners']['total_balance'] == 900.0
+        assert factions['CorpSec']['total_balance'] == 1100.0
+        
+        client.put('/api/v1/account/profile', headers=auth_headers, json={'faction': 'CorpSec'})
+        response = client.get('/api/admin/factions/list', headers=admin_headers)
+        factions = {f['faction']: f for f in response.get_json()['factions']}
+        assert factions['Runners']['user_count'] == 0
+        assert factions['CorpSec']['user_count'] == 2
+        assert factions['CorpSec']['total_balance'] == 2000.0
+    
+    def test_create_faction_rejects_duplicates(self, client, admin_headers):
+        """Faction names are unique regardless of case"""
+        response = client.post('/api/admin/factions/create', headers=admin_headers,
+                               json={'name': 'Void Runners'})
+        assert response.status_code == 200
+        response = client.post('/api/admin/factions/create', headers=admin_headers,
+                               json={'name': 'void runners'})
+        assert response.status_code == 400
+
+
+class TestExports:
+    def test_users_export_filters_by_faction(self, client, auth_headers, admin_headers):
+        """User export streams CSV and honours the faction filter"""
+        response = client.get('/api/admin/users/export?faction=Runners', headers=admin_headers)
+        assert response.status_code == 200
+        assert response.is_streamed
+        lines = response.get_data(as_text=True).strip().splitlines()
+        assert lines[0].startswith('Character Name,Account Number')
+        assert len(lines) == 2
+        assert lines[1].startswith('TestUser,')
+    
+    def test_transactions_export_gzip(self, client, auth_headers, admin_headers):
+        """Transaction export can be gzipped"""
+        import gzip
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        
+        response = client.get('/api/admin/transactions/export?compress=gzip',
+                              headers=admin_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/gzip'
+        lines = gzip.decompress(response.get_data()).decode('utf-8').strip().splitlines()
+        assert lines[0].startswith('ID,Timestamp,Type')
+        assert any('casino_bet' in line for line in lines[1:])
+    
+    def test_export_rejects_bad_timestamp(self, client, admin_headers):
+        """Invalid time filters are a client error"""
+        response = client.get('/api/admin/audit-logs/export?since=yesterday',
+                              headers=admin_headers)
+        assert response.status_code == 400
+
+
+class TestCasinoStats:
+    def test_spins_roll_up_per_game(self, client, auth_headers, admin_headers):
+        """Spins appear in the hourly and daily rollups"""
+        from backend.analytics import casino_rollups
+        casino_rollups.drain()  # discard spins buffered by earlier tests
+        
+        for _ in range(3):
+            client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                        json={'bet_amount': 10.0})
+        
+        for period in ('hour', 'day'):
+            response = client.get(f'/api/admin/casino/stats?period={period}',
+                                  headers=admin_headers)
+            assert response.status_code == 200
+            data = response.get_json()
+            totals = data['totals']['glitch_grid']
+            assert totals['spins'] == 3
+            assert totals['wagered'] == 30.0
+            assert data['rows'][0]['unique_players'] == 1
+    
+    def test_failed_rollup_flush_keeps_spin(self, client, auth_headers, monkeypatch):
+        """A rollup error after settlement doesn't fail the spin"""
+        def broken(force=False):
+            raise RuntimeError('database went away')
+        monkeypatch.setattr('backend.casino.flush_rollups', broken)
+        
+        response = client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                               json={'bet_amount': 10.0})
+        assert response.status_code == 200
+        assert 'reels' in response.get_json()
+    
+    def test_player_lifetime_stats(self, client, auth_headers, admin_headers):
+        """Each spin updates the player's lifetime counters"""
+        for _ in range(2):
+            client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                        json={'bet_amount': 10.0})
+        
+        response = client.get('/api/v1/account/casino-stats', headers=auth_headers)
+        games = {g['game_name']: g for g in response.get_json()['games']}
+        assert games['glitch_grid']['spins'] == 2
+        assert games['glitch_grid']['total_wagered'] == 20.0
+        
+        account = client.get('/api/v1/account', headers=auth_headers).get_json()['account']
+        assert games['glitch_grid']['net'] == round(account['balance'] - 1000.0, 2)
+        
+        response = client.get(f"/api/admin/users/{account['account_number']}",
+                              headers=admin_headers)
+        assert response.get_json()['casino'][0]['spins'] == 2
+    
+    def test_losing_spin_settles_stats_with_bet(self, client, auth_headers, monkeypatch):
+        """A loss's lifetime stats commit with the bet, so a failure after it can't split them"""
+        import itertools
+        from backend.models import PlayerGameStats
+        losing = itertools.cycle(['💀', '01', '🔌'])
+        monkeypatch.setattr('backend.casino.random.choice', lambda symbols: next(losing))
+        
+        def crash(amount):
+            raise RuntimeError('worker died')
+        monkeypatch.setattr('backend.casino.contribute', crash)
+        
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        with app.app_context():
+            bets = Transaction.query.filter_by(transaction_type='casino_bet').count()
+            stats = PlayerGameStats.query.filter_by(game_name='glitch_grid').one()
+            assert bets == stats.spins == 1
+            assert stats.total_wagered == 10.0
+    
+    def test_backfill_matches_live_counters(self, client, auth_headers):
+        """Backfilling from the ledger reproduces the live counters"""
+        for _ in range(3):
+            client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                        json={'bet_amount': 10.0})
+        
+        from backend.analytics import backfill_player_stats
+        from backend.models import PlayerGameStats
+        with app.app_context():
+            live = [s.to_dict() for s in PlayerGameStats.query.all()]
+            PlayerGameStats.query.delete()
+            db.session.commit()
+            
+            backfill_player_stats(chunk_size=2)
+            rebuilt = [s.to_dict() for s in PlayerGameStats.query.all()]
+            for entry in live + rebuilt:
+                entry.pop('last_played')
+            assert rebuilt == live
+    
+    def test_invalid_period(self, client, admin_headers):
+        """Only hourly and daily rollups exist"""
+        response = client.get('/api/admin/casino/stats?period=week', headers=admin_headers)
+        assert response.status_code == 400
+
+
+class TestLeaderboards:
+    def _boards(self, client, headers):
+        from backend.leaderboards import leaderboards
+        leaderboards.sync(force=True)
+        response = client.get('/api/v1/leaderboards', headers=headers)
+        assert response.status_code == 200
+        return response.get_json()
+    
+    def test_transfers_update_richest(self, client, auth_headers):
+        """Settled transfers move characters on the richest board"""
+        from backend.leaderboards import leaderboards
+        leaderboards.reset()  # drop state cached from earlier tests
+        
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Fixer',
+            'password': 'password123'
+        })
+        with app.app_context():
+            fixer = User.query.filter_by(character_name='Fixer').first().account_number
+        
+        response = client.post('/api/v1/transactions', headers=auth_headers,
+                               json={'to_account': fixer, 'amount': 400})
+        assert response.status_code in (200, 201)
+        
+        richest = {e['name']: e['value'] for e in self._boards(client, auth_headers)['richest']}
+        assert richest['Fixer'] == 1400.0
+        assert richest['TestUser'] == 600.0
+        assert 'SYSTEM' not in richest and 'CASINO HOUSE' not in richest
+        assert all('key' not in e for e in self._boards(client, auth_headers)['richest'])
+    
+    def test_biggest_win_keeps_best_per_player(self, client, auth_headers):
+        """Only a player's best win stays on the board"""
+        from backend.leaderboards import leaderboards
+        leaderboards.reset()
+        self._boards(client, auth_headers)
+        
+        with app.app_context():
+            player = User.query.filter_by(character_name='TestUser').first()
+            leaderboards.record_win('glitch_grid', player.id, player.character_name, None, 500.0)
+            leaderboards.record_win('glitch_grid', player.id, player.character_name, None, 120.0)
+        
+        wins = self._boards(client, auth_headers)['biggest_wins']['glitch_grid']
+        assert [(e['name'], e['value']) for e in wins] == [('TestUser', 500.0)]
+    
+    def test_cached_responses(self, client, auth_headers):
+        """Responses carry a short cache lifetime and a version ETag"""
+        from backend.leaderboards import leaderboards
+        leaderboards.reset()
+        
+        response = client.get('/api/v1/leaderboards', headers=auth_headers)
+        assert 'max-age=' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+        
+        response = client.get('/api/v1/leaderboards',
+                              headers={**auth_headers, 'If-None-Match': etag})
+        assert response.status_code == 304
+
+
+class TestJackpot:
+    @pytest.fixture
+    def jackpot_on(self, monkeypatch):
+        from backend.jackpot import jackpot_pool
+        jackpot_pool.take()  # drop contributions left by earlier tests
+        monkeypatch.setitem(app.config, 'JACKPOT_ENABLED', True)
+        monkeypatch.setitem(app.config, 'JACKPOT_CONTRIBUTION_PERCENT', 10.0)
+        return app.config['JACKPOT_SEED']
+    
+    def test_contributions_flush_to_pot(self, client, auth_headers, jackpot_on):
+        """Paid spins fund the pot once the worker flushes"""
+        from backend.jackpot import flush_jackpot
+        from backend.models import Jackpot
+        for _ in range(3):
+            client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                        json={'bet_amount': 10.0})
+        
+        with app.app_context():
+            flush_jackpot(force=True)
+            assert Jackpot.query.one().amount == pytest.approx(jackpot_on + 3.0)
+        
+        response = client.get('/api/v1/casino/jackpot', headers=auth_headers)
+        assert response.get_json()['amount'] == pytest.approx(jackpot_on + 3.0)
+    
+    def test_failed_flush_keeps_spin_and_contribution(self, client, auth_headers, jackpot_on, monkeypatch):
+        """A jackpot flush error after settlement doesn't fail the spin or lose the contribution"""
+        import random
+        from backend.jackpot import jackpot_pool
+        from sqlalchemy.exc import OperationalError
+        class BrokenClock:
+            @staticmethod
+            def utcnow():  # fails inside flush_jackpot's UPDATE
+                raise OperationalError('UPDATE jackpots', {}, Exception('database is locked'))
+        monkeypatch.setattr(random, 'choice', lambda symbols: symbols[0])  # three skulls, no jackpot
+        monkeypatch.setattr(jackpot_pool, 'due', lambda: True)
+        monkeypatch.setattr('backend.jackpot.datetime', BrokenClock)
+        
+        response = client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                               json={'bet_amount': 10.0})
+        assert response.status_code == 200
+        monkeypatch.undo()
+        assert jackpot_pool.take() == pytest.approx(1.0)
+    
+    def test_jackpot_award_is_exact(self, client, auth_headers, jackpot_on, monkeypatch):
+        """Three wilds pay the flushed pot plus this worker's pending contributions"""
+        import random
+        from backend.models import Jackpot
+        monkeypatch.setattr(random, 'choice', lambda symbols: symbols[-1])  # always 🏢
+        
+        response = client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                               json={'bet_amount': 10.0})
+        data = response.get_json()
+        assert data['jackpot_won'] == pytest.approx(jackpot_on + 1.0)
+        assert data['win_amount'] == pytest.approx(10.0 * data['win_multiplier'] + jackpot_on + 1.0)
+        assert data['balance'] == pytest.approx(1000.0 - 10.0 + data['win_amount'])
+        
+        with app.app_context():
+            jackpot = Jackpot.query.one()
+            assert jackpot.amount == jackpot_on
+            assert jackpot.last_winner.character_name == 'TestUser'
+            win = Transaction.query.filter_by(transaction_type='casino_win').one()
+            assert 'JACKPOT' in win.memo
+    
+    def test_disabled_by_default(self, client, auth_headers):
+        """Without JACKPOT_ENABLED spins neither fund nor win the jackpot"""
+        from backend.jackpot import jackpot_pool
+        jackpot_pool.take()
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        assert jackpot_pool.pending() == 0.0
+        
+        response = client.get('/api/v1/casino/jackpot', headers=auth_headers)
+        assert response.get_json()['enabled'] is False
+
+
+class TestAccountStream:
+    def _next_event(self, chunks):
+        chunk = next(chunks)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+    
+    def _ticket(self, client, headers):
+        response = client.post('/api/v1/account/stream-ticket', headers=headers)
+        assert response.status_code == 200
+        return response.get_json()['ticket']
+    
+    def test_rejects_bad_ticket(self, client, auth_headers):
+        """The stream needs a stream ticket, not an access token"""
+        response = client.get('/api/v1/account/stream?ticket=not-a-ticket')
+        assert response.status_code == 401
+        token = auth_headers['Authorization'].split()[1]
+        response = client.get(f'/api/v1/account/stream?ticket={token}')
+        assert response.status_code == 401
+    
+    def test_ticket_is_not_an_access_token(self, client, auth_headers):
+        """Stream tickets can't be used as bearer tokens"""
+        ticket = self._ticket(client, auth_headers)
+        response = client.get('/api/v1/account', headers={'Authorization': f'Bearer {ticket}'})
+        assert response.status_code in (401, 422)
+    
+    def test_streams_per_worker_are_capped(self, client, auth_headers, monkeypatch):
+        """Streams beyond the per-worker cap are refused, leaving threads for API calls"""
+        from backend.events import account_notifier
+        monkeypatch.setitem(app.config, 'STREAMS_PER_WORKER', 1)
+        first = client.get(f'/api/v1/account/stream?ticket={self._ticket(client, auth_headers)}')
+        assert first.status_code == 200
+        
+        second = client.get(f'/api/v1/account/stream?ticket={self._ticket(client, auth_headers)}')
+        assert second.status_code == 503
+        assert second.headers['Retry-After']
+        
+        first.close()
+        assert account_notifier.stream_count() == 0
+    
+    def test_incoming_transfer_is_pushed(self, client, auth_headers):
+        """A transfer from another player reaches the open stream"""
+        from backend.events import account_notifier
+        ticket = self._ticket(client, auth_headers)
+        account = client.get('/api/v1/account', headers=auth_headers).get_json()['account']
+        
+        response = client.get(f'/api/v1/account/stream?ticket={ticket}')
+        assert response.mimetype == 'text/event-stream'
+        chunks = iter(response.response)
+        first = self._next_event(chunks)
+        assert 'event: balance' in first and '1000.0' in first
+        
+        client.post('/api/v1/auth/register', json={
+            'character_name': 'Sender',
+            'password': 'password123'
+        })
+        login = client.post('/api/v1/auth/login', json={
+            'character_name': 'Sender',
+            'password': 'password123'
+        })
+        sender_headers = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+        client.post('/api/v1/transactions', headers=sender_headers,
+                    json={'to_account': account['account_number'], 'amount': 25})
+        
+        pushed = self._next_event(chunks)
+        assert pushed.startswith('event: transaction')
+        assert '"balance": 1025.0' in pushed and '"from_name": "Sender"' in pushed
+        
+        response.close()
+        assert account_notifier.stream_count() == 0
+
+
+class TestBootstrap:
+    def test_player_bootstrap(self, client, auth_headers):
+        """Players get their account, transactions and game availability"""
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        
+        response = client.get('/api/v1/bootstrap', headers=auth_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['account']['character_name'] == 'TestUser'
+        assert data['transactions'][-1]['type'] == 'casino_bet'
+        assert {g['game_name'] for g in data['casino']['games']} == {'glitch_grid', 'starlight_smuggler'}
+        assert 'admin' not in data
+    
+    def test_admin_bootstrap_uses_few_queries(self, client, auth_headers, admin_headers):
+        """Admin panels are included and loaded with a fixed number of queries"""
+        from sqlalchemy import event
+        for _ in range(5):
+            client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                        json={'bet_amount': 10.0})
+        client.post('/api/admin/api-keys', headers=admin_headers, json={'description': 'Kiosk'})
+        
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        record = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/api/v1/bootstrap', headers=admin_headers)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        
+        admin = response.get_json()['admin']
+        assert admin['api_keys'][0]['created_by'] == 'admin'
+        assert {f['faction'] for f in admin['factions']} == {'Runners'}
+        assert len(statements) <= 6
+    
+    def test_page_limit_is_validated(self, client, auth_headers, monkeypatch):
+        """Non-numeric limits are rejected and large ones clamped"""
+        for path in ('/api/v1/bootstrap', '/api/v1/account/transactions'):
+            response = client.get(f'{path}?limit=lots', headers=auth_headers)
+            assert response.status_code == 400
+        
+        for _ in range(3):
+            client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                        json={'bet_amount': 1.0})
+        monkeypatch.setattr('backend.app.MAX_PAGE_LIMIT', 2)
+        for path in ('/api/v1/bootstrap', '/api/v1/account/transactions'):
+            response = client.get(f'{path}?limit=100000', headers=auth_headers)
+            assert len(response.get_json()['transactions']) == 2
+
+
+class TestConditionalGet:
+    def test_account_not_modified(self, client, auth_headers):
+        """An unchanged account answers 304 with no body"""
+        response = client.get('/api/v1/account', headers=auth_headers)
+        etag = response.headers['ETag']
+        
+        response = client.get('/api/v1/account', headers={**auth_headers, 'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+    
+    def test_changes_invalidate_etags(self, client, auth_headers):
+        """Spins and profile edits bump the account version"""
+        etags = set()
+        for action in ('initial', 'spin', 'profile'):
+            if action == 'spin':
+                client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                            json={'bet_amount': 10.0})
+            elif action == 'profile':
+                client.put('/api/v1/account/profile', headers=auth_headers,
+                           json={'profile_picture': '🦾'})
+            etags.add(client.get('/api/v1/account', headers=auth_headers).headers['ETag'])
+        assert len(etags) == 3
+    
+    def test_history_etag(self, client, auth_headers):
+        """History ETags depend on the page size and change with new transactions"""
+        first = client.get('/api/v1/account/transactions?limit=10', headers=auth_headers)
+        other = client.get('/api/v1/account/transactions?limit=5', headers=auth_headers)
+        assert first.headers['ETag'] != other.headers['ETag']
+        
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        response = client.get('/api/v1/account/transactions?limit=10',
+                              headers={**auth_headers, 'If-None-Match': first.headers['ETag']})
+        assert response.status_code == 200
+        # The bet is always there; a winning spin adds its payout as well
+        assert any(t['type'] == 'casino_bet' for t in response.get_json()['transactions'])
+    
+    def test_admin_ledger_etag(self, client, auth_headers, admin_headers):
+        """The admin ledger is versioned by its newest transaction"""
+        etag = client.get('/api/admin/transactions', headers=admin_headers).headers['ETag']
+        response = client.get('/api/admin/transactions',
+                              headers={**admin_headers, 'If-None-Match': etag})
+        assert response.status_code == 304
+        
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        response = client.get('/api/admin/transactions',
+                              headers={**admin_headers, 'If-None-Match': etag})
+        assert response.status_code == 200
+
+
+class TestRecentTransactionsCache:
+    def test_repeat_reads_hit_cache(self, client, auth_headers, admin_headers):
+        """The second read of an unchanged history is served from the cache"""
+        from backend.txcache import recent_transactions_cache
+        recent_transactions_cache.clear()
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        
+        before = recent_transactions_cache.stats()
+        first = client.get('/api/v1/account/transactions?limit=10', headers=auth_headers).get_json()
+        second = client.get('/api/v1/account/transactions?limit=5', headers=auth_headers).get_json()
+        after = recent_transactions_cache.stats()
+        
+        assert second['transactions'] == first['transactions'][:5]
+        assert after['misses'] - before['misses'] == 1
+        assert after['hits'] - before['hits'] == 1
+        
+        response = client.get('/api/admin/system/cache', headers=admin_headers)
+        assert response.get_json()['recent_transactions']['hits'] >= 1
+    
+    def test_writes_patch_cached_history(self, client, auth_headers):
+        """A new transaction is prepended to the cached page without a re-read"""
+        from backend.txcache import recent_transactions_cache
+        recent_transactions_cache.clear()
+        client.get('/api/v1/account/transactions', headers=auth_headers)
+        
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10.0})
+        patches = recent_transactions_cache.stats()['patches']
+        assert patches >= 1
+        
+        data = client.get('/api/v1/account/transactions', headers=auth_headers).get_json()
+        from backend.transactions import get_recent_transactions
+        with app.app_context():
+            player = User.query.filter_by(character_name='TestUser').first()
+            expected = [t.to_dict() for t in get_recent_transactions(player, limit=10)]
+        assert data['transactions'] == expected
+    
+    def test_stale_version_misses(self, client, auth_headers):
+        """An entry at an older account version is never served"""
+        from backend.txcache import RecentTransactionCache
+        cache = RecentTransactionCache(capacity=2, depth=5)
+        cache.put(1, 3, [{'id': 9}], complete=True)
+        assert cache.get(1, 3, 10) == [{'id': 9}]
+        assert cache.get(1, 4, 10) is None
+        
+        cache.patch(1, 2, 4, {'id': 10})  # entry is not one write behind
+        assert not cache.contains(1)
+        
+        for user_id in (2, 3, 4):
+            cache.put(user_id, 0, [], complete=True)
+        assert cache.stats()['evictions'] == 1
+
+
+class TestRateLimiting:
+    def test_counters_shared_between_workers(self, client):
+        """Hits counted by one worker are visible to another after a sync"""
+        from backend.ratelimit import SyncedCounterStorage
+        worker_a = SyncedCounterStorage(background_sync=False)
+        worker_b = SyncedCounterStorage(background_sync=False)
+        with app.app_context():
+            for _ in range(3):
+                worker_a.incr('transfers/user:1', 60)
+            assert worker_b.incr('transfers/user:1', 60) == 1  # not synced yet
+            
+            worker_a.sync()
+            worker_b.sync()
+            assert worker_b.get('transfers/user:1') == 4
+            worker_a.sync()
+            assert worker_a.get('transfers/user:1') == 4
+    
+    def test_expired_window_restarts(self, client):
+        """A new window starts from zero across workers"""
+        import time
+        from backend.ratelimit import SyncedCounterStorage
+        storage = SyncedCounterStorage(background_sync=False)
+        with app.app_context():
+            storage.incr('spins/user:1', 1)
+            storage.sync()
+            time.sleep(1.1)
+            assert storage.get('spins/user:1') == 0
+            assert storage.incr('spins/user:1', 60) == 1
+            storage.sync()
+            assert storage.get('spins/user:1') == 1
+    
+    def test_keys_by_account(self, client, auth_headers):
+        """Logged-in players get their own bucket; unknown API keys don't"""
+        from backend.ratelimit import rate_limit_key, remember_api_key
+        with app.test_request_context(headers=auth_headers):
+            assert rate_limit_key().startswith('user:')
+        with app.test_request_context(headers={'X-API-Key': 'made-up'}):
+            assert rate_limit_key().startswith('ip:')
+        remember_api_key('issued-key')
+        with app.test_request_context(headers={'X-API-Key': 'issued-key'}):
+            assert rate_limit_key().startswith('apikey:')
+    
+    def test_syncs_off_the_request_thread(self, client):
+        """Hits reach the shared table from the worker's sync thread"""
+        import time
+        from backend.ratelimit import SyncedCounterStorage
+        from backend.models import RateLimitCounter
+        storage = SyncedCounterStorage()
+        with app.app_context():
+            storage.incr('spins/user:2', 2)
+            assert RateLimitCounter.query.count() == 0  # nothing written inline
+            for _ in range(30):
+                db.session.rollback()
+                if RateLimitCounter.query.count():
+                    break
+                time.sleep(0.1)
+            assert db.session.get(RateLimitCounter, 'spins/user:2').count == 1
+        storage._syncer.join(timeout=5)  # exits once the window expires
+    
+    def test_credentials_keyed_by_address_and_name(self, client):
+        """Players sharing the venue's address each get their own login bucket"""
+        from backend.ratelimit import credential_limit_key
+        keys = set()
+        for name in ('Alice', 'alice ', 'Bob'):
+            with app.test_request_context(json={'character_name': name},
+                                          environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+                keys.add(credential_limit_key())
+        assert keys == {'ip:10.0.0.1:name:alice', 'ip:10.0.0.1:name:bob'}
+
+
+class TestAdmission:
+    def test_sheds_low_priority_under_load(self, client, auth_headers, monkeypatch):
+        """Spins get a fast 503 while transfers are still admitted"""
+        from backend.admission import admission
+        monkeypatch.setattr(admission, '_in_flight', 20)  # of 32
+        
+        response = client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                               json={'bet_amount': 10})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+        
+        response = client.post('/api/v1/transactions', headers=auth_headers,
+                               json={'to_account': 'NC-NONE-0000', 'amount': 1})
+        assert response.status_code != 503
+        assert admission.stats()['shed']['low'] >= 1
+    
+    def test_pool_wait_sheds_by_priority(self):
+        """A slow connection pool sheds low priority work first and defers rollups"""
+        from backend.admission import AdmissionController, CRITICAL, NORMAL, LOW
+        controller = AdmissionController(max_in_flight=32)
+        controller.pool_wait_started()
+        controller.pool_wait_finished(1.0)
+        assert controller.try_admit(LOW) is False
+        assert controller.try_admit(NORMAL) is True
+        assert controller.try_admit(CRITICAL) is True
+        assert controller.under_pressure()
+        
+        controller.release()
+        controller.release()
+        for _ in range(30):
+            controller.pool_wait_started()
+            controller.pool_wait_finished(0.0)
+        assert controller.try_admit(LOW) is True
+    
+    def test_only_exhausted_pool_checkouts_wait(self):
+        """Checkouts that find an idle connection don't count as waiters"""
+        import sqlite3
+        from backend.admission import AdmissionController, TimedQueuePool, LOW
+        pool = TimedQueuePool(lambda: sqlite3.connect(':memory:'), pool_size=1, max_overflow=1)
+        assert not pool.exhausted()
+        first = pool.connect()
+        assert not pool.exhausted()  # room for an overflow connection
+        second = pool.connect()
+        assert pool.exhausted()
+        second.close()
+        assert not pool.exhausted()
+        first.close()
+        
+        controller = AdmissionController(max_in_flight=32)
+        controller.pool_wait_started(queued=False)
+        assert controller.try_admit(LOW) is True
+        controller.pool_wait_finished(0.0, queued=False)
+        controller.pool_wait_started(queued=True)
+        assert controller.try_admit(LOW) is False
+    
+    def test_admission_stats(self, client, admin_headers):
+        """Admins can read this worker's shedding counters"""
+        response = client.get('/api/admin/system/admission', headers=admin_headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert set(data['shed']) == {'critical', 'normal', 'low'}
+        assert data['in_flight'] >= 1
+
+
+class TestMetrics:
+    @pytest.fixture
+    def metrics_on(self, tmp_path):
+        from backend.metrics import metrics
+        metrics.clear()
+        metrics.configure(True, str(tmp_path))
+        yield metrics
+        metrics.configure(False, str(tmp_path))
+    
+    def test_disabled_by_default(self, client):
+        """/metrics is off unless METRICS_ENABLED is set"""
+        assert client.get('/metrics').status_code == 404
+    
+    def test_exposes_hot_path_metrics(self, metrics_on, client, auth_headers):
+        """Spins, commits, bcrypt and route latency show up in the exposition"""
+        client.post('/api/v1/casino/glitch-grid/spin', headers=auth_headers,
+                    json={'bet_amount': 10})
+        client.get('/api/v1/account', headers=auth_headers)
+        
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        body = response.get_data(as_text=True)
+        assert 'neobank_spins_total{game="glitch_grid"} 1' in body
+        assert 'neobank_wagered_total{game="glitch_grid"} 10' in body
+        assert 'neobank_transaction_commit_seconds_count{type="casino_bet"}' in body
+        assert 'neobank_bcrypt_seconds_count{operation="hash"}' in body
+        assert 'neobank_http_request_duration_seconds_count{method="GET",route="/api/v1/account",status="200"} 1' in body
+        assert 'neobank_http_request_db_queries_count{route="/api/v1/account"} 1' in body
+        assert 'neobank_admission_requests_total{outcome="admitted",priority="low"}' in body
+    
+    def test_sums_worker_snapshots(self, metrics_on, tmp_path):
+        """Counters from other (even exited) workers are added to this worker's"""
+        import json
+        other = {'pid': 999999, 'counters': [['neobank_spins_total', [['game', 'glitch_grid']], 5]],
+                 'histograms': [], 'collected': [['neobank_admission_in_flight', [], 7]]}
+        (tmp_path / '999999.json').write_text(json.dumps(other))
+        metrics_on.inc('neobank_spins_total', game='glitch_grid')
+        
+        body = metrics_on.render()
+        assert 'neobank_spins_total{game="glitch_grid"} 6' in body
+        assert 'neobank_admission_in_flight 7' not in body  # dead worker's gauge
+    
+    def test_profiler_shares_query_hooks(self, metrics_on, client, auth_headers):
+        """Metrics and the SQL profiler time each statement with one pair of engine hooks"""
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        from backend.metrics import _on_query_start
+        from backend.sqlprofile import profiler
+        assert event.contains(Engine, 'before_cursor_execute', _on_query_start)
+        
+        with profiler.watch() as requests:
+            client.get('/api/v1/account', headers=auth_headers)
+        count = requests[0][1].query_count
+        assert count >= 1
+        body = metrics_on.render()
+        assert f'neobank_http_request_db_queries_sum{{route="/api/v1/account"}} {count}' in body
+
+
+class TestSQLProfiler:
+    def _fund_players(self, count):
+        """Players who each sent the admin account a payment"""
+        with app.app_context():
+            admin = User.query.filter_by(character_name='admin').first()
+            for i in range(count):
+                player = User(character_name=f'payer{i}', password_hash='x',
+                              account_number=generate_account_number(), balance=100.0)
+                db.session.add(player)
+                db.session.commit()
+                create_transaction(player, admin, 5.0, memo=f'dues {i}')
+    
+    def test_normalize_sql(self):
+        """Literals and IN lists don't split statements into separate groups"""
+        from backend.sqlprofile import normalize_sql
+        assert normalize_sql("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'x'") == \
+            normalize_sql("SELECT *  FROM users\nWHERE id IN (?) AND name = 'yy'")
+        assert normalize_sql('SELECT * FROM users WHERE id = 42') == 'SELECT * FROM users WHERE id = ?'
+    
+    def test_flags_repeated_statements(self):
+        """A statement run once per row is reported as N+1"""
+        from backend.sqlprofile import RequestProfile
+        profile = RequestProfile()
+        profile.record('SELECT 1 FROM accounts', 0.001)
+        for user_id in range(6):
+            profile.record(f'SELECT * FROM users WHERE users.id = {user_id}', 0.001)
+        assert profile.repeated() == [('SELECT * FROM users WHERE users.id = ?', 6)]
+        assert profile.header().startswith('queries=7;')
+        assert profile.header().endswith('n+1=1')
+    
+    def test_profile_header(self, client, auth_headers):
+        """Profiled responses carry the X-SQL-Profile summary"""
+        from backend.sqlprofile import profiler
+        with profiler.watch() as requests:
+            response = client.get('/api/v1/account', headers=auth_headers)
+        assert response.headers['X-SQL-Profile'].startswith('queries=')
+        assert requests[0][0] == 'GET /api/v1/account'
+        assert requests[0][1].query_count >= 1
+    
+    @pytest.mark.query_budget(6)
+    def test_admin_transaction_log_budget(self, client, admin_headers):
+        """The global log loads counterparties in one query, not per row"""
+        self._fund_players(8)
+        response = client.get('/api/admin/transactions', headers=admin_headers)
+        assert len(response.get_json()['transactions']) == 8
+    
+    @pytest.mark.query_budget(6)
+    def test_user_search_budget(self, client, admin_headers):
+        """Searching history doesn't load each counterparty separately"""
+        self._fund_players(8)
+        response = client.get('/api/v1/account/transactions/search?q=dues', headers=admin_headers)
+        assert len(response.get_json()['transactions']) == 8
+    
+    @pytest.mark.query_budget(5)
+    def test_admin_lists_budget(self, client, admin_headers):
+        """API keys and audit logs join their users"""
+        for i in range(6):
+            client.post('/api/admin/api-keys', headers=admin_headers, json={'name': f'kiosk {i}'})
+        assert client.get('/api/admin/api-keys', headers=admin_headers).status_code == 200
+        assert client.get('/api/admin/audit-logs', headers=admin_headers).status_code == 200
+
+
+class TestTracing:
+    @pytest.fixture
+    def traces(self, tmp_path):
+        from backend.tracing import tracer
+        path = tmp_path / 'traces.jsonl'
+        tracer.configure(True, export_to=str(path), sample_rate=1.0)
+        yield path
+        tracer.configure(False)
+    
+    def test_spin_spans_exported(self, client, auth_headers, traces):
+        """A spin's trace covers auth, game config, RNG, paylines, commits and serialization"""
+        import json
+        response = client.post('/api/v1/casino/starlight-smuggler/spin', headers=auth_headers,
+                               json={'bet_amount': 1})
+        assert response.status_code == 200
+        
+        records = [json.loads(line) for line in traces.read_text().splitlines()]
+        trace = next(r for r in records if r['trace_id'] == response.headers['X-Trace-Id'])
+        names = {s['name'] for s in trace['spans']}
+        assert {'request', 'jwt.decode', 'user.load', 'casino.config', 'casino.rng',
+                'casino.paylines', 'db.flush', 'db.commit', 'json.serialize'} <= names
+        root = trace['spans'][0]
+        assert root['attrs']['route'] == '/api/v1/casino/starlight-smuggler/spin'
+        assert all(s['parent_id'] for s in trace['spans'][1:])
+    
+    def test_sampling_by_route_and_latency(self):
+        """Route rates override the default; slow requests are always kept"""
+        from backend.tracing import Tracer
+        tracer = Tracer()
+        tracer.configure(True, sample_rate=1.0, route_rates='/health=0,/api/v1/casino/*=1',
+                         slow_ms=200)
+        assert tracer.should_export('/health', 0.01) is False
+        assert tracer.should_export('/health', 0.5) is True
+        assert tracer.should_export('/api/v1/casino/glitch-grid/spin', 0.01) is True
+
+
+class TestLiveProfiling:
+    def test_sample_stacks(self, client, admin_headers):
+        """Collapsed stacks include a busy thread's functions"""
+        import threading
+        import time
+        stop = threading.Event()
+        
+        def busy_loop():
+            while not stop.is_set():
+                sum(range(1000))
+        
+        worker = threading.Thread(target=busy_loop)
+        worker.start()
+        try:
+            response = client.get('/api/admin/system/profile?seconds=0.3&interval_ms=5',
+                                  headers=admin_headers)
+        finally:
+            stop.set()
+            worker.join()
+        
+        assert response.status_code == 200
+        assert int(response.headers['X-Profile-Samples']) > 0
+        body = response.get_data(as_text=True)
+        assert 'busy_loop (' in body
+        stack, count = body.splitlines()[0].rsplit(' ', 1)
+        assert int(count) >= 1
+    
+    def test_profile_limits(self, client, admin_headers):
+        """Profiles are bounded in length"""
+        response = client.get('/api/admin/system/profile?seconds=600', headers=admin_headers)
+        assert response.status_code == 400
+    
+    def test_heap_snapshots(self, client, admin_headers):
+        """First snapshot starts tracing, the next ones report allocations and growth"""
+        first = client.post('/api/admin/system/heap/snapshot', headers=admin_headers).get_json()
+        assert first['tracing'] is True
+        try:
+            second = client.post('/api/admin/system/heap/snapshot', headers=admin_headers).get_json()
+            retained = [bytearray(1024) for _ in range(200)]
+            third = client.post('/api/admin/system/heap/snapshot', headers=admin_headers).get_json()
+            assert second['growth'] is None
+            assert third['top'] and third['growth'] is not None
+            assert retained
+        finally:
+            response = client.delete('/api/admin/system/heap', headers=admin_headers)
+        assert response.get_json()['message'] == 'Allocation tracing stopped'
+
+
+class TestQueryPlans:
+    def _seed(self):
+        """A few players in a faction trading with each other"""
+        from backend.factions import set_user_faction
+        with app.app_context():
+            players = []
+            for i in range(4):
+                player = User(character_name=f'planner{i}', password_hash='x',
+                              account_number=generate_account_number(), balance=500.0)
+                db.session.add(player)
+                db.session.commit()
+                set_user_faction(player, 'Runners')
+                db.session.commit()
+                players.append(player)
+            for i in range(12):
+                create_transaction(players[i % 4], players[(i + 1) % 4], 5.0, memo=f'Rent {i}')
+    
+    @pytest.mark.parametrize('name', [
+        'transaction history', 'transaction search', 'account lookup',
+        'api key lookup', 'faction aggregation', 'admin transaction log'
+    ])
+    def test_critical_query_uses_index(self, client, name):
+        """Each critical query uses its index and never scans a large table"""
+        from backend.queryplan import check_query_plans
+        self._seed()
+        with app.app_context():
+            plan, problems = check_query_plans()[name]
+        assert plan
+        assert problems == [], '\n'.join(problems + plan)
+    
+    def test_detects_full_scan(self):
+        """Plain table scans are reported; an ordered walk of the expected index is not"""
+        from backend.queryplan import full_scans
+        assert full_scans(['SCAN transactions']) == ['transactions']
+        assert full_scans(['SCAN users_1 USING COVERING INDEX ix_users_account_number']) == ['users']
+        assert full_scans(['Seq Scan on api_keys  (cost=0.00..1.01 rows=1 width=8)']) == ['api_keys']
+        assert full_scans(['SCAN transactions USING INDEX ix_transactions_timestamp'],
+                          ['ix_transactions_timestamp']) == []
+        assert full_scans(['SCAN factions']) == []
+    
+    def test_search_matches_counterparty_account(self, client, auth_headers):
+        """Searching by account number finds transfers with that account only"""
+        with app.app_context():
+            sender = User.query.filter_by(character_name='TestUser').first()
+            first = User(character_name='Payee1', password_hash='x',
+                         account_number='NC-PLAN-0001', balance=0.0)
+            second = User(character_name='Payee2', password_hash='x',
+                          account_number='NC-PLAN-0002', balance=0.0)
+            db.session.add_all([first, second])
+            db.session.commit()
+            create_transaction(sender, first, 5.0, memo='Noodles')
+            create_transaction(sender, second, 5.0, memo='Ammo')
+        
+        response = client.get('/api/v1/account/transactions/search?q=PLAN-0002',
+                              headers=auth_headers)
+        transactions = response.get_json()['transactions']
+        assert [t['memo'] for t in transactions] == ['Ammo']
+
+
+class TestStartup:
+    def test_initialized_database_takes_one_query(self, client):
+        """Once the schema version is recorded, startup only reads it"""
+        from sqlalchemy import event
+        from backend.startup import ensure_database, current_schema_version, latest_schema_version
+        from backend.migrations import MIGRATIONS
+        
+        statements = []
+        with app.app_context():
+            assert current_schema_version() == latest_schema_version() == MIGRATIONS[-1][0]
+            engine = db.engine
+            record = lambda *args: statements.append(args[2])
+            event.listen(engine, 'before_cursor_execute', record)
+            try:
+                assert ensure_database() is False
+            finally:
+                event.remove(engine, 'before_cursor_execute', record)
+        assert len(statements) == 1
+    
+    def test_reinitializes_on_version_change(self, client):
+        """An older recorded version reruns the (idempotent) initialization"""
+        from backend.startup import ensure_database, current_schema_version, latest_schema_version
+        from backend.models import SchemaVersion
+        with app.app_context():
+            db.session.get(SchemaVersion, 1).version = latest_schema_version() - 1
+            db.session.commit()
+            assert ensure_database() is True
+            assert current_schema_version() == latest_schema_version()
+            assert User.query.filter_by(character_name='admin').count() == 1
+    
+    def test_migrates_before_seeding(self, client):
+        """A version mismatch applies the pending migrations, then seeds"""
+        from backend.startup import ensure_database, current_schema_version, latest_schema_version
+        from backend.migrations import pending_migrations
+        from backend.models import SchemaVersion, SchemaMigration
+        with app.app_context():
+            db.session.get(SchemaVersion, 1).version = latest_schema_version() - 1
+            SchemaMigration.query.filter_by(version=latest_schema_version()).delete()
+            db.session.commit()
+            
+            assert ensure_database() is True
+            assert pending_migrations() == []
+            assert current_schema_version() == latest_schema_version()
+    
+    def test_fast_path_without_flask(self, tmp_path):
+        """database_is_current() answers from schema_version on a bare engine"""
+        from sqlalchemy import create_engine, text
+        from backend.startup import database_is_current, latest_schema_version
+        
+        url = f"sqlite:///{tmp_path / 'fast.db'}"
+        assert database_is_current(url) is False
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text('CREATE TABLE schema_version (id INTEGER, version INTEGER)'))
+            connection.execute(text('INSERT INTO schema_version VALUES (1, :version)'),
+                               {'version': latest_schema_version() - 1})
+        assert database_is_current(url) is False
+        with engine.begin() as connection:
+            connection.execute(text('UPDATE schema_version SET version = :version'),
+                               {'version': latest_schema_version()})
+        engine.dispose()
+        assert database_is_current(url) is True
+        assert database_is_current('sqlite:///relative.db') is False
+    
+    def test_builtin_accounts_cannot_log_in(self, client):
+        """System and house accounts have no password to check"""
+        for name in ('SYSTEM', 'CASINO HOUSE'):
+            response = client.post('/api/v1/auth/login', json={
+                'character_name': name, 'password': 'system-no-login'
+            })
+            assert response.status_code == 401
+
+
+class TestMigrations:
+    def test_pending_migrations_run_in_order(self, client):
+        """Unapplied migrations run once, in version order, and are idempotent"""
+        from sqlalchemy import inspect, text
+        from backend.migrations import run_migrations, pending_migrations, MIGRATIONS
+        from backend.models import SchemaMigration
+        with app.app_context():
+            SchemaMigration.query.delete()
+            db.session.commit()
+            with db.engine.begin() as connection:
+                connection.execute(text('DROP INDEX ix_transactions_from_account_timestamp'))
+            
+            done = run_migrations()
+            assert [version for version, _, _ in done] == [version for version, _, _ in MIGRATIONS]
+            indexes = [index['name'] for index in inspect(db.engine).get_indexes('transactions')]
+            assert 'ix_transactions_from_account_timestamp' in indexes
+            assert pending_migrations() == []
+            assert run_migrations() == []
+    
+    def test_backfill_runs_in_batches(self, client):
+        """Backfills update one id range per batch and skip rows already done"""
+        from backend.migrations import backfill
+        with app.app_context():
+            for i in range(7):
+                db.session.add(User(character_name=f'legacy{i}', password_hash='x',
+                                    account_number=generate_account_number(), balance=10.0))
+            db.session.commit()
+            
+            batches = []
+            updated = backfill('users', 'balance = balance + 1', "character_name LIKE 'legacy%'",
+                               batch_size=3, pause=0, progress=lambda done, total: batches.append(done))
+            assert updated == 7
+            assert len(batches) > 1
+            assert {u.balance for u in User.query.filter(User.character_name.like('legacy%'))} == {11.0}
+    
+    def test_links_legacy_faction_names(self, client):
+        """The factions migration links free-text faction names to faction rows"""
+        from backend.factions import backfill_factions
+        from backend.models import Faction
+        with app.app_context():
+            for i in range(3):
+                db.session.add(User(character_name=f'old{i}', password_hash='x', faction='Chrome Syndicate',
+                                    account_number=generate_account_number(), balance=10.0))
+            db.session.commit()
+            
+            assert backfill_factions() == 3
+            faction = Faction.query.filter_by(name_key='chrome syndicate').first()
+            assert User.query.filter_by(faction_id=faction.id).count() == 3
+            assert backfill_factions() == 0
+    
+    def test_faction_backfill_before_version_column(self, client):
+        """The faction backfill works on databases that don't have users.version yet"""
+        from sqlalchemy import text
+        from backend.factions import backfill_factions
+        with app.app_context():
+            db.session.add(User(character_name='old', password_hash='x', faction='Chrome Syndicate',
+                                account_number=generate_account_number(), balance=10.0))
+            db.session.commit()
+            with db.engine.begin() as connection:
+                connection.execute(text('ALTER TABLE users DROP COLUMN version'))
+            
+            assert backfill_factions() == 1
+    
+    # Schema as deployed before the migrations existed (no faction_id, version,
+    # factions table or any later table)
+    BASELINE_SCHEMA = [
+        """CREATE TABLE users (
+            id INTEGER PRIMARY KEY, character_name VARCHAR(100) NOT NULL UNIQUE,
+            password_hash VARCHAR(255) NOT NULL, account_number VARCHAR(20) NOT NULL UNIQUE,
+            faction VARCHAR(50), balance FLOAT NOT NULL, is_admin BOOLEAN,
+            profile_picture VARCHAR(255), free_spins INTEGER NOT NULL, created_at DATETIME)""",
+        """CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, from_account_id INTEGER NOT NULL REFERENCES users(id),
+            to_account_id INTEGER NOT NULL REFERENCES users(id), amount FLOAT NOT NULL,
+            memo VARCHAR(140), timestamp DATETIME, transaction_type VARCHAR(20))""",
+        """CREATE TABLE api_keys (
+            id INTEGER PRIMARY KEY, key_value VARCHAR(100) NOT NULL UNIQUE,
+            description VARCHAR(200), created_by_user_id INTEGER NOT NULL REFERENCES users(id),
+            is_active BOOLEAN, created_at DATETIME, last_used DATETIME)""",
+        """CREATE TABLE audit_logs (
+            id INTEGER PRIMARY KEY, admin_user_id INTEGER NOT NULL REFERENCES users(id),
+            action VARCHAR(50) NOT NULL, target_user_id INTEGER REFERENCES users(id),
+            details TEXT, timestamp DATETIME)""",
+        """CREATE TABLE casino_config (
+            id INTEGER PRIMARY KEY, game_name VARCHAR(50) NOT NULL UNIQUE, is_enabled BOOLEAN,
+            payout_percentage FLOAT, updated_at DATETIME)""",
+    ]
+    
+    def test_upgrades_baseline_database(self, tmp_path, monkeypatch):
+        """A database from before the migrations is migrated, then seeded"""
+        from sqlalchemy import create_engine, text
+        from backend.startup import (
+            create_startup_app, ensure_database, current_schema_version, latest_schema_version
+        )
+        from backend.migrations import applied_versions, pending_migrations, MIGRATIONS
+        from backend.models import Faction, Jackpot, AccountStats, PlayerGameStats
+        
+        url = f"sqlite:///{tmp_path / 'baseline.db'}"
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            for statement in self.BASELINE_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text(
+                "INSERT INTO users (character_name, password_hash, account_number, faction, "
+                "balance, is_admin, free_spins) VALUES "
+                "('veteran0', 'x', 'NC-OLD0-0000', 'Chrome Syndicate', 100.0, 0, 0), "
+                "('veteran1', 'x', 'NC-OLD0-0001', 'Chrome Syndicate', 50.0, 0, 0), "
+                "('loner', 'x', 'NC-OLD0-0002', NULL, 10.0, 0, 0)"
+            ))
+            connection.execute(text(
+                "INSERT INTO transactions (from_account_id, to_account_id, amount, memo, "
+                "timestamp, transaction_type) VALUES "
+                "(1, 3, 20.0, 'Ammo', '2025-06-01 21:00:00', 'transfer'), "
+                "(1, 2, 5.0, 'Noodles', '2025-06-02 20:00:00', 'transfer'), "
+                "(2, 3, 10.0, 'Glitch Grid bet', '2025-06-03 22:00:00', 'casino_bet')"
+            ))
+        engine.dispose()
+        
+        monkeypatch.setenv('DATABASE_URL', url)
+        startup_app = create_startup_app()
+        with startup_app.app_context():
+            assert ensure_database() is True
+            assert applied_versions() == {version for version, _, _ in MIGRATIONS}
+            assert pending_migrations() == []
+            assert current_schema_version() == latest_schema_version()
+            
+            faction = Faction.query.filter_by(name_key='chrome syndicate').one()
+            assert (faction.member_count, faction.total_balance) == (2, 150.0)
+            veterans = User.query.filter(User.character_name.like('veteran%')).all()
+            assert {user.faction_id for user in veterans} == {faction.id}
+            assert {user.version for user in veterans} == {0}
+            stats = db.session.get(AccountStats, 1)
+            assert (stats.sent_count, stats.total_sent) == (2, 25.0)
+            assert db.session.get(AccountStats, 3).received_count == 2
+            played = PlayerGameStats.query.filter_by(user_id=2).one()
+            assert (played.spins, played.total_wagered) == (1, 10.0)
+            assert User.query.filter_by(character_name='admin').count() == 1
+            assert Jackpot.query.count() == 1
+            db.session.remove()
+
+
 class TestModels:
-    def test_account_number_generation(self):
+    def test_account_number_generation(self, client):
         """Test unique account number generation"""
         with app.app_context():
             account1 = generate_account_number()
@@ -254,7 +1620,7 @@ class TestModels:
             assert account1.startswith('NC-')
             assert account2.startswith('NC-')
             assert account1 != account2
-            assert len(account1) == 13  # NC-XXXX-XXXX
+            assert len(account1) == 12  # NC-XXXX-XXXX
     
     def test_password_hashing(self):
         """Test password hashing and verification"""